@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 from decouple import config
 
@@ -125,5 +127,107 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# OpenRouteService API Key
+# OpenRouteService API Key, and the server it is sent to (point this at
+# `manage.py run_fake_ors` to run offline)
 OPENROUTESERVICE_API_KEY = config('OPENROUTESERVICE_API_KEY', default='')
+OPENROUTESERVICE_BASE_URL = config('OPENROUTESERVICE_BASE_URL', default='https://api.openrouteservice.org')
+
+# Geocoding cache (in-process LRU in front of the GeocodeCacheEntry table)
+GEOCODE_CACHE_MEMORY_SIZE = config('GEOCODE_CACHE_MEMORY_SIZE', default=2048, cast=int)
+GEOCODE_CACHE_MEMORY_TTL = config('GEOCODE_CACHE_MEMORY_TTL', default=60 * 60, cast=int)
+GEOCODE_CACHE_DB_TTL = config('GEOCODE_CACHE_DB_TTL', default=30 * 24 * 60 * 60, cast=int)
+# Worker threads for concurrent geocoding of uncached locations
+GEOCODE_CONCURRENCY = config('GEOCODE_CONCURRENCY', default=8, cast=int)
+
+# Directions cache (compact in-process LRU, optional on-disk SQLite store)
+ROUTE_CACHE_COORD_PRECISION = config('ROUTE_CACHE_COORD_PRECISION', default=3, cast=int)
+ROUTE_CACHE_MEMORY_SIZE = config('ROUTE_CACHE_MEMORY_SIZE', default=1024, cast=int)
+ROUTE_CACHE_MEMORY_MAX_BYTES = config('ROUTE_CACHE_MEMORY_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+ROUTE_CACHE_TTL = config('ROUTE_CACHE_TTL', default=7 * 24 * 60 * 60, cast=int)
+ROUTE_CACHE_DISK_PATH = config('ROUTE_CACHE_DISK_PATH', default='')
+ROUTE_CACHE_DISK_MAX_ENTRIES = config('ROUTE_CACHE_DISK_MAX_ENTRIES', default=50000, cast=int)
+
+# In-memory station grid used for route-corridor lookups
+STATION_INDEX_CELL_DEGREES = config('STATION_INDEX_CELL_DEGREES', default=0.25, cast=float)
+STATION_INDEX_REFRESH_SECONDS = config('STATION_INDEX_REFRESH_SECONDS', default=30, cast=int)
+# Load the station snapshot and grid in the background as a server process
+# starts (skipped for migrate, test and other management commands)
+STATION_SNAPSHOT_WARM_ON_STARTUP = config('STATION_SNAPSHOT_WARM_ON_STARTUP', default=True, cast=bool)
+STATION_CORRIDOR_RADIUS_MILES = config('STATION_CORRIDOR_RADIUS_MILES', default=15.0, cast=float)
+# Candidates per grid cell the route crosses: only the cell's K cheapest
+# stations are scored first (0 scores every corridor station)
+STATION_CELL_TOP_K = config('STATION_CELL_TOP_K', default=3, cast=int)
+
+# OpenRouteService HTTP client (pooled keep-alive connections, jittered retries)
+ORS_CONNECT_TIMEOUT = config('ORS_CONNECT_TIMEOUT', default=5.0, cast=float)
+ORS_GEOCODE_TIMEOUT = config('ORS_GEOCODE_TIMEOUT', default=10.0, cast=float)
+ORS_DIRECTIONS_TIMEOUT = config('ORS_DIRECTIONS_TIMEOUT', default=30.0, cast=float)
+ORS_MAX_RETRIES = config('ORS_MAX_RETRIES', default=2, cast=int)
+ORS_RETRY_BACKOFF = config('ORS_RETRY_BACKOFF', default=0.5, cast=float)
+ORS_POOL_SIZE = config('ORS_POOL_SIZE', default=20, cast=int)
+
+# Outbound ORS rate limit: token buckets per endpoint (requests per minute,
+# 0 = unlimited) kept in a SQLite file, so every process on the host shares
+# the quota. Calls wait up to ORS_RATE_LIMIT_MAX_WAIT seconds for a token.
+ORS_GEOCODE_RATE_PER_MINUTE = config('ORS_GEOCODE_RATE_PER_MINUTE', default=100, cast=int)
+ORS_DIRECTIONS_RATE_PER_MINUTE = config('ORS_DIRECTIONS_RATE_PER_MINUTE', default=40, cast=int)
+ORS_RATE_LIMIT_BURST = config('ORS_RATE_LIMIT_BURST', default=10, cast=int)
+ORS_RATE_LIMIT_MAX_WAIT = config('ORS_RATE_LIMIT_MAX_WAIT', default=30.0, cast=float)
+ORS_RATE_LIMIT_PATH = config(
+    'ORS_RATE_LIMIT_PATH', default=os.path.join(tempfile.gettempdir(), 'fuel-route-ors-ratelimit.sqlite3')
+)
+
+# Circuit breaker per ORS endpoint: after ORS_BREAKER_FAILURE_THRESHOLD
+# failed (or slower than ORS_BREAKER_SLOW_SECONDS) calls in a row, calls
+# fail fast for ORS_BREAKER_RESET_SECONDS before one trial call is let through
+ORS_BREAKER_FAILURE_THRESHOLD = config('ORS_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)
+ORS_BREAKER_RESET_SECONDS = config('ORS_BREAKER_RESET_SECONDS', default=30.0, cast=float)
+ORS_BREAKER_SLOW_SECONDS = config('ORS_BREAKER_SLOW_SECONDS', default=10.0, cast=float)
+# While ORS is unavailable, routes are served from the expired cache or, failing
+# that, estimated as the straight-line distance times this factor at this speed
+DEGRADED_ROUTE_DISTANCE_FACTOR = config('DEGRADED_ROUTE_DISTANCE_FACTOR', default=1.2, cast=float)
+DEGRADED_ROUTE_SPEED_MPH = config('DEGRADED_ROUTE_SPEED_MPH', default=55.0, cast=float)
+
+# How calculated routes are stored: 'sync' (before responding), 'background'
+# (write-behind queue drained by one writer thread) or 'off'
+ROUTE_PERSISTENCE_MODE = config('ROUTE_PERSISTENCE_MODE', default='sync')
+ROUTE_PERSISTENCE_QUEUE_SIZE = config('ROUTE_PERSISTENCE_QUEUE_SIZE', default=1000, cast=int)
+ROUTE_PERSISTENCE_BATCH_SIZE = config('ROUTE_PERSISTENCE_BATCH_SIZE', default=50, cast=int)
+
+# Stored route lines are Douglas-Peucker simplified to these tolerances
+# before encoding: the full line (near lossless) and the listing version
+ROUTE_POLYLINE_TOLERANCE_METERS = config('ROUTE_POLYLINE_TOLERANCE_METERS', default=5.0, cast=float)
+ROUTE_POLYLINE_SIMPLIFIED_TOLERANCE_METERS = config('ROUTE_POLYLINE_SIMPLIFIED_TOLERANCE_METERS', default=500.0, cast=float)
+
+# Route history listing: default and largest page size
+ROUTE_HISTORY_PAGE_SIZE = config('ROUTE_HISTORY_PAGE_SIZE', default=20, cast=int)
+ROUTE_HISTORY_MAX_PAGE_SIZE = config('ROUTE_HISTORY_MAX_PAGE_SIZE', default=100, cast=int)
+
+# Batch route endpoint: largest accepted batch and concurrent ORS calls per batch
+ROUTE_BATCH_MAX_ITEMS = config('ROUTE_BATCH_MAX_ITEMS', default=500, cast=int)
+ROUTE_BATCH_CONCURRENCY = config('ROUTE_BATCH_CONCURRENCY', default=8, cast=int)
+
+# Popular origin/destination pairs answered from the PrecomputedCorridor
+# table, as 'start|end' pairs separated by ';'
+# (e.g. 'Dallas, TX|Houston, TX;New York, NY|Chicago, IL')
+POPULAR_ROUTE_PAIRS = config(
+    'POPULAR_ROUTE_PAIRS',
+    default='',
+    cast=lambda value: [
+        tuple(part.strip() for part in pair.split('|', 1)) for pair in value.split(';') if '|' in pair
+    ]
+)
+# Vehicle profiles ('mpg:tank range miles', comma separated) with a stored
+# plan per pair, and how old an entry may get before it is recomputed
+PRECOMPUTED_VEHICLE_PROFILES = config(
+    'PRECOMPUTED_VEHICLE_PROFILES',
+    default='10:500,7:600,6:300',
+    cast=lambda value: [
+        tuple(float(part) for part in profile.split(':', 1)) for profile in value.split(',') if ':' in profile
+    ]
+)
+PRECOMPUTED_CORRIDOR_MAX_AGE_SECONDS = config('PRECOMPUTED_CORRIDOR_MAX_AGE_SECONDS', default=24 * 60 * 60, cast=int)
+
+# Fleet planning: largest accepted fleet and solver processes (0 = one per CPU)
+FLEET_MAX_VEHICLES = config('FLEET_MAX_VEHICLES', default=5000, cast=int)
+FLEET_PLANNER_WORKERS = config('FLEET_PLANNER_WORKERS', default=0, cast=int)
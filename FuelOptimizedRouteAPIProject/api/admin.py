@@ -34,4 +34,32 @@ class FuelStopAdmin(admin.ModelAdmin):
         'cost_at_stop'
     ]
     list_filter = ['route']
-    search_fields = ['fuel_station__name', 'route__start_location']
\ No newline at end of file
+    search_fields = ['fuel_station__name', 'route__start_location']
+
+@admin.register(GeocodeCacheEntry)
+class GeocodeCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['query', 'display_name', 'latitude', 'longitude', 'expires_at']
+    search_fields = ['query', 'display_name']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(PriceImport)
+class PriceImportAdmin(admin.ModelAdmin):
+    list_display = ['imported_at', 'source', 'station_count', 'changed_count']
+    readonly_fields = ['imported_at']
+
+
+@admin.register(FuelPriceSnapshot)
+class FuelPriceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['station', 'retail_price', 'effective_at', 'price_import']
+    list_filter = ['price_import']
+    search_fields = ['station__name', 'station__city']
+    raw_id_fields = ['station', 'price_import']
+
+
+@admin.register(PrecomputedCorridor)
+class PrecomputedCorridorAdmin(admin.ModelAdmin):
+    list_display = ['start_location', 'end_location', 'stale', 'computed_at']
+    list_filter = ['stale']
+    search_fields = ['start_location', 'end_location']
+    exclude = ['route_payload']
@@ -1,6 +1,49 @@
+import logging
+import os
+import sys
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def is_serving():
+    """
+    True in a server process (WSGI/ASGI worker or the runserver child),
+    False for other management commands such as migrate or test
+    """
+    if os.path.basename(sys.argv[0]) not in ('manage.py', 'django-admin', 'django-admin.py'):
+        return True
+    if len(sys.argv) < 2 or sys.argv[1] != 'runserver':
+        return False
+    # The autoreloader's parent process only watches files
+    return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+
+
+def warm_station_index():
+    """Load the station snapshot and grid so the first request doesn't pay for it"""
+    from django.db import DatabaseError, connection
+
+    from .spatial import get_station_index
+
+    try:
+        index = get_station_index()
+        logger.info("Station index warmed with %d stations", len(index.snapshot))
+    except DatabaseError as e:
+        # Not migrated yet: the first request loads it instead
+        logger.warning("Could not warm the station index: %s", e)
+    finally:
+        connection.close()
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Off the startup path (Django discourages queries in ready());
+        # requests arriving meanwhile wait on the same snapshot lock
+        if settings.STATION_SNAPSHOT_WARM_ON_STARTUP and is_serving():
+            threading.Thread(target=warm_station_index, name='station-index-warmup', daemon=True).start()
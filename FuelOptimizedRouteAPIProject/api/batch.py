@@ -0,0 +1,172 @@
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connections
+
+from .cache import route_cache_key
+from .spatial import get_station_index
+
+# One batch item to plan: endpoints plus find_optimal_fuel_stops() keyword
+# arguments, and optionally the waypoints in between
+BatchItem = namedtuple(
+    'BatchItem', ['start_location', 'end_location', 'options', 'waypoints'], defaults=((),)
+)
+# Outcome of one item: route_data and fuel_stops, or the exception that stopped it
+BatchResult = namedtuple('BatchResult', ['route_data', 'fuel_stops', 'error'])
+
+
+class RouteBatch:
+    """
+    Plan many routes in one pass.
+
+    Work is deduplicated across the batch: every distinct location is
+    geocoded once and every distinct sequence of points (at route cache key
+    precision) is routed once. ORS calls and planning run on a bounded
+    thread pool, all items are planned against the same station snapshot,
+    and a failing item only fails itself. Items are planned as soon as
+    their route arrives, so iter_results() can hand out early finishers
+    while the rest of the batch is still waiting on ORS.
+    """
+
+    def __init__(self, route_service, concurrency=None):
+        self.route_service = route_service
+        self.concurrency = concurrency or settings.ROUTE_BATCH_CONCURRENCY
+        self.unique_locations = 0
+        self.unique_routes = 0
+
+    def run(self, items):
+        """Returns a BatchResult per BatchItem, in order"""
+        results = [None] * len(items)
+        for position, result in self.iter_results(items):
+            results[position] = result
+        return results
+
+    def iter_results(self, items):
+        """
+        Yield (position, BatchResult) for every item as soon as it is done,
+        in completion order
+        """
+        station_index = get_station_index()
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='route-batch')
+        try:
+            routing, positions_by_key, failed = self._start_routes(pool, items)
+            for position, error in failed.items():
+                yield position, BatchResult(None, None, error)
+            pending = {future: (None, key) for future, key in routing.items()}
+
+            # Step 3: plan each item as soon as its route arrives, against
+            # one station index for the whole batch
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    position, payload = pending.pop(future)
+                    result = future.result()
+
+                    if position is not None:
+                        # A planned item; payload is its route data
+                        if isinstance(result, Exception):
+                            yield position, BatchResult(payload, None, result)
+                        else:
+                            yield position, BatchResult(payload, result, None)
+                        continue
+
+                    # A routed sequence of points; payload is its key
+                    for item_position in positions_by_key[payload]:
+                        if isinstance(result, Exception):
+                            yield item_position, BatchResult(None, None, result)
+                            continue
+                        plan = pool.submit(
+                            self._call,
+                            self.route_service.find_optimal_fuel_stops,
+                            result,
+                            station_index=station_index,
+                            **items[item_position].options
+                        )
+                        pending[plan] = (item_position, result)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def route_all(self, items):
+        """
+        Geocode and route every item without planning fuel stops.
+
+        Returns a (key, route_data) pair per item, in order; items sharing
+        a key share the same route_data. A failed item has key None when
+        geocoding failed, and its exception in place of the route data.
+        """
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='route-batch')
+        try:
+            routing, positions_by_key, failed = self._start_routes(pool, items)
+            results = {position: (None, error) for position, error in failed.items()}
+            for future, key in routing.items():
+                route = future.result()
+                for position in positions_by_key[key]:
+                    results[position] = (key, route)
+            return [results[position] for position in range(len(items))]
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _start_routes(self, pool, items):
+        """
+        Geocode each distinct location and submit one directions call per
+        distinct sequence of points.
+
+        Returns ({future: key}, {key: [positions]}, {position: geocoding error})
+        """
+        # Step 1: geocode each distinct location string once
+        names = {
+            location
+            for item in items
+            for location in (item.start_location, *item.waypoints, item.end_location)
+            if isinstance(location, str)
+        }
+        geocoded = self._settle(pool, self.route_service.geocode_location, names)
+        self.unique_locations = len(names)
+
+        # Step 2: one directions call per distinct sequence of points
+        failed = {}
+        positions_by_key = {}
+        routes = {}
+        for position, item in enumerate(items):
+            points = self._points(item, geocoded)
+            if isinstance(points, Exception):
+                failed[position] = points
+                continue
+            start, *stops, end = points
+            key = route_cache_key(start, end, waypoints=stops)
+            routes.setdefault(key, (start, end, stops))
+            positions_by_key.setdefault(key, []).append(position)
+        self.unique_routes = len(routes)
+
+        routing = {
+            pool.submit(self._call, self.route_service.calculate_route, *route): key
+            for key, route in routes.items()
+        }
+        return routing, positions_by_key, failed
+
+    def _points(self, item, geocoded):
+        """(start, *waypoints, end) geocode dicts for an item, or the geocoding error"""
+        points = []
+        for location in (item.start_location, *item.waypoints, item.end_location):
+            result = geocoded[location] if isinstance(location, str) else location
+            if isinstance(result, Exception):
+                return result
+            points.append(result)
+        return tuple(points)
+
+    def _settle(self, pool, func, keys):
+        """Run func(key) for every key on the pool; {key: result or exception}"""
+        futures = {key: pool.submit(self._call, func, key) for key in keys}
+        return {key: future.result() for key, future in futures.items()}
+
+    @staticmethod
+    def _call(func, *args, **kwargs):
+        """func(*args, **kwargs), returning rather than raising its exception"""
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            return e
+        finally:
+            # Pool threads hold their own DB connections (cache tiers)
+            connections.close_all()
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """
+    The breaker for an upstream endpoint is open, so the call was not
+    made. Raised as a requests exception so callers handle it like any
+    other ORS failure.
+    """
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker for one upstream endpoint.
+
+    Closed: calls go through. Errors, and calls slower than slow_seconds,
+    count as failures; failure_threshold of them in a row open the breaker.
+    Open: calls fail at once with CircuitOpenError for reset_seconds.
+    Half-open: one trial call goes through; success closes the breaker and
+    failure opens it again. A trial that never reports back is replaced
+    after another reset_seconds.
+    """
+
+    def __init__(self, name, failure_threshold=None, reset_seconds=None, slow_seconds=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.ORS_BREAKER_FAILURE_THRESHOLD
+        self.reset_seconds = settings.ORS_BREAKER_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.slow_seconds = settings.ORS_BREAKER_SLOW_SECONDS if slow_seconds is None else slow_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return OPEN
+        return HALF_OPEN
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go upstream now"""
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return
+            now = time.monotonic()
+            if state == HALF_OPEN and (self._trial_started is None or now - self._trial_started > self.reset_seconds):
+                self._trial_started = now
+                return
+            retry_in = max(0.0, self.reset_seconds - (now - self.opened_at))
+        raise CircuitOpenError(f"ORS {self.name} unavailable (circuit open, retry in {retry_in:.0f}s)")
+
+    def record_success(self, elapsed=0.0):
+        if self.slow_seconds and elapsed > self.slow_seconds:
+            self.record_failure()
+            return
+        self.reset()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_started is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_started = None
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_started = None
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    """Process-wide CircuitBreaker per upstream endpoint name"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
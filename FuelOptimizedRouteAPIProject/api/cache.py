@@ -0,0 +1,486 @@
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional per-entry TTL.
+
+    When max_bytes is set, bytes/str values also count towards a total
+    size budget and the least recently used entries are evicted to stay
+    under it.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, (bytes, str)):
+            return len(value)
+        return 0
+
+    def _pop(self, key):
+        value, _ = self._data.pop(key)
+        self.total_bytes -= self._sizeof(value)
+
+    def get(self, key, allow_stale=False):
+        """
+        Value for key, or None. Expired entries read as missing unless
+        allow_stale, which returns them as well (without refreshing them).
+        They stay in the cache, for get_stale, until they are evicted as
+        least recently used or set() replaces them.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                if allow_stale:
+                    return value
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = None
+        if self.ttl_seconds:
+            expires_at = time.monotonic() + self.ttl_seconds
+
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, expires_at)
+            self.total_bytes += self._sizeof(value)
+
+            while len(self._data) > self.max_entries or (
+                self.max_bytes and self.total_bytes > self.max_bytes and len(self._data) > 1
+            ):
+                self._pop(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+def normalize_location(location):
+    """
+    Normalize free-form location text into a cache key
+
+    "  Dallas ,TX " and "dallas, tx" both become "dallas, tx"
+    """
+    text = re.sub(r'\s+', ' ', str(location)).strip().lower()
+    text = re.sub(r'\s*,\s*', ', ', text)
+    return text.strip(' ,.')
+
+
+class GeocodeCache:
+    """
+    Two-tier geocoding cache: in-process LRU in front of the
+    GeocodeCacheEntry table, so results survive restarts and are
+    shared between worker processes.
+
+    Values are the dicts returned by RouteService.geocode_location
+    ({'lat', 'lon', 'display_name', 'properties'}).
+    """
+
+    def __init__(self, memory_size=None, memory_ttl=None, db_ttl=None):
+        if memory_size is None:
+            memory_size = settings.GEOCODE_CACHE_MEMORY_SIZE
+        if memory_ttl is None:
+            memory_ttl = settings.GEOCODE_CACHE_MEMORY_TTL
+        if db_ttl is None:
+            db_ttl = settings.GEOCODE_CACHE_DB_TTL
+
+        self.memory = LRUCache(max_entries=memory_size, ttl_seconds=memory_ttl)
+        self.db_ttl = db_ttl
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, location):
+        """Return the cached geocode for a location, or None"""
+        # Imported here so the module can be used before apps are loaded
+        from .models import GeocodeCacheEntry
+
+        key = normalize_location(location)
+
+        result = self.memory.get(key)
+        if result is not None:
+            self._count('memory_hits')
+            return result
+
+        entry = GeocodeCacheEntry.objects.filter(
+            query_key=key,
+            expires_at__gt=timezone.now()
+        ).first()
+
+        if entry is None:
+            self._count('misses')
+            return None
+
+        result = entry.to_result()
+        self.memory.set(key, result)
+        self._count('db_hits')
+        return result
+
+    def set(self, location, result):
+        """Store a geocode result in both tiers"""
+        from .models import GeocodeCacheEntry
+
+        key = normalize_location(location)
+        self.memory.set(key, result)
+
+        GeocodeCacheEntry.objects.update_or_create(
+            query_key=key,
+            defaults={
+                'query': str(location)[:255],
+                'latitude': result['lat'],
+                'longitude': result['lon'],
+                'display_name': result['display_name'][:255],
+                'properties': result.get('properties', {}),
+                'expires_at': timezone.now() + timedelta(seconds=self.db_ttl),
+            }
+        )
+
+    async def aget(self, location):
+        """Async get(); only the database tier leaves the event loop"""
+        result = self.memory.get(normalize_location(location))
+        if result is not None:
+            self._count('memory_hits')
+            return result
+        return await sync_to_async(self.get)(location)
+
+    async def aset(self, location, result):
+        await sync_to_async(self.set)(location, result)
+
+    def clear(self):
+        """Drop the in-process tier (the database tier is left alone)"""
+        self.memory.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            hits = self.memory_hits + self.db_hits
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self.memory),
+            }
+
+
+_geocode_cache = None
+_geocode_cache_lock = threading.Lock()
+
+
+def get_geocode_cache():
+    """Process-wide GeocodeCache instance"""
+    global _geocode_cache
+    if _geocode_cache is None:
+        with _geocode_cache_lock:
+            if _geocode_cache is None:
+                _geocode_cache = GeocodeCache()
+    return _geocode_cache
+
+
+def route_cache_key(start, end, profile='driving-car', precision=None, waypoints=()):
+    """
+    Cache key for a directions request: profile plus start, waypoint and
+    end coordinates rounded to `precision` decimal places
+    """
+    if precision is None:
+        precision = settings.ROUTE_CACHE_COORD_PRECISION
+
+    points = [
+        f"{round(float(point['lat']), precision)},{round(float(point['lon']), precision)}"
+        for point in (start, *waypoints, end)
+    ]
+    return '|'.join([profile, *points])
+
+
+COORD_SCALE = 1e5
+
+
+def pack_route(route):
+    """
+    Serialize the cacheable part of a route into compact bytes.
+
+    Coordinates are stored as zlib-compressed int32 deltas at 1e-5 degree
+    resolution (~1 m), which is ~10x smaller than the GeoJSON text.
+    """
+    header = json.dumps({
+        'distance_miles': route['distance_miles'],
+        'duration_seconds': route['duration_seconds'],
+        'bbox': route.get('bbox'),
+        'geometry_type': route['geometry'].get('type', 'LineString'),
+        'legs': route.get('legs'),
+    }).encode()
+
+    deltas = array('i')
+    prev_lon = prev_lat = 0
+    for point in route['geometry']['coordinates']:
+        ilon = round(point[0] * COORD_SCALE)
+        ilat = round(point[1] * COORD_SCALE)
+        deltas.append(ilon - prev_lon)
+        deltas.append(ilat - prev_lat)
+        prev_lon, prev_lat = ilon, ilat
+
+    return zlib.compress(struct.pack('>I', len(header)) + header + deltas.tobytes())
+
+
+def unpack_route(payload):
+    """Inverse of pack_route"""
+    raw = zlib.decompress(payload)
+    (header_len,) = struct.unpack('>I', raw[:4])
+    header = json.loads(raw[4:4 + header_len])
+
+    deltas = array('i')
+    deltas.frombytes(raw[4 + header_len:])
+
+    coords = []
+    lon = lat = 0
+    for i in range(0, len(deltas), 2):
+        lon += deltas[i]
+        lat += deltas[i + 1]
+        coords.append([lon / COORD_SCALE, lat / COORD_SCALE])
+
+    route = {
+        'distance_miles': header['distance_miles'],
+        'duration_seconds': header['duration_seconds'],
+        'bbox': header['bbox'],
+        'geometry': {'type': header['geometry_type'], 'coordinates': coords},
+    }
+    if header.get('legs') is not None:
+        route['legs'] = header['legs']
+    return route
+
+
+class DiskRouteStore:
+    """
+    Size-bounded on-disk route store backed by a standalone SQLite file.
+
+    Safe to share between worker processes; each thread gets its own
+    connection.
+    """
+
+    def __init__(self, path, max_entries=50000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS routes ('
+                'key TEXT PRIMARY KEY, payload BLOB NOT NULL, '
+                'expires_at REAL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS routes_accessed ON routes (accessed_at)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, allow_stale=False):
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT payload, expires_at FROM routes WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        payload, expires_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            return payload if allow_stale else None
+
+        with conn:
+            conn.execute('UPDATE routes SET accessed_at = ? WHERE key = ?', (now, key))
+        return payload
+
+    def set(self, key, payload, ttl_seconds=None):
+        now = time.time()
+        expires_at = now + ttl_seconds if ttl_seconds else None
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO routes (key, payload, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?)',
+                (key, payload, expires_at, now)
+            )
+            (count,) = conn.execute('SELECT COUNT(*) FROM routes').fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    'DELETE FROM routes WHERE key IN ('
+                    'SELECT key FROM routes ORDER BY accessed_at LIMIT ?)',
+                    (count - self.max_entries,)
+                )
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM routes')
+
+
+class RouteCache:
+    """
+    Directions cache keyed on profile and rounded start/end coordinates.
+
+    Only the vehicle-independent part of a route is stored (distance,
+    duration, bbox, geometry), so the same entry serves any
+    fuel_efficiency_mpg / tank_range_miles combination.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl_seconds=None,
+                 disk_path=None, disk_max_entries=None):
+        if max_entries is None:
+            max_entries = settings.ROUTE_CACHE_MEMORY_SIZE
+        if max_bytes is None:
+            max_bytes = settings.ROUTE_CACHE_MEMORY_MAX_BYTES
+        if ttl_seconds is None:
+            ttl_seconds = settings.ROUTE_CACHE_TTL
+        if disk_path is None:
+            disk_path = settings.ROUTE_CACHE_DISK_PATH
+        if disk_max_entries is None:
+            disk_max_entries = settings.ROUTE_CACHE_DISK_MAX_ENTRIES
+
+        self.ttl_seconds = ttl_seconds
+        self.memory = LRUCache(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            max_bytes=max_bytes
+        )
+        self.disk = DiskRouteStore(disk_path, disk_max_entries) if disk_path else None
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        """Return the cached route dict for a key, or None"""
+        payload = self.memory.get(key)
+        if payload is not None:
+            self._count('memory_hits')
+            return unpack_route(payload)
+
+        if self.disk is not None:
+            payload = self.disk.get(key)
+            if payload is not None:
+                self.memory.set(key, payload)
+                self._count('disk_hits')
+                return unpack_route(payload)
+
+        self._count('misses')
+        return None
+
+    def get_stale(self, key):
+        """
+        Cached route for a key even if its TTL has passed (until evicted),
+        for serving while ORS is unavailable; None if there is none
+        """
+        payload = self.memory.get(key, allow_stale=True)
+        if payload is None and self.disk is not None:
+            payload = self.disk.get(key, allow_stale=True)
+        return None if payload is None else unpack_route(payload)
+
+    def set(self, key, route):
+        payload = pack_route(route)
+        self.memory.set(key, payload)
+        if self.disk is not None:
+            self.disk.set(key, payload, self.ttl_seconds)
+
+    async def aget(self, key):
+        """Async get(); the disk store is read off the event loop"""
+        if self.disk is None:
+            return self.get(key)
+        return await sync_to_async(self.get, thread_sensitive=False)(key)
+
+    async def aget_stale(self, key):
+        if self.disk is None:
+            return self.get_stale(key)
+        return await sync_to_async(self.get_stale, thread_sensitive=False)(key)
+
+    async def aset(self, key, route):
+        if self.disk is None:
+            return self.set(key, route)
+        await sync_to_async(self.set, thread_sensitive=False)(key, route)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self.memory),
+                'memory_bytes': self.memory.total_bytes,
+            }
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    """Process-wide RouteCache instance"""
+    global _route_cache
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                _route_cache = RouteCache()
+    return _route_cache
@@ -0,0 +1,63 @@
+import csv
+from functools import lru_cache
+from pathlib import Path
+
+from .cache import normalize_location
+
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+
+
+@lru_cache(maxsize=None)
+def load_state_centroids():
+    """{'TX': (lat, lon), ...} from the bundled state/province table"""
+    with open(DATA_DIR / 'state_centroids.csv', encoding='utf-8') as f:
+        return {
+            row['state']: (float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(f)
+        }
+
+
+@lru_cache(maxsize=None)
+def load_city_centroids():
+    """{('dallas', 'TX'): (lat, lon), ...} from the bundled city table"""
+    with open(DATA_DIR / 'city_centroids.csv', encoding='utf-8') as f:
+        return {
+            (normalize_location(row['city']), row['state']): (
+                float(row['latitude']),
+                float(row['longitude'])
+            )
+            for row in csv.DictReader(f)
+        }
+
+
+def lookup_centroid(city, state):
+    """
+    Offline geocode for a city/state pair.
+
+    Uses the bundled city table when the city is known, otherwise the
+    state centroid. Returns a dict shaped like RouteService.geocode_location
+    (with 'precision' set to 'city' or 'state' in properties), or None when
+    the state is unknown.
+    """
+    state = (state or '').strip().upper()
+    city = (city or '').strip()
+
+    point = load_city_centroids().get((normalize_location(city), state))
+    precision = 'city'
+    if point is None:
+        point = load_state_centroids().get(state)
+        precision = 'state'
+    if point is None:
+        return None
+
+    lat, lon = point
+    return {
+        'lat': lat,
+        'lon': lon,
+        'display_name': f"{city}, {state}" if city else state,
+        'properties': {
+            'region_a': state,
+            'source': 'centroid',
+            'precision': precision,
+        },
+    }
@@ -0,0 +1,204 @@
+import logging
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import normalize_location, pack_route, unpack_route
+from .fleet_worker import plan_vehicles
+from .geometry import RouteGeometry
+from .models import PrecomputedCorridor
+from .optimizer import Candidate, Purchase, plan_refuelling
+from .spatial import StationIndex, get_station_index
+
+logger = logging.getLogger(__name__)
+
+
+def corridor_key(start_location, end_location):
+    """PrecomputedCorridor.pair_key for two location strings"""
+    return f"{normalize_location(start_location)}|{normalize_location(end_location)}"
+
+
+def profile_key(fuel_efficiency_mpg, tank_range_miles):
+    """Key of a vehicle profile in PrecomputedCorridor.plans"""
+    return f"{float(fuel_efficiency_mpg):g}:{float(tank_range_miles):g}"
+
+
+@lru_cache(maxsize=8)
+def _popular_pair_keys(pairs):
+    return frozenset(corridor_key(start, end) for start, end in pairs)
+
+
+def is_popular_pair(start_location, end_location):
+    """True if the pair is one of POPULAR_ROUTE_PAIRS; no database query"""
+    if not settings.POPULAR_ROUTE_PAIRS:
+        return False
+    if not isinstance(start_location, str) or not isinstance(end_location, str):
+        return False
+    keys = _popular_pair_keys(tuple(tuple(pair) for pair in settings.POPULAR_ROUTE_PAIRS))
+    return corridor_key(start_location, end_location) in keys
+
+
+def find_corridor(start_location, end_location):
+    """
+    The PrecomputedCorridor for a pair of location strings, or None.
+    Only configured pairs are looked up.
+    """
+    if not is_popular_pair(start_location, end_location):
+        return None
+    return PrecomputedCorridor.objects.filter(pair_key=corridor_key(start_location, end_location)).first()
+
+
+def corridor_route_data(corridor):
+    """Route data, as RouteService.calculate_route returns it, for a corridor"""
+    return {
+        'start': corridor.start,
+        'end': corridor.end,
+        'waypoints': [],
+        **unpack_route(bytes(corridor.route_payload))
+    }
+
+
+def corridor_fuel_stops(route_service, corridor, route_data, options, station_index=None):
+    """
+    Fuel stops for a route served from a PrecomputedCorridor.
+
+    Vehicles matching a stored profile (starting full, no reserve) get the
+    stored plan. Other vehicles are solved over the stored corridor
+    stations at current prices. Stale corridors and historical prices go
+    through the regular find_optimal_fuel_stops().
+    """
+    index = get_station_index() if station_index is None else station_index
+    if corridor.stale or options.get('price_as_of') is not None:
+        return route_service.find_optimal_fuel_stops(route_data, station_index=index, **options)
+
+    snapshot = index.snapshot
+    plan = None
+    if options.get('start_fuel_fraction', 1.0) == 1.0 and options.get('reserve_miles', 0.0) == 0.0:
+        plan = corridor.plans.get(profile_key(options['fuel_efficiency_mpg'], options['tank_range_miles']))
+    if plan is not None:
+        rows = snapshot.rows_for_ids([stop[0] for stop in plan])
+        if (rows >= 0).all():
+            purchases = [
+                Purchase(route_mile, price, gallons, row)
+                for (_, route_mile, gallons, price), row in zip(plan, rows.tolist())
+            ]
+            return route_service._build_fuel_stops(
+                purchases, [snapshot.record(purchase.payload) for purchase in purchases]
+            )
+
+    rows = snapshot.rows_for_ids([station_id for station_id, _ in corridor.stations])
+    candidates = [
+        Candidate(route_mile, float(snapshot.prices[row]), row)
+        for (_, route_mile), row in zip(corridor.stations, rows.tolist())
+        if row >= 0
+    ]
+    try:
+        purchases = plan_refuelling(
+            candidates,
+            route_data['distance_miles'],
+            options['fuel_efficiency_mpg'],
+            options['tank_range_miles'],
+            start_fuel_fraction=options.get('start_fuel_fraction', 1.0),
+            reserve_miles=options.get('reserve_miles', 0.0)
+        )
+    except ValueError:
+        return route_service.find_optimal_fuel_stops(route_data, station_index=index, **options)
+    return route_service._build_fuel_stops(purchases, [snapshot.record(purchase.payload) for purchase in purchases])
+
+
+def precompute_corridor(route_service, start_location, end_location, profiles=None, station_index=None):
+    """
+    Geocode and route a pair, find its corridor stations and plan every
+    vehicle profile, then store the result. Returns the PrecomputedCorridor.
+    """
+    if profiles is None:
+        profiles = settings.PRECOMPUTED_VEHICLE_PROFILES
+    route_data = route_service.calculate_route(start_location, end_location)
+    if route_data.get('degraded'):
+        raise ValueError("ORS unavailable; not storing a degraded route")
+
+    index = get_station_index() if station_index is None else station_index
+    rows, route_miles, _ = index.corridor(
+        RouteGeometry.from_geojson(route_data['geometry']),
+        settings.STATION_CORRIDOR_RADIUS_MILES
+    )
+    station_ids = index.snapshot.ids[rows].tolist()
+
+    plans = {}
+    vehicle_plans = plan_vehicles(
+        index.snapshot.prices, rows, route_miles, route_data['distance_miles'],
+        [(mpg, tank_range, 1.0, 0.0) for mpg, tank_range in profiles]
+    )
+    for (mpg, tank_range), purchases in zip(profiles, vehicle_plans):
+        if isinstance(purchases, Exception):
+            # Corridor gaps: such vehicles are planned per request
+            continue
+        plans[profile_key(mpg, tank_range)] = [
+            [int(index.snapshot.ids[purchase.payload]), purchase.route_mile, purchase.gallons, float(purchase.price)]
+            for purchase in purchases
+        ]
+
+    corridor, _ = PrecomputedCorridor.objects.update_or_create(
+        pair_key=corridor_key(start_location, end_location),
+        defaults={
+            'start_location': start_location,
+            'end_location': end_location,
+            'start': route_data['start'],
+            'end': route_data['end'],
+            'route_payload': pack_route(route_data),
+            'stations': [[station_id, mile] for station_id, mile in zip(station_ids, route_miles.tolist())],
+            'plans': plans,
+            'stale': False,
+            'computed_at': timezone.now(),
+        }
+    )
+    return corridor
+
+
+def refresh_corridors(route_service, pairs=None, force=False):
+    """
+    Precompute the pairs (default POPULAR_ROUTE_PAIRS) that have no entry,
+    are stale or are older than PRECOMPUTED_CORRIDOR_MAX_AGE_SECONDS; with
+    force, all of them. Entries for pairs no longer configured are removed.
+
+    Returns (refreshed, failures) where failures lists (pair, error).
+    """
+    if pairs is None:
+        pairs = settings.POPULAR_ROUTE_PAIRS
+    keys = {corridor_key(start, end): (start, end) for start, end in pairs}
+    PrecomputedCorridor.objects.exclude(pair_key__in=list(keys)).delete()
+
+    fresh = set()
+    if not force:
+        cutoff = timezone.now() - timedelta(seconds=settings.PRECOMPUTED_CORRIDOR_MAX_AGE_SECONDS)
+        fresh = set(
+            PrecomputedCorridor.objects.filter(pair_key__in=list(keys))
+            .exclude(Q(stale=True) | Q(computed_at__lt=cutoff))
+            .values_list('pair_key', flat=True)
+        )
+    due = [key for key in keys if key not in fresh]
+
+    if not due:
+        return 0, []
+    # Read the station table now rather than through the process-wide
+    # snapshot, which may predate the price change that made entries stale
+    index = StationIndex()
+    refreshed = 0
+    failures = []
+    for key in due:
+        try:
+            precompute_corridor(route_service, *keys[key], station_index=index)
+        except Exception as e:
+            logger.warning("Could not precompute %s: %s", key, e)
+            failures.append((keys[key], e))
+        else:
+            refreshed += 1
+    return refreshed, failures
+
+
+def invalidate_corridors():
+    """Mark every PrecomputedCorridor stale (prices or stations changed)"""
+    return PrecomputedCorridor.objects.filter(stale=False).update(stale=True)
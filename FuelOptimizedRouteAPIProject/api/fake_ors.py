@@ -0,0 +1,242 @@
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .centroids import lookup_centroid
+from .geometry import haversine_miles
+from .ors_client import DIRECTIONS_PATH, GEOCODE_PATH
+
+METERS_PER_MILE = 1609.344
+
+# Provinces in the bundled centroid table; everything else there is a US state
+CANADIAN_PROVINCES = {'AB', 'BC', 'MB', 'NB', 'NS', 'ON', 'QC', 'SK', 'YT'}
+
+# Spacing of generated geometry points along a leg
+POINT_SPACING_MILES = 2.0
+
+
+def fake_geocode(text, size=1):
+    """
+    ORS /geocode/search response for "City, ST" text from the bundled
+    centroid tables: a locality for known cities, the region centroid for
+    other cities in a known state, no features otherwise
+    """
+    parts = [part.strip() for part in text.split(',')]
+    if len(parts) >= 3 and parts[-1].upper() in ('USA', 'US', 'CANADA', 'CAN'):
+        parts.pop()
+    point = lookup_centroid(', '.join(parts[:-1]), parts[-1]) if len(parts) >= 2 else None
+    if point is None or size < 1:
+        return {'type': 'FeatureCollection', 'features': []}
+
+    state = point['properties']['region_a']
+    country = 'CAN' if state in CANADIAN_PROVINCES else 'USA'
+    locality = point['properties']['precision'] == 'city'
+    label = f"{point['display_name']}, {country}" if locality else f"{state}, {country}"
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [point['lon'], point['lat']]},
+            'properties': {
+                'label': label,
+                'name': point['display_name'].rpartition(',')[0] if locality else state,
+                'layer': 'locality' if locality else 'region',
+                'region_a': state,
+                'country_a': country,
+                'confidence': 1 if locality else 0.6,
+            },
+        }],
+        'bbox': [point['lon'], point['lat'], point['lon'], point['lat']],
+    }
+
+
+def fake_leg(start, end):
+    """
+    Road-like [[lon, lat], ...] between two [lon, lat] points and its
+    duration in seconds. The line bends and wiggles off the straight
+    course (typically 5-30% longer than the crow flies) and the average
+    speed varies by leg; both are seeded by the endpoints, so the same
+    leg always comes back the same.
+    """
+    seed = zlib.crc32(json.dumps([round(value, 4) for value in (*start, *end)]).encode())
+    rng = np.random.default_rng(seed)
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+
+    straight = float(haversine_miles(start[1], start[0], end[1], end[0]))
+    count = max(2, int(straight / POINT_SPACING_MILES) + 1)
+    t = np.linspace(0.0, 1.0, count)
+
+    # Offsets perpendicular to the course (in miles, not degrees) vanish
+    # at both ends
+    course = end - start
+    scale = np.cos(np.radians((start[1] + end[1]) / 2))
+    normal = np.array([-course[1] / scale, course[0] * scale])
+    offset = rng.uniform(0.2, 0.3) * rng.choice([-1, 1]) * np.sin(np.pi * t)
+    for harmonic in (3, 7, 13):
+        offset += rng.uniform(-0.01, 0.01) * np.sin(harmonic * np.pi * t)
+    line = start + np.outer(t, course) + np.outer(offset, normal)
+
+    miles = float(haversine_miles(line[:-1, 1], line[:-1, 0], line[1:, 1], line[1:, 0]).sum())
+    duration = miles / rng.uniform(55.0, 65.0) * 3600
+    return np.round(line, 5).tolist(), miles, duration
+
+
+def fake_directions(coordinates):
+    """ORS /v2/directions/{profile}/geojson response through the coordinates"""
+    line = []
+    segments = []
+    for start, end in zip(coordinates, coordinates[1:]):
+        points, miles, duration = fake_leg(start, end)
+        line.extend(points if not line else points[1:])
+        segments.append({'distance': round(miles * METERS_PER_MILE, 1), 'duration': round(duration, 1)})
+
+    lons = [lon for lon, _ in line]
+    lats = [lat for _, lat in line]
+    return {
+        'type': 'FeatureCollection',
+        'bbox': [min(lons), min(lats), max(lons), max(lats)],
+        'features': [{
+            'type': 'Feature',
+            'bbox': [min(lons), min(lats), max(lons), max(lats)],
+            'geometry': {'type': 'LineString', 'coordinates': line},
+            'properties': {
+                'segments': segments,
+                'summary': {
+                    'distance': round(sum(segment['distance'] for segment in segments), 1),
+                    'duration': round(sum(segment['duration'] for segment in segments), 1),
+                },
+                'way_points': [0, len(line) - 1],
+            },
+        }],
+        'metadata': {'service': 'routing', 'engine': {'version': 'fake'}},
+    }
+
+
+class FakeORSHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeORS/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != GEOCODE_PATH:
+            return self._send(404, {'error': f"Unknown path {url.path}"})
+        if self._inject_faults('geocode'):
+            return
+        params = parse_qs(url.query)
+        text = params.get('text', [''])[0]
+        if not text:
+            return self._send(400, {'error': "'text' is required"})
+        self._send(200, fake_geocode(text, int(params.get('size', ['10'])[0])))
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path != DIRECTIONS_PATH.format(profile='driving-car'):
+            return self._send(404, {'error': f"Unknown path {path}"})
+        if self._inject_faults('directions'):
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            coordinates = [[float(lon), float(lat)] for lon, lat in body['coordinates']]
+        except (KeyError, TypeError, ValueError):
+            return self._send(400, {'error': {'code': 2000, 'message': "Invalid 'coordinates'"}})
+        if len(coordinates) < 2:
+            return self._send(400, {'error': {'code': 2003, 'message': "Need at least 2 coordinates"}})
+        self._send(200, fake_directions(coordinates))
+
+    def _inject_faults(self, endpoint):
+        """
+        Count the request, wait out the configured latency and answer
+        403/429/503 when due. Returns True if a response was sent.
+        """
+        server = self.server
+        with server.lock:
+            server.counts[endpoint] += 1
+            delay = server.latency + server.random.uniform(0, server.latency_jitter)
+            roll = server.random.random()
+
+        if delay:
+            time.sleep(delay)
+        if server.api_key and self.headers.get('Authorization') != server.api_key:
+            self._send(403, {'error': 'Access to this API has been disallowed'})
+            return True
+        if roll < server.throttle_rate:
+            self._send(429, {'error': 'Rate limit exceeded'}, {'Retry-After': f"{server.retry_after:g}"})
+            return True
+        if roll < server.throttle_rate + server.error_rate:
+            self._send(503, {'error': 'Service temporarily unavailable'})
+            return True
+        return False
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeORSServer(ThreadingHTTPServer):
+    """
+    Local stand-in for api.openrouteservice.org, serving /geocode/search
+    and /v2/directions/driving-car/geojson with synthetic data.
+
+    Every request waits `latency` plus up to `latency_jitter` seconds,
+    then fails with a 429 (fraction `throttle_rate`, with Retry-After) or
+    a 503 (fraction `error_rate`). Faults are drawn from a generator
+    seeded with `seed`, and geometry depends only on the coordinates, so
+    runs are reproducible. With `api_key` set, other keys get a 403.
+
+    Port 0 picks a free port; point OPENROUTESERVICE_BASE_URL at `url`.
+    Usable as a context manager that serves from a background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1.0, seed=None, api_key=None, verbose=False):
+        super().__init__((host, port), FakeORSHandler)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.api_key = api_key
+        self.verbose = verbose
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'geocode': 0, 'directions': 0}
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-ors', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
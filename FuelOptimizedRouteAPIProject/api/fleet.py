@@ -0,0 +1,172 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from django.conf import settings
+
+from .batch import BatchResult, RouteBatch
+from .fleet_worker import plan_vehicles, plan_vehicles_shared
+from .geometry import RouteGeometry
+from .spatial import get_station_index
+
+# Upper bound on vehicles sent to a worker in one task
+FLEET_CHUNK_VEHICLES = 256
+
+
+def fleet_worker_count():
+    """FLEET_PLANNER_WORKERS, or one worker per CPU when unset (0)"""
+    return settings.FLEET_PLANNER_WORKERS or os.cpu_count() or 1
+
+
+_fleet_pool = None
+_fleet_pool_lock = threading.Lock()
+
+
+def get_fleet_pool():
+    """
+    Process-wide pool for fleet planning, started on first use.
+
+    Workers are spawned rather than forked so they never inherit the
+    server's threads or database connections; they only import the
+    Django-free fleet_worker module.
+    """
+    global _fleet_pool
+    if _fleet_pool is None:
+        with _fleet_pool_lock:
+            if _fleet_pool is None:
+                _fleet_pool = ProcessPoolExecutor(
+                    max_workers=fleet_worker_count(),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _fleet_pool
+
+
+class FleetPlanner:
+    """
+    Plan fuel stops for a whole fleet of vehicles.
+
+    Vehicles are BatchItems, each with its own fuel_efficiency_mpg and
+    tank_range_miles in its options. Routing goes through RouteBatch, so
+    shared locations and routes hit geocoding and ORS once (and the route
+    cache first). The corridor stations of each distinct route are found
+    once in this process; the per-vehicle refuelling solves then run on
+    the process pool, which reads prices from a shared-memory copy of the
+    snapshot's price column instead of having it pickled per task.
+
+    Small fleets (below parallel_threshold vehicles) are solved inline,
+    where pool round trips would cost more than they save.
+    """
+
+    parallel_threshold = 64
+
+    def __init__(self, route_service, workers=None, concurrency=None):
+        self.route_service = route_service
+        self.workers = workers or fleet_worker_count()
+        self.concurrency = concurrency
+        self.unique_locations = 0
+        self.unique_routes = 0
+
+    def plan(self, vehicles):
+        """Returns a BatchResult per vehicle, in order"""
+        batch = RouteBatch(self.route_service, self.concurrency)
+        routed = batch.route_all(vehicles)
+        self.unique_locations = batch.unique_locations
+        self.unique_routes = batch.unique_routes
+
+        index = get_station_index()
+        results = [None] * len(vehicles)
+        positions_by_key = {}
+        for position, (key, route) in enumerate(routed):
+            if isinstance(route, Exception):
+                results[position] = BatchResult(None, None, route)
+            elif vehicles[position].options.get('price_as_of') is not None:
+                # Historical prices come from the database, so plan here
+                results[position] = self._plan_one(route, vehicles[position], index)
+            else:
+                positions_by_key.setdefault(key, []).append(position)
+
+        tasks = []
+        for key, positions in positions_by_key.items():
+            route = routed[positions[0]][1]
+            rows, route_miles, _ = index.corridor(
+                RouteGeometry.from_geojson(route['geometry']),
+                settings.STATION_CORRIDOR_RADIUS_MILES,
+                self.route_service._corridor_limits()[0]
+            )
+            chunk = min(FLEET_CHUNK_VEHICLES, max(1, math.ceil(len(positions) / self.workers)))
+            for start in range(0, len(positions), chunk):
+                tasks.append((route, rows, route_miles, positions[start:start + chunk]))
+
+        if self.workers > 1 and sum(len(task[3]) for task in tasks) >= self.parallel_threshold:
+            plans = self._solve_parallel(tasks, vehicles, index)
+        else:
+            plans = self._solve_inline(tasks, vehicles, index)
+
+        for (route, _, _, positions), task_plans in zip(tasks, plans):
+            for position, purchases in zip(positions, task_plans):
+                if isinstance(purchases, Exception):
+                    # Gaps among the cheapest per cell: retry on the whole corridor
+                    results[position] = self._plan_one(route, vehicles[position], index)
+                    continue
+                stations = [index.snapshot.record(purchase.payload) for purchase in purchases]
+                results[position] = BatchResult(
+                    route, self.route_service._build_fuel_stops(purchases, stations), None
+                )
+        return results
+
+    def _solve_inline(self, tasks, vehicles, index):
+        return [
+            plan_vehicles(
+                index.snapshot.prices, rows, route_miles, route['distance_miles'],
+                self._vehicle_specs(vehicles, positions)
+            )
+            for route, rows, route_miles, positions in tasks
+        ]
+
+    def _solve_parallel(self, tasks, vehicles, index):
+        """Solve tasks on the process pool against a shared copy of the prices"""
+        prices = index.snapshot.prices
+        block = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+        shared = np.ndarray(prices.shape, dtype=np.float64, buffer=block.buf)
+        try:
+            shared[:] = prices
+            pool = get_fleet_pool()
+            futures = [
+                pool.submit(
+                    plan_vehicles_shared,
+                    block.name, len(prices), rows, route_miles, route['distance_miles'],
+                    self._vehicle_specs(vehicles, positions)
+                )
+                for route, rows, route_miles, positions in tasks
+            ]
+            return [future.result() for future in futures]
+        finally:
+            # Views into the block must go before it can be closed
+            del shared
+            block.close()
+            block.unlink()
+
+    def _vehicle_specs(self, vehicles, positions):
+        return [
+            (
+                vehicles[position].options['fuel_efficiency_mpg'],
+                vehicles[position].options['tank_range_miles'],
+                vehicles[position].options.get('start_fuel_fraction', 1.0),
+                vehicles[position].options.get('reserve_miles', 0.0),
+            )
+            for position in positions
+        ]
+
+    def _plan_one(self, route, vehicle, index):
+        """find_optimal_fuel_stops() for a single vehicle, in this process"""
+        try:
+            fuel_stops = self.route_service.find_optimal_fuel_stops(
+                route, station_index=index, **vehicle.options
+            )
+        except Exception as e:
+            return BatchResult(route, None, e)
+        return BatchResult(route, fuel_stops, None)
@@ -0,0 +1,75 @@
+"""
+Worker-process side of fleet planning.
+
+This module is imported by spawned pool processes, so it must not import
+Django: workers see the station price column through shared memory and
+get each route's corridor arrays with the task.
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .optimizer import Candidate, plan_refuelling
+
+
+def read_prices(name, station_count, rows):
+    """
+    Prices of snapshot `rows`, copied out of the float64 price column the
+    parent published under `name`. The block is closed again before
+    returning, so workers hold no handle between tasks.
+    """
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        # Indexing copies; the temporary view is gone before close()
+        return np.ndarray((station_count,), dtype=np.float64, buffer=block.buf)[rows]
+    finally:
+        block.close()
+
+
+def plan_vehicles(prices, rows, route_miles, total_distance, vehicles):
+    """
+    Refuelling plans for several vehicles on one route.
+
+    Args:
+        prices: Price per gallon for every snapshot row
+        rows: Snapshot rows of the corridor stations
+        route_miles: Route mile of each corridor station
+        total_distance: Route length in miles
+        vehicles: (fuel_efficiency_mpg, tank_range_miles,
+            start_fuel_fraction, reserve_miles) tuples
+
+    Returns:
+        list with, per vehicle, its Purchase tuples (payload is the
+        snapshot row) or the ValueError the solver raised
+    """
+    return plan_corridor(prices[rows], rows, route_miles, total_distance, vehicles)
+
+
+def plan_corridor(corridor_prices, rows, route_miles, total_distance, vehicles):
+    """plan_vehicles() with the corridor stations' prices already picked out"""
+    candidates = [
+        Candidate(mile, price, row)
+        for row, mile, price in zip(rows.tolist(), route_miles.tolist(), corridor_prices.tolist())
+    ]
+
+    plans = []
+    for mpg, tank_range, start_fraction, reserve in vehicles:
+        try:
+            plans.append(plan_refuelling(
+                candidates,
+                total_distance,
+                mpg,
+                tank_range,
+                start_fuel_fraction=start_fraction,
+                reserve_miles=reserve
+            ))
+        except ValueError as e:
+            plans.append(e)
+    return plans
+
+
+def plan_vehicles_shared(prices_name, station_count, rows, route_miles, total_distance, vehicles):
+    """plan_vehicles() against the shared price block, for pool tasks"""
+    return plan_corridor(
+        read_prices(prices_name, station_count, rows), rows, route_miles, total_distance, vehicles
+    )
@@ -0,0 +1,201 @@
+import numpy as np
+
+EARTH_RADIUS_MILES = 3959
+MILES_PER_DEGREE_LAT = 69.0
+
+# Vertices kept in the coarse pass of project_points: at least this many,
+# and no more than COARSE_SPACING_MILES apart on long routes
+COARSE_VERTICES = 1024
+COARSE_SPACING_MILES = 2.0
+# Stations projected per chunk, bounds the (stations x vertices) matrices
+PROJECTION_CHUNK = 2048
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in miles between point sets.
+
+    Inputs are degrees and broadcast like any NumPy expression, so this
+    works point-to-point, one-to-many or as an (n, 1) x (1, m) matrix.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class RouteGeometry:
+    """
+    Route polyline as coordinate arrays plus cumulative mileage at every
+    vertex. Build it once per route and reuse it for every query.
+    """
+
+    def __init__(self, lons, lats):
+        self.lons = np.ascontiguousarray(lons, dtype=float)
+        self.lats = np.ascontiguousarray(lats, dtype=float)
+        self.cumulative = cumulative_miles(self.lons, self.lats)
+
+    @classmethod
+    def from_geojson(cls, geometry):
+        """Build from a GeoJSON LineString dict or its [[lon, lat], ...] coordinates"""
+        coords = geometry['coordinates'] if isinstance(geometry, dict) else geometry
+        array = np.asarray(coords, dtype=float).reshape(len(coords), -1)
+        return cls(array[:, 0], array[:, 1])
+
+    def __len__(self):
+        return len(self.lons)
+
+    @property
+    def total_miles(self):
+        return float(self.cumulative[-1]) if len(self.cumulative) else 0.0
+
+    def point_at_mile(self, miles):
+        """Interpolated (lat, lon) arrays at the given route miles"""
+        return point_at_mile(self, miles)
+
+    def project(self, lats, lons):
+        """(route_mile, offset_miles) arrays for points projected onto the route"""
+        return project_points(self, lats, lons)
+
+    def densified(self, max_segment_miles):
+        """
+        Copy of the route with long segments split so no segment exceeds
+        max_segment_miles. Mileage is unchanged.
+        """
+        lengths = np.diff(self.cumulative)
+        pieces = np.maximum(1, np.ceil(lengths / max_segment_miles).astype(np.int64))
+        if len(pieces) == 0 or pieces.max() == 1:
+            return self
+
+        seg = np.repeat(np.arange(len(pieces)), pieces)
+        frac = (np.arange(len(seg)) - np.repeat(np.cumsum(pieces) - pieces, pieces)) / pieces[seg]
+
+        route = RouteGeometry.__new__(RouteGeometry)
+        route.lons = np.append(self.lons[seg] + (self.lons[seg + 1] - self.lons[seg]) * frac, self.lons[-1])
+        route.lats = np.append(self.lats[seg] + (self.lats[seg + 1] - self.lats[seg]) * frac, self.lats[-1])
+        route.cumulative = np.append(self.cumulative[seg] + lengths[seg] * frac, self.cumulative[-1])
+        return route
+
+
+def cumulative_miles(lons, lats):
+    """Cumulative haversine mileage at every vertex, starting at 0"""
+    if len(lons) == 0:
+        return np.zeros(0)
+    steps = haversine_miles(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    return np.concatenate(([0.0], np.cumsum(steps)))
+
+
+def point_at_mile(route, miles):
+    """
+    Interpolate positions along a RouteGeometry at the given mileages
+    (clamped to the route). Returns (lats, lons) arrays.
+    """
+    miles = np.clip(np.atleast_1d(np.asarray(miles, dtype=float)), 0.0, route.total_miles)
+    if len(route) < 2:
+        return np.full(miles.shape, route.lats[0]), np.full(miles.shape, route.lons[0])
+
+    seg = np.clip(np.searchsorted(route.cumulative, miles, side='right') - 1, 0, len(route) - 2)
+    length = route.cumulative[seg + 1] - route.cumulative[seg]
+    t = np.divide(miles - route.cumulative[seg], length, out=np.zeros_like(miles), where=length > 0)
+
+    lats = route.lats[seg] + t * (route.lats[seg + 1] - route.lats[seg])
+    lons = route.lons[seg] + t * (route.lons[seg + 1] - route.lons[seg])
+    return lats, lons
+
+
+def _project_onto_segments(route, seg, valid, lats, lons):
+    """
+    Project each point onto its candidate segments (one row per point) in a
+    local equirectangular frame centred on the point. Returns the best
+    segment index and position t along it for every point.
+    """
+    scale_x = (MILES_PER_DEGREE_LAT * np.cos(np.radians(lats)))[:, None]
+    ax = (route.lons[seg] - lons[:, None]) * scale_x
+    ay = (route.lats[seg] - lats[:, None]) * MILES_PER_DEGREE_LAT
+    dx = (route.lons[seg + 1] - route.lons[seg]) * scale_x
+    dy = (route.lats[seg + 1] - route.lats[seg]) * MILES_PER_DEGREE_LAT
+
+    length_sq = dx * dx + dy * dy
+    t = np.divide(-(ax * dx + ay * dy), length_sq, out=np.zeros_like(ax), where=length_sq > 0)
+    t = np.clip(t, 0.0, 1.0)
+
+    px = ax + t * dx
+    py = ay + t * dy
+    dist_sq = np.where(valid, px * px + py * py, np.inf)
+
+    best = np.argmin(dist_sq, axis=1)
+    rows = np.arange(len(lats))
+    return seg[rows, best], t[rows, best]
+
+
+def project_points(route, lats, lons):
+    """
+    Project points onto a RouteGeometry.
+
+    Long segments are split first, then a coarse pass finds the nearest of
+    ~COARSE_VERTICES evenly spaced vertices and a fine pass checks only the
+    segments around it, so the
+    cost is O(points x (COARSE_VERTICES + vertices / COARSE_VERTICES))
+    rather than O(points x vertices). A point between two passes of a route
+    that doubles back may snap to the slightly farther pass.
+
+    Returns:
+        (route_miles, offset_miles) arrays: distance along the route to the
+        closest point, and great-circle distance from the point to it
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lons = np.atleast_1d(np.asarray(lons, dtype=float))
+
+    if len(lats) == 0:
+        return np.zeros(0), np.zeros(0)
+    if len(route) < 2:
+        return np.zeros(len(lats)), haversine_miles(lats, lons, route.lats[0], route.lons[0])
+
+    # Long segments would hide their interior from the coarse pass
+    coarse_count = max(COARSE_VERTICES, int(route.total_miles / COARSE_SPACING_MILES))
+    route = route.densified(max(route.total_miles / coarse_count, 0.1))
+
+    vertex_count = len(route)
+    step = max(1, int(np.ceil((vertex_count - 1) / coarse_count)))
+    coarse = np.arange(0, vertex_count, step)
+    if coarse[-1] != vertex_count - 1:
+        coarse = np.append(coarse, vertex_count - 1)
+    window = np.arange(2 * step)
+
+    coarse_lons = route.lons[coarse]
+    coarse_lats = route.lats[coarse]
+    coarse_terms = np.vstack((coarse_lons, coarse_lats, coarse_lons ** 2, coarse_lats ** 2))
+
+    route_miles = np.empty(len(lats))
+    offsets = np.empty(len(lats))
+
+    for start in range(0, len(lats), PROJECTION_CHUNK):
+        chunk = slice(start, start + PROJECTION_CHUNK)
+        clat, clon = lats[chunk], lons[chunk]
+
+        # Coarse pass: nearest sampled vertex. With s = cos(point lat),
+        # s^2 (x_p - x_v)^2 + (y_p - y_v)^2 expands into a single matrix
+        # product once the per-point constant is dropped
+        scale_sq = np.cos(np.radians(clat)) ** 2
+        points = np.column_stack((-2 * scale_sq * clon, -2 * clat, scale_sq, np.ones_like(clat)))
+        nearest = np.argmin(points @ coarse_terms, axis=1)
+
+        # Fine pass: every segment between the neighbouring sampled vertices
+        lo = coarse[np.maximum(nearest - 1, 0)]
+        hi = coarse[np.minimum(nearest + 1, len(coarse) - 1)]
+        seg = lo[:, None] + window[None, :]
+        valid = seg < hi[:, None]
+        seg = np.minimum(seg, vertex_count - 2)
+
+        best_seg, t = _project_onto_segments(route, seg, valid, clat, clon)
+
+        seg_miles = route.cumulative[best_seg + 1] - route.cumulative[best_seg]
+        route_miles[chunk] = route.cumulative[best_seg] + t * seg_miles
+
+        plat = route.lats[best_seg] + t * (route.lats[best_seg + 1] - route.lats[best_seg])
+        plon = route.lons[best_seg] + t * (route.lons[best_seg + 1] - route.lons[best_seg])
+        offsets[chunk] = haversine_miles(clat, clon, plat, plon)
+
+    return route_miles, offsets
@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Prefetch, Q
+
+from .models import FuelStop, Route
+
+# Newest first; id breaks ties between routes stored in the same instant
+HISTORY_ORDERING = ('-created_at', '-id')
+
+
+def encode_cursor(route):
+    """Opaque cursor pointing just past `route` in history order"""
+    raw = json.dumps([route.created_at.isoformat(), route.pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from encode_cursor(); ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def route_history(filters=None, cursor=None, fields=None, geometry='simplified'):
+    """
+    Route queryset for history listings, newest first.
+
+    Args:
+        filters: Optional created_after, created_before, start_location
+            and end_location (exact match) values
+        cursor: encode_cursor() of the last route already seen; the
+            queryset then starts right after it (keyset pagination, so
+            page N costs the same as page 1)
+        fields: RouteSerializer fields that will be returned, or None
+            for all of them. Columns and relations outside them aren't
+            loaded.
+        geometry: 'full', 'simplified' or 'none' (see RouteSerializer)
+
+    Fuel stops come with their stations from one prefetch query, so a
+    page always takes two queries however many routes and stops it has.
+    """
+    filters = filters or {}
+    routes = Route.objects.order_by(*HISTORY_ORDERING)
+
+    if filters.get('created_after') is not None:
+        routes = routes.filter(created_at__gte=filters['created_after'])
+    if filters.get('created_before') is not None:
+        routes = routes.filter(created_at__lt=filters['created_before'])
+    if filters.get('start_location'):
+        routes = routes.filter(start_location=filters['start_location'])
+    if filters.get('end_location'):
+        routes = routes.filter(end_location=filters['end_location'])
+
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        routes = routes.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    unused = {
+        'full': ['route_polyline_simplified'],
+        # The full line is only read for rows stored without a simplified one
+        'simplified': ['route_polyline'],
+        'none': ['route_polyline', 'route_polyline_simplified'],
+    }[geometry]
+    if fields is not None and 'route_polyline' not in fields:
+        unused = ['route_polyline', 'route_polyline_simplified']
+    if unused:
+        routes = routes.defer(*unused)
+
+    if fields is None or 'fuel_stops' in fields:
+        routes = routes.prefetch_related(
+            Prefetch('fuel_stops', queryset=FuelStop.objects.select_related('fuel_station').order_by('stop_order'))
+        )
+    return routes
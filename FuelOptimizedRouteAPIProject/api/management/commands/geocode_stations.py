@@ -0,0 +1,197 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.centroids import load_state_centroids, lookup_centroid
+from api.corridors import invalidate_corridors
+from api.models import FuelStation
+from api.services import RouteService
+
+# ORS layers no finer than a state; such answers are treated as misses
+COARSE_LAYERS = {'region', 'macroregion', 'country'}
+
+
+def state_centroid_filter():
+    """Q for stations sitting on their state's centroid"""
+    query = Q(pk__in=[])
+    for state, (lat, lon) in load_state_centroids().items():
+        query |= Q(
+            state=state,
+            latitude=Decimal(str(round(lat, 7))),
+            longitude=Decimal(str(round(lon, 7)))
+        )
+    return query
+
+
+class Command(BaseCommand):
+    help = (
+        "Populate FuelStation.latitude/longitude. Stations are geocoded per "
+        "unique city/state in resumable batches through the geocoding cache, "
+        "falling back to the bundled centroid tables. Those list about 120 "
+        "cities; other places get their state's centroid, which is too coarse "
+        "for corridor lookups. --refine retries just those stations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help="City/state pairs geocoded and committed per batch (default: 200)"
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Maximum concurrent geocoding requests (default: 4)"
+        )
+        parser.add_argument(
+            '--offline', action='store_true',
+            help="Skip OpenRouteService and use only the bundled centroid tables"
+        )
+        parser.add_argument(
+            '--no-fallback', action='store_true',
+            help="Leave stations ungeocoded instead of using centroids when ORS fails"
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Re-geocode stations that already have coordinates"
+        )
+        parser.add_argument(
+            '--refine', action='store_true',
+            help="Re-geocode only stations placed on their state's centroid"
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Stop after this many city/state pairs"
+        )
+
+    def handle(self, *args, **options):
+        self.fallback = not options['no_fallback']
+        self.route_service = None
+
+        if not options['offline']:
+            try:
+                self.route_service = RouteService()
+            except ValueError as e:
+                self.stderr.write(self.style.WARNING(f"{e} Using bundled centroids only."))
+
+        # Group pending stations by place so each city is geocoded once
+        stations = FuelStation.objects.only('id', 'city', 'state', 'updated_at')
+        if options['refine'] and not options['force']:
+            stations = stations.filter(state_centroid_filter())
+        elif not options['force']:
+            stations = stations.filter(latitude__isnull=True)
+
+        groups = defaultdict(list)
+        for station in stations.iterator(chunk_size=2000):
+            groups[(station.city.strip(), station.state.strip().upper())].append(station)
+
+        places = sorted(groups)
+        if options['limit'] is not None:
+            places = places[:options['limit']]
+
+        if not places:
+            self.stdout.write(self.style.SUCCESS("All stations already geocoded"))
+            return
+
+        self.stdout.write(
+            f"Geocoding {len(places)} places for "
+            f"{sum(len(groups[p]) for p in places)} stations"
+        )
+
+        started = time.monotonic()
+        totals = defaultdict(int)
+        batch_size = max(1, options['batch_size'])
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            for offset in range(0, len(places), batch_size):
+                batch = places[offset:offset + batch_size]
+                results = pool.map(self._geocode_place, batch)
+
+                # Each batch is committed on its own, so an interrupted run
+                # resumes from the first ungeocoded station
+                updated = []
+                now = timezone.now()
+                for place, (result, source) in zip(batch, results):
+                    totals[source] += 1
+                    if result is None:
+                        continue
+                    if result.get('properties', {}).get('precision') == 'state':
+                        totals['state_places'] += 1
+                        totals['state_stations'] += len(groups[place])
+
+                    lat = Decimal(str(round(result['lat'], 7)))
+                    lon = Decimal(str(round(result['lon'], 7)))
+                    for station in groups[place]:
+                        station.latitude = lat
+                        station.longitude = lon
+                        station.updated_at = now
+                        updated.append(station)
+
+                with transaction.atomic():
+                    FuelStation.objects.bulk_update(
+                        updated, ['latitude', 'longitude', 'updated_at'], batch_size=500
+                    )
+
+                self.stdout.write(
+                    f"  {offset + len(batch)}/{len(places)} places, "
+                    f"{len(updated)} stations updated"
+                )
+
+        if totals['ors'] or totals['degraded'] or totals['centroid']:
+            # Newly placed stations may sit on precomputed corridors
+            invalidate_corridors()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.1f}s: {totals['ors']} via ORS, "
+            f"{totals['degraded']} via centroids while ORS was unavailable, "
+            f"{totals['centroid']} via centroids, {totals['failed']} failed"
+        ))
+        if totals['state_places']:
+            self.stderr.write(self.style.WARNING(
+                f"{totals['state_places']} places ({totals['state_stations']} stations) are not in the "
+                "bundled city table and were put on their state's centroid. Every station of such a "
+                "state shares one point, so corridor lookups can't tell them apart. Re-run with "
+                "--refine once ORS is reachable to retry only those stations."
+            ))
+
+    def _geocode_place(self, place):
+        """Geocode one (city, state) pair; returns (result, source)"""
+        city, state = place
+        try:
+            if self.route_service is not None:
+                try:
+                    result = self.route_service.geocode_location(f"{city}, {state}")
+                except ValueError:
+                    result = None
+
+                if result is not None and result.get('degraded'):
+                    # ORS is unavailable and the service answered from the
+                    # centroid tables itself
+                    if self.fallback:
+                        return result, 'degraded'
+                    return None, 'failed'
+                if result is not None and self._is_local(result, state):
+                    return result, 'ors'
+
+            if self.fallback or self.route_service is None:
+                result = lookup_centroid(city, state)
+                if result is not None:
+                    return result, 'centroid'
+
+            return None, 'failed'
+        finally:
+            # Worker threads hold their own DB connections (geocode cache)
+            connections.close_all()
+
+    def _is_local(self, result, state):
+        """True if an ORS answer lies in the station's state and is finer than the state"""
+        properties = result.get('properties', {})
+        return (
+            str(properties.get('region_a', '')).upper() == state
+            and properties.get('layer') not in COARSE_LAYERS
+        )
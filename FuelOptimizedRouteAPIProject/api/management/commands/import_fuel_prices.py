@@ -1,21 +1,199 @@
 import csv
-from api.models import FuelStation
-
-csv_path = r'D:/SW/BE projects/3- Fuel-Optimized-Route-API-Project/Fuel-Optimized-Route-API-Project/FuelOptimizedRouteAPIProject/fuel-prices-for-be-assessment.csv'
-
-stations = []
-with open(csv_path, encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        stations.append(FuelStation(
-            opis_id=int(row['OPIS Truckstop ID']),
-            name=row['Truckstop Name'],
-            address=row['Address'],
-            city=row['City'],
-            state=row['State'],
-            rack_id=int(row['Rack ID']),
-            retail_price=float(row['Retail Price'])
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.corridors import invalidate_corridors
+from api.models import FuelStation, PriceImport
+from api.prices import record_price_snapshots
+
+DEFAULT_CSV = Path(settings.BASE_DIR) / 'fuel-prices-for-be-assessment.csv'
+
+# CSV column -> FuelStation field
+COLUMNS = {
+    'OPIS Truckstop ID': 'opis_id',
+    'Truckstop Name': 'name',
+    'Address': 'address',
+    'City': 'city',
+    'State': 'state',
+    'Rack ID': 'rack_id',
+    'Retail Price': 'retail_price',
+}
+UPDATE_FIELDS = ['name', 'address', 'city', 'state', 'rack_id', 'retail_price', 'updated_at']
+COMPARED_FIELDS = UPDATE_FIELDS[:-1]
+# Fields the station's coordinates were geocoded from
+LOCATION_FIELDS = ['address', 'city', 'state']
+PRICE_QUANTUM = Decimal('0.00001')
+
+
+def parse_row(row):
+    """Clean one CSV row into FuelStation field values"""
+    try:
+        return {
+            'opis_id': int(row['OPIS Truckstop ID']),
+            'name': row['Truckstop Name'].strip(),
+            'address': row['Address'].strip(),
+            'city': row['City'].strip(),
+            'state': row['State'].strip().upper(),
+            'rack_id': int(row['Rack ID']),
+            'retail_price': Decimal(row['Retail Price'].strip()).quantize(PRICE_QUANTUM),
+        }
+    except (KeyError, ValueError, InvalidOperation) as e:
+        raise ValueError(f"Invalid row {dict(row)}: {e}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the OPIS fuel price CSV. The file is streamed twice: once to "
+        "pick one row per OPIS ID (lowest price wins), then in chunked upserts "
+        "that only write new stations and changed prices; re-running is safe. "
+        "Each run that changes stations is recorded as a PriceImport with a "
+        "snapshot of every new or changed price. Stations whose address, city "
+        "or state changed lose their coordinates until geocode_stations runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'csv_path', nargs='?', default=str(DEFAULT_CSV),
+            help=f"Path to the price CSV (default: {DEFAULT_CSV.name})"
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help="Rows compared and written per transaction (default: 1000)"
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['csv_path'])
+        if not path.exists():
+            raise CommandError(f"CSV file not found: {path}")
+
+        started = time.monotonic()
+        self.totals = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        self.source = str(path)
+        self.imported_at = timezone.now()
+        # Created with the first changed chunk, so runs that fail validation
+        # or change nothing leave no PriceImport (and no snapshot reload)
+        self.price_import = None
+        self.price_changes = 0
+        self.relocated = 0
+
+        # Pass 1: pick the winning row per OPIS ID (lowest price, first on
+        # ties). Only the row numbers are kept, not the rows.
+        winners = {}
+        for number, values in self._read(path):
+            best = winners.get(values['opis_id'])
+            if best is None or values['retail_price'] < best[1]:
+                winners[values['opis_id']] = (number, values['retail_price'])
+        keep = {number for number, _ in winners.values()}
+
+        # Pass 2: stream the winning rows into chunked upserts
+        chunk = []
+        chunk_size = max(1, options['chunk_size'])
+        for number, values in self._read(path, report=False):
+            if number not in keep:
+                continue
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                self._write_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._write_chunk(chunk)
+
+        if self.price_import is not None:
+            self.price_import.station_count = len(winners)
+            self.price_import.changed_count = self.price_changes
+            self.price_import.save(update_fields=['station_count', 'changed_count'])
+        if self.price_changes or self.relocated:
+            # Stored corridor plans were made with the old prices or places
+            invalidate_corridors()
+
+        elapsed = time.monotonic() - started
+        totals = self.totals
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {totals['rows']} rows ({len(winners)} stations) in {elapsed:.1f}s: "
+            f"{totals['created']} created, {totals['updated']} updated, "
+            f"{totals['unchanged']} unchanged, {totals['skipped']} skipped"
         ))
+        if self.relocated:
+            self.stderr.write(self.style.WARNING(
+                f"{self.relocated} stations changed address and need geocoding again: "
+                "run geocode_stations"
+            ))
+
+    def _read(self, path, report=True):
+        """Yield (row number, parsed values) for every valid CSV row"""
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            missing = set(COLUMNS) - set(reader.fieldnames or [])
+            if missing:
+                raise CommandError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+
+            for number, row in enumerate(reader):
+                if report:
+                    self.totals['rows'] += 1
+                try:
+                    values = parse_row(row)
+                except ValueError as e:
+                    if report:
+                        self.totals['skipped'] += 1
+                        self.stderr.write(self.style.WARNING(str(e)))
+                    continue
+                yield number, values
+
+    def _write_chunk(self, chunk):
+        """Upsert the stations in `chunk` that are new or whose data changed"""
+        existing = {
+            row[0]: row[1:]
+            for row in FuelStation.objects.filter(
+                opis_id__in=[values['opis_id'] for values in chunk]
+            ).values_list('opis_id', *COMPARED_FIELDS)
+        }
+
+        price_index = COMPARED_FIELDS.index('retail_price')
+        location_indexes = {field: COMPARED_FIELDS.index(field) for field in LOCATION_FIELDS}
+        changed = []
+        repriced = {}
+        relocated = []
+        for values in chunk:
+            current = existing.get(values['opis_id'])
+            if current is None:
+                self.totals['created'] += 1
+            elif current == tuple(values[field] for field in COMPARED_FIELDS):
+                self.totals['unchanged'] += 1
+                continue
+            else:
+                self.totals['updated'] += 1
+                # Coordinates geocoded from the old address no longer apply
+                if any(current[i] != values[field] for field, i in location_indexes.items()):
+                    relocated.append(values['opis_id'])
+            changed.append(FuelStation(**values))
+            if current is None or current[price_index] != values['retail_price']:
+                repriced[values['opis_id']] = values['retail_price']
+
+        if not changed:
+            return
 
-FuelStation.objects.bulk_create(stations)
-print(f"Imported {len(stations)} fuel stations")
\ No newline at end of file
+        with transaction.atomic():
+            if self.price_import is None:
+                self.price_import = PriceImport.objects.create(source=self.source, imported_at=self.imported_at)
+            FuelStation.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=['opis_id'],
+                update_fields=UPDATE_FIELDS
+            )
+            if relocated:
+                FuelStation.objects.filter(opis_id__in=relocated).update(latitude=None, longitude=None)
+                self.relocated += len(relocated)
+            if repriced:
+                ids = FuelStation.objects.filter(opis_id__in=list(repriced)).values_list('opis_id', 'id')
+                record_price_snapshots(
+                    self.price_import,
+                    {station_id: repriced[opis_id] for opis_id, station_id in ids}
+                )
+                self.price_changes += len(repriced)
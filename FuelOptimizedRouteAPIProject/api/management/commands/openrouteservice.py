@@ -1,11 +1,9 @@
-import requests
-import os
 from django.conf import settings
 
 def get_route(start, finish):
     api_key = settings.OPENROUTESERVICE_API_KEY
 
-    url = "https://api.openrouteservice.org"
+    url = settings.OPENROUTESERVICE_BASE_URL
     
     headers = {
         "Authorization": api_key,
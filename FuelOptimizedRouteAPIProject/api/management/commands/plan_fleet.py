@@ -0,0 +1,110 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.batch import BatchItem
+from api.fleet import FleetPlanner
+from api.persistence import route_totals
+from api.serializers import FleetVehicleSerializer, planning_options
+from api.services import RouteService
+
+
+class Command(BaseCommand):
+    help = (
+        "Plan fuel stops for a fleet. Reads a JSON file of vehicles shaped like "
+        "the POST /api/fleet/plan/ body (or a bare list of them) and writes one "
+        "NDJSON line per vehicle. Shared routes are fetched once and the "
+        "per-vehicle solves run on a process pool. Plans are not stored."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('vehicles_path', help="Path to the vehicles JSON file")
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Solver processes (default: FLEET_PLANNER_WORKERS, or one per CPU)"
+        )
+        parser.add_argument(
+            '--output', default=None,
+            help="Write the NDJSON plans to this file instead of stdout"
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['vehicles_path'])
+        if not path.exists():
+            raise CommandError(f"Vehicles file not found: {path}")
+        try:
+            payload = json.loads(path.read_text())
+        except ValueError as e:
+            raise CommandError(f"Invalid JSON in {path}: {e}")
+        vehicles = payload.get('vehicles', []) if isinstance(payload, dict) else payload
+
+        started = time.monotonic()
+        lines = []
+        vehicle_ids = []
+        items = []
+        for position, vehicle in enumerate(vehicles):
+            serializer = FleetVehicleSerializer(data=vehicle)
+            if not serializer.is_valid():
+                lines.append((position, {
+                    'vehicle_id': vehicle.get('vehicle_id') if isinstance(vehicle, dict) else None,
+                    'status': 'invalid',
+                    'errors': serializer.errors
+                }))
+                continue
+            data = serializer.validated_data
+            vehicle_ids.append((position, data['vehicle_id']))
+            items.append(BatchItem(
+                data['start_location'],
+                data['end_location'],
+                planning_options(data),
+                tuple(data.get('waypoints', ()))
+            ))
+
+        try:
+            planner = FleetPlanner(RouteService(), workers=options['workers'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        outcomes = planner.plan(items) if items else []
+
+        planned = 0
+        for (position, vehicle_id), item, outcome in zip(vehicle_ids, items, outcomes):
+            if outcome.error is not None:
+                lines.append((position, {'vehicle_id': vehicle_id, 'status': 'error', 'error': str(outcome.error)}))
+                continue
+            planned += 1
+            distance, gallons, cost = route_totals(
+                outcome.route_data, outcome.fuel_stops, item.options['fuel_efficiency_mpg']
+            )
+            lines.append((position, {
+                'vehicle_id': vehicle_id,
+                'status': 'ok',
+                'distance_miles': round(distance, 1),
+                'total_gallons_needed': round(gallons, 1),
+                'total_fuel_cost': round(cost, 2),
+                'fuel_stops': [
+                    {
+                        'station_id': stop['station'].id,
+                        'mile_marker': round(stop['distance_from_start'], 0),
+                        'gallons_to_fill': round(stop['gallons_to_fill'], 2),
+                        'price_per_gallon': stop['price_per_gallon'],
+                    }
+                    for stop in outcome.fuel_stops
+                ],
+            }))
+        lines.sort(key=lambda line: line[0])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                for _, line in lines:
+                    f.write(json.dumps(line) + '\n')
+        else:
+            for _, line in lines:
+                self.stdout.write(json.dumps(line))
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f"Planned {planned} of {len(vehicles)} vehicles in {elapsed:.1f}s "
+            f"({planner.unique_routes} distinct routes, {planner.workers} workers)"
+        ))
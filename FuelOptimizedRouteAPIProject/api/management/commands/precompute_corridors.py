@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.corridors import refresh_corridors
+from api.services import RouteService
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the routes, corridor stations and standard vehicle plans of "
+        "the POPULAR_ROUTE_PAIRS into the PrecomputedCorridor table. Pairs that "
+        "are missing, stale (prices changed) or older than "
+        "PRECOMPUTED_CORRIDOR_MAX_AGE_SECONDS are recomputed. With --loop the "
+        "command keeps running as the background refresher."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep refreshing every --interval seconds until interrupted"
+        )
+        parser.add_argument(
+            '--interval', type=float, default=60.0,
+            help="Seconds between refresh passes with --loop (default: 60)"
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Recompute every pair on the first pass, fresh or not"
+        )
+
+    def handle(self, *args, **options):
+        if not settings.POPULAR_ROUTE_PAIRS:
+            raise CommandError("POPULAR_ROUTE_PAIRS is empty; nothing to precompute")
+        try:
+            route_service = RouteService()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        force = options['force']
+        while True:
+            started = time.monotonic()
+            refreshed, failures = refresh_corridors(route_service, force=force)
+            force = False
+            for (start, end), error in failures:
+                self.stderr.write(self.style.WARNING(f"{start} → {end}: {error}"))
+            if refreshed or failures or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Precomputed {refreshed} of {len(settings.POPULAR_ROUTE_PAIRS)} pairs "
+                    f"in {time.monotonic() - started:.1f}s ({len(failures)} failed)"
+                ))
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
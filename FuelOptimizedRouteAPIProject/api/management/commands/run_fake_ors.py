@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.fake_ors import FakeORSServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local OpenRouteService stand-in (/geocode/search and "
+        "/v2/directions/driving-car/geojson) with synthetic geometry between "
+        "the bundled city centroids, for offline load tests and benchmarks. "
+        "Point OPENROUTESERVICE_BASE_URL at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on (default: 127.0.0.1)")
+        parser.add_argument('--port', type=int, default=8089, help="Port to listen on (default: 8089)")
+        parser.add_argument(
+            '--latency', type=float, default=0.0,
+            help="Seconds every request waits before answering (default: 0)"
+        )
+        parser.add_argument(
+            '--latency-jitter', type=float, default=0.0,
+            help="Extra random wait of up to this many seconds (default: 0)"
+        )
+        parser.add_argument(
+            '--error-rate', type=float, default=0.0,
+            help="Fraction of requests answered 503 (default: 0)"
+        )
+        parser.add_argument(
+            '--throttle-rate', type=float, default=0.0,
+            help="Fraction of requests answered 429 (default: 0)"
+        )
+        parser.add_argument(
+            '--retry-after', type=float, default=1.0,
+            help="Retry-After seconds sent with 429s (default: 1)"
+        )
+        parser.add_argument('--seed', type=int, default=None, help="Seed for latency and fault injection")
+        parser.add_argument('--api-key', default=None, help="Answer 403 unless this key is sent")
+        parser.add_argument('--quiet', action='store_true', help="Don't log requests")
+
+    def handle(self, *args, **options):
+        if not 0 <= options['error_rate'] + options['throttle_rate'] <= 1:
+            raise CommandError("--error-rate and --throttle-rate must add up to between 0 and 1")
+        try:
+            server = FakeORSServer(
+                host=options['host'],
+                port=options['port'],
+                latency=options['latency'],
+                latency_jitter=options['latency_jitter'],
+                error_rate=options['error_rate'],
+                throttle_rate=options['throttle_rate'],
+                retry_after=options['retry_after'],
+                seed=options['seed'],
+                api_key=options['api_key'],
+                verbose=not options['quiet']
+            )
+        except OSError as e:
+            raise CommandError(f"Could not listen on {options['host']}:{options['port']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake ORS listening on {server.url} (OPENROUTESERVICE_BASE_URL={server.url}); Ctrl-C to stop"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(
+            f"Served {server.counts['geocode']} geocode and {server.counts['directions']} directions requests"
+        )
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:45
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe_stations(apps, schema_editor):
+    """
+    Keep one row per opis_id before adding the unique constraint: the
+    geocoded row with the lowest price wins, and fuel stops pointing at
+    the others are moved onto it.
+    """
+    FuelStation = apps.get_model('api', 'FuelStation')
+    FuelStop = apps.get_model('api', 'FuelStop')
+
+    duplicated = (
+        FuelStation.objects.values('opis_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+        .values_list('opis_id', flat=True)
+    )
+    for opis_id in list(duplicated):
+        rows = sorted(
+            FuelStation.objects.filter(opis_id=opis_id).values('id', 'latitude', 'retail_price'),
+            key=lambda row: (row['latitude'] is None, row['retail_price'], row['id'])
+        )
+        keep, *drop = [row['id'] for row in rows]
+        FuelStop.objects.filter(fuel_station_id__in=drop).update(fuel_station_id=keep)
+        FuelStation.objects.filter(id__in=drop).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_stations, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='fuelstation',
+            name='opis_id',
+            field=models.IntegerField(unique=True),
+        ),
+    ]
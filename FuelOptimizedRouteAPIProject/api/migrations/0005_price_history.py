@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:47
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def snapshot_current_prices(apps, schema_editor):
+    """Record the prices already loaded as the first import"""
+    FuelStation = apps.get_model('api', 'FuelStation')
+    PriceImport = apps.get_model('api', 'PriceImport')
+    FuelPriceSnapshot = apps.get_model('api', 'FuelPriceSnapshot')
+
+    first_loaded = FuelStation.objects.aggregate(at=models.Min('created_at'))['at']
+    if first_loaded is None:
+        return
+
+    stations = FuelStation.objects.values_list('id', 'retail_price')
+    price_import = PriceImport.objects.create(
+        source='existing stations',
+        imported_at=first_loaded,
+        station_count=stations.count(),
+        changed_count=stations.count()
+    )
+    FuelPriceSnapshot.objects.bulk_create(
+        (
+            FuelPriceSnapshot(
+                station_id=station_id,
+                price_import=price_import,
+                retail_price=price,
+                effective_at=first_loaded
+            )
+            for station_id, price in stations.iterator(chunk_size=2000)
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_fuelstation_unique_opis_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(blank=True, max_length=255)),
+                ('imported_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('station_count', models.PositiveIntegerField(default=0)),
+                ('changed_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-imported_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FuelPriceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retail_price', models.DecimalField(decimal_places=5, max_digits=6, validators=[django.core.validators.MinValueValidator(0)])),
+                ('effective_at', models.DateTimeField()),
+                ('price_import', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='api.priceimport')),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_snapshots', to='api.fuelstation')),
+            ],
+            options={
+                'ordering': ['station', '-effective_at'],
+                'indexes': [models.Index(fields=['station', 'effective_at'], name='api_fuelpri_station_652895_idx')],
+                'unique_together': {('station', 'price_import')},
+            },
+        ),
+        migrations.RunPython(snapshot_current_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_price_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='waypoints',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
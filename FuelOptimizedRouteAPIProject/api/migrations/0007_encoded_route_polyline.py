@@ -0,0 +1,95 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:05
+
+import json
+import math
+
+from django.db import migrations, models
+
+# Frozen copies of api.polyline and the tolerance settings as of this
+# migration, so later changes to either don't alter what it writes
+POLYLINE_PRECISION = 5
+METERS_PER_DEGREE = 111320.0
+FULL_TOLERANCE_METERS = 5.0
+SIMPLIFIED_TOLERANCE_METERS = 500.0
+
+
+def encode_polyline(coords):
+    """Encoded polyline (lat, lng order) for [[lon, lat], ...] coordinates"""
+    chars = []
+    previous = (0, 0)
+    for lon, lat in ((point[0], point[1]) for point in coords):
+        current = (round(lat * 10 ** POLYLINE_PRECISION), round(lon * 10 ** POLYLINE_PRECISION))
+        for delta in (current[0] - previous[0], current[1] - previous[1]):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chars.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chars.append(chr(value + 63))
+        previous = current
+    return ''.join(chars)
+
+
+def simplify_line(coords, tolerance_meters):
+    """Douglas-Peucker simplification of [[lon, lat], ...] coordinates"""
+    if len(coords) < 3:
+        return coords
+
+    scale = math.cos(math.radians(sum(point[1] for point in coords) / len(coords)))
+    xy = [(point[0] * scale, point[1]) for point in coords]
+    tolerance = tolerance_meters / METERS_PER_DEGREE
+
+    keep = [False] * len(coords)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        (ax, ay), (bx, by) = xy[start], xy[end]
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+
+        farthest, distance = None, -1.0
+        for i in range(start + 1, end):
+            px, py = xy[i]
+            t = min(max(((px - ax) * dx + (py - ay) * dy) / length_sq, 0.0), 1.0) if length_sq else 0.0
+            d = math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+            if d > distance:
+                farthest, distance = i, d
+        if distance > tolerance:
+            keep[farthest] = True
+            stack.append((start, farthest))
+            stack.append((farthest, end))
+
+    return [point for point, kept in zip(coords, keep) if kept]
+
+
+def encode_stored_lines(apps, schema_editor):
+    """Re-encode route lines stored as GeoJSON text before this migration"""
+    Route = apps.get_model('api', 'Route')
+    routes = Route.objects.filter(route_polyline__startswith='{').only('id', 'route_polyline')
+    for route in routes.iterator(chunk_size=200):
+        try:
+            coords = json.loads(route.route_polyline).get('coordinates', [])
+        except ValueError:
+            continue
+        Route.objects.filter(pk=route.pk).update(
+            route_polyline=encode_polyline(simplify_line(coords, FULL_TOLERANCE_METERS)),
+            route_polyline_simplified=encode_polyline(simplify_line(coords, SIMPLIFIED_TOLERANCE_METERS)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_route_waypoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='route_polyline_simplified',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(encode_stored_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_encoded_route_polyline'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['-created_at', '-id'], name='api_route_created_00dffa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['start_location', '-created_at', '-id'], name='api_route_start_l_dd8176_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['end_location', '-created_at', '-id'], name='api_route_end_loc_b3d572_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_route_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedCorridor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pair_key', models.CharField(max_length=511, unique=True)),
+                ('start_location', models.CharField(max_length=255)),
+                ('end_location', models.CharField(max_length=255)),
+                ('start', models.JSONField()),
+                ('end', models.JSONField()),
+                ('route_payload', models.BinaryField()),
+                ('stations', models.JSONField(default=list)),
+                ('plans', models.JSONField(default=dict)),
+                ('stale', models.BooleanField(default=False)),
+                ('computed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['pair_key'],
+            },
+        ),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+
+from .polyline import decode_polyline
 
 class FuelStation(models.Model):
     """Fuel station with pricing information from CSV"""
-    opis_id = models.IntegerField(db_index=True)
+    opis_id = models.IntegerField(unique=True)
     name = models.CharField(max_length=255)
     address = models.CharField(max_length=255)
     city = models.CharField(max_length=100, db_index=True)
@@ -48,6 +51,8 @@ class Route(models.Model):
     """Calculated route with fuel stops"""
     start_location = models.CharField(max_length=255)
     end_location = models.CharField(max_length=255)
+    # Intermediate stops, in visiting order
+    waypoints = models.JSONField(default=list, blank=True)
     
     # Route details
     total_distance_miles = models.DecimalField(
@@ -66,8 +71,10 @@ class Route(models.Model):
         validators=[MinValueValidator(0)]
     )
     
-    # Route polyline from mapping API
+    # Route line from the mapping API as encoded polylines: near-full
+    # resolution and a coarse version for listings
     route_polyline = models.TextField(blank=True)
+    route_polyline_simplified = models.TextField(blank=True)
     
     # Vehicle assumptions
     fuel_efficiency_mpg = models.DecimalField(
@@ -85,10 +92,23 @@ class Route(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        # History listings: keyset order and the location filters
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['start_location', '-created_at', '-id']),
+            models.Index(fields=['end_location', '-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.start_location} → {self.end_location}"
 
+    def geometry(self, simplified=False):
+        """Route line as a GeoJSON LineString, decoded on demand"""
+        encoded = self.route_polyline
+        if simplified and self.route_polyline_simplified:
+            encoded = self.route_polyline_simplified
+        return {'type': 'LineString', 'coordinates': decode_polyline(encoded)}
+
 class FuelStop(models.Model):
     """Optimal fuel stop along a route"""
     route = models.ForeignKey(
@@ -129,3 +149,113 @@ class FuelStop(models.Model):
 
     def __str__(self):
         return f"Stop #{self.stop_order}: {self.fuel_station.name} (${self.cost_at_stop})"
+
+
+class GeocodeCacheEntry(models.Model):
+    """Persistent geocoding result keyed on normalized location text"""
+    query_key = models.CharField(max_length=255, unique=True)
+    query = models.CharField(max_length=255)
+
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    display_name = models.CharField(max_length=255)
+    properties = models.JSONField(default=dict, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['query_key']
+
+    def __str__(self):
+        return f"{self.query} → {self.display_name}"
+
+    def to_result(self):
+        """Rebuild the dict returned by RouteService.geocode_location"""
+        return {
+            'lat': self.latitude,
+            'lon': self.longitude,
+            'display_name': self.display_name,
+            'properties': self.properties,
+        }
+
+
+class PriceImport(models.Model):
+    """One run of the fuel price importer"""
+    source = models.CharField(max_length=255, blank=True)
+    imported_at = models.DateTimeField(default=timezone.now, db_index=True)
+    station_count = models.PositiveIntegerField(default=0)
+    changed_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-imported_at']
+
+    def __str__(self):
+        return f"Import #{self.pk} at {self.imported_at:%Y-%m-%d %H:%M} ({self.changed_count} changed)"
+
+
+class FuelPriceSnapshot(models.Model):
+    """
+    A station's price as set by one import. Only new or changed prices are
+    recorded, so a station's price at time T is its latest snapshot with
+    effective_at <= T.
+    """
+    station = models.ForeignKey(
+        FuelStation,
+        related_name='price_snapshots',
+        on_delete=models.CASCADE
+    )
+    price_import = models.ForeignKey(
+        PriceImport,
+        related_name='snapshots',
+        on_delete=models.CASCADE
+    )
+    retail_price = models.DecimalField(
+        max_digits=6,
+        decimal_places=5,
+        validators=[MinValueValidator(0)]
+    )
+    # Copy of price_import.imported_at so "as of" lookups stay on one index
+    effective_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['station', '-effective_at']
+        unique_together = ['station', 'price_import']
+        indexes = [
+            models.Index(fields=['station', 'effective_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.station_id} @ {self.effective_at:%Y-%m-%d}: ${self.retail_price}"
+
+
+class PrecomputedCorridor(models.Model):
+    """
+    Route, corridor stations and standard refuelling plans for one
+    popular origin/destination pair, kept by precompute_corridors
+    """
+    # normalize_location() of both ends, joined by '|'
+    pair_key = models.CharField(max_length=511, unique=True)
+    start_location = models.CharField(max_length=255)
+    end_location = models.CharField(max_length=255)
+
+    # Geocode dicts of both ends and the directions result (pack_route)
+    start = models.JSONField()
+    end = models.JSONField()
+    route_payload = models.BinaryField()
+
+    # [[station_id, route_mile], ...] within the corridor, by route mile
+    stations = models.JSONField(default=list)
+    # {'mpg:tank_range': [[station_id, route_mile, gallons, price], ...]}
+    plans = models.JSONField(default=dict)
+
+    # Set when prices change; the route is still used, plans are not
+    stale = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['pair_key']
+
+    def __str__(self):
+        return f"{self.start_location} → {self.end_location}"
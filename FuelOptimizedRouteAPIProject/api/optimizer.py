@@ -0,0 +1,136 @@
+from collections import namedtuple
+
+# A candidate station on the route and one purchase in a refuelling plan
+Candidate = namedtuple('Candidate', ['route_mile', 'price', 'payload'])
+Purchase = namedtuple('Purchase', ['route_mile', 'price', 'gallons', 'payload'])
+
+
+def plan_refuelling(candidates, total_distance, fuel_efficiency_mpg, tank_range_miles,
+                    start_fuel_fraction=1.0, reserve_miles=0.0):
+    """
+    Cheapest refuelling plan along a fixed route (the "gas station problem").
+
+    Greedy strategy that is optimal for a fixed route with linear prices:
+    at each station, if a cheaper station is reachable on a full tank, buy
+    just enough fuel to get there; otherwise fill up and continue to the
+    cheapest station in range. Partial fills fall out naturally.
+
+    Args:
+        candidates: Candidate tuples (route_mile, price per gallon, payload)
+        total_distance: Route length in miles
+        fuel_efficiency_mpg: Vehicle fuel efficiency
+        tank_range_miles: Range on a full tank
+        start_fuel_fraction: Tank level at departure (0-1)
+        reserve_miles: Range that must be left in the tank at every stop
+            and at the destination
+
+    Returns:
+        list of Purchase tuples ordered by route mile
+
+    Raises:
+        ValueError: if some stretch of the route cannot be covered
+    """
+    usable_range = tank_range_miles - reserve_miles
+    if usable_range <= 0:
+        raise ValueError("Reserve margin must be smaller than the tank range")
+
+    # Fuel is tracked in "miles of range above the reserve"
+    fuel = tank_range_miles * start_fuel_fraction - reserve_miles
+    if fuel < 0:
+        raise ValueError("Starting fuel is below the reserve margin")
+    if total_distance <= fuel:
+        return []
+
+    # Stations strictly inside the route, plus the destination as a free
+    # "station" that is cheaper than anything else
+    stations = sorted(
+        (c for c in candidates if 0 <= c.route_mile < total_distance),
+        key=lambda c: (c.route_mile, c.price)
+    )
+    miles = [c.route_mile for c in stations] + [total_distance]
+    prices = [float(c.price) for c in stations] + [0.0]
+    last = len(stations)
+
+    # next_cheaper[i]: first node after i with a strictly lower price
+    next_cheaper = [last] * (last + 1)
+    stack = []
+    for i in range(last, -1, -1):
+        while stack and prices[stack[-1]] >= prices[i]:
+            stack.pop()
+        next_cheaper[i] = stack[-1] if stack else last
+        stack.append(i)
+
+    def cheapest_within(start, limit_mile):
+        """Cheapest node after `start` reachable by limit_mile (farthest on ties)"""
+        best = None
+        j = start + 1
+        while j <= last and miles[j] <= limit_mile:
+            if best is None or prices[j] <= prices[best]:
+                best = j
+            j += 1
+        return best
+
+    purchases = []
+
+    # From the start we can only use the fuel already in the tank
+    current = cheapest_within(-1, fuel)
+    if current is None:
+        raise ValueError(
+            f"No fuel station within {fuel:.0f} miles of the start of the route"
+        )
+    fuel -= miles[current]
+
+    while current != last:
+        position = miles[current]
+        target = next_cheaper[current]
+
+        if miles[target] - position <= usable_range:
+            # Buy only what is needed to reach the next cheaper station
+            needed = miles[target] - position - fuel
+        else:
+            # Nothing cheaper in range: fill up, move to the cheapest in range
+            target = cheapest_within(current, position + usable_range)
+            if target is None:
+                raise ValueError(
+                    f"No reachable fuel station between mile {position:.0f} "
+                    f"and mile {miles[current + 1]:.0f}"
+                )
+            needed = usable_range - fuel
+
+        if needed > 1e-9:
+            station = stations[current]
+            purchases.append(Purchase(
+                route_mile=station.route_mile,
+                price=station.price,
+                gallons=needed / fuel_efficiency_mpg,
+                payload=station.payload
+            ))
+            fuel += needed
+
+        fuel -= miles[target] - position
+        current = target
+
+    return purchases
+
+
+def fuel_on_arrival(purchases, checkpoints, fuel_efficiency_mpg, tank_range_miles,
+                    start_fuel_fraction=1.0):
+    """
+    Gallons left in the tank on reaching each route mile in `checkpoints`
+    (e.g. the waypoints of a multi-leg route) under a refuelling plan.
+
+    Args:
+        purchases: (route_mile, gallons) pairs
+        checkpoints: Route miles, in any order
+
+    Returns:
+        list of gallons, one per checkpoint; fuel bought at a checkpoint's
+        own mile is not counted yet
+    """
+    purchases = sorted(purchases)
+    start_gallons = tank_range_miles * start_fuel_fraction / fuel_efficiency_mpg
+    levels = []
+    for mile in checkpoints:
+        bought = sum(gallons for route_mile, gallons in purchases if route_mile < mile)
+        levels.append(max(0.0, start_gallons + bought - mile / fuel_efficiency_mpg))
+    return levels
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .breaker import CircuitOpenError, get_circuit_breaker
+from .ratelimit import AsyncSingleFlight, RateLimitTimeout, SingleFlight, get_rate_limiter
+
+# Upstream statuses worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses that count against the circuit breaker. A 429 is back-pressure
+# from a working ORS (the rate limiter pauses for it), not an outage.
+BREAKER_STATUSES = RETRY_STATUSES - {429}
+
+GEOCODE_PATH = '/geocode/search'
+DIRECTIONS_PATH = '/v2/directions/{profile}/geojson'
+
+
+class ORSRequestError(requests.exceptions.RequestException):
+    """
+    Transport or HTTP error from the async client, or a body either client
+    couldn't decode, raised as a requests exception so callers handle both
+    clients the same way
+    """
+
+
+def backoff_delay(attempt, base, cap=10.0, retry_after=None):
+    """Full-jitter exponential backoff, honouring Retry-After when given"""
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_upstream_failure(error):
+    """
+    True when a requests exception from the clients means ORS itself is
+    failing or unreachable (open circuit, rate limit, transport error,
+    retryable status) rather than rejecting this particular request
+    """
+    if isinstance(error, (CircuitOpenError, RateLimitTimeout)):
+        return True
+    response = getattr(error, 'response', None)
+    return response is None or response.status_code in RETRY_STATUSES
+
+
+def request_key(method, path, kwargs):
+    """Identity of an upstream request, for coalescing identical calls"""
+    return method, path, json.dumps(kwargs, sort_keys=True, default=str)
+
+
+class BaseORSClient:
+    """Settings and request building shared by the sync and async clients"""
+
+    def __init__(self, api_key, base_url, timeouts=None, max_retries=None, backoff=None, pool_size=None,
+                 limiter=None, breakers=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeouts = timeouts or {
+            'connect': settings.ORS_CONNECT_TIMEOUT,
+            'geocode': settings.ORS_GEOCODE_TIMEOUT,
+            'directions': settings.ORS_DIRECTIONS_TIMEOUT,
+        }
+        self.max_retries = settings.ORS_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.ORS_RETRY_BACKOFF if backoff is None else backoff
+        self.pool_size = pool_size or settings.ORS_POOL_SIZE
+        # Shared with every process on the host, so bursts stay under quota
+        self.limiter = limiter or get_rate_limiter()
+        self.max_wait = settings.ORS_RATE_LIMIT_MAX_WAIT
+        # Fail fast while an endpoint is down instead of waiting out timeouts
+        self.breakers = breakers or {
+            endpoint: get_circuit_breaker(endpoint) for endpoint in ('geocode', 'directions')
+        }
+        self.headers = {
+            'Authorization': api_key,
+            'Content-Type': 'application/json',
+        }
+
+    def _geocode_request(self, text, size):
+        return 'geocode', 'GET', GEOCODE_PATH, {'params': {'text': text, 'size': size}}
+
+    def _directions_request(self, coordinates, profile, options):
+        payload = {'coordinates': coordinates, 'instructions': False, **options}
+        return 'directions', 'POST', DIRECTIONS_PATH.format(profile=profile), {'json': payload}
+
+    def _record_status(self, breaker, status_code, elapsed):
+        """Tell the breaker about an error status: 5xx is an outage, 4xx means ORS is up"""
+        if status_code in BREAKER_STATUSES:
+            breaker.record_failure()
+        else:
+            breaker.record_success(elapsed)
+
+    def _decode(self, breaker, response, elapsed):
+        """
+        JSON body of a successful response. A body that isn't JSON counts
+        against the breaker like a 5xx and is raised as ORSRequestError
+        without a response, so is_upstream_failure() holds for it.
+        """
+        try:
+            data = response.json()
+        except ValueError as e:
+            breaker.record_failure()
+            raise ORSRequestError(f"Invalid JSON from ORS: {e}") from e
+        breaker.record_success(elapsed)
+        return data
+
+
+class ORSClient(BaseORSClient):
+    """
+    Pooled keep-alive client for OpenRouteService.
+
+    One requests.Session per client, so connections (and their TLS
+    sessions) are reused across calls and threads. Every attempt takes a
+    token from the shared rate limiter first, and identical requests made
+    while one is in flight wait for its response.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flights = SingleFlight()
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=0
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, endpoint, method, path, **kwargs):
+        """
+        Send a request with per-endpoint timeouts and jittered retries.
+
+        Returns the decoded JSON body; raises requests exceptions.
+        """
+        return self.flights.do(
+            request_key(method, path, kwargs),
+            lambda: self._send(endpoint, method, path, **kwargs)
+        )
+
+    def _send(self, endpoint, method, path, **kwargs):
+        url = f"{self.base_url}{path}"
+        timeout = (self.timeouts['connect'], self.timeouts[endpoint])
+
+        breaker = self.breakers[endpoint]
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            breaker.before_call()
+            self.limiter.acquire(endpoint, self.max_wait)
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                breaker.record_failure()
+                if last_attempt:
+                    raise
+                time.sleep(backoff_delay(attempt, self.backoff))
+                continue
+
+            elapsed = time.monotonic() - started
+            if response.status_code >= 400:
+                self._record_status(breaker, response.status_code, elapsed)
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                delay = backoff_delay(attempt, self.backoff, retry_after=response.headers.get('Retry-After'))
+                if response.status_code == 429:
+                    # Over quota: hold back every process, not just this call
+                    self.limiter.pause(endpoint, delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            return self._decode(breaker, response, elapsed)
+
+    def geocode(self, text, size=1):
+        endpoint, method, path, kwargs = self._geocode_request(text, size)
+        return self.request(endpoint, method, path, **kwargs)
+
+    def directions(self, coordinates, profile='driving-car', **options):
+        endpoint, method, path, kwargs = self._directions_request(coordinates, profile, options)
+        return self.request(endpoint, method, path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncORSClient(BaseORSClient):
+    """asyncio counterpart of ORSClient built on a pooled httpx.AsyncClient"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flights = AsyncSingleFlight()
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size
+            )
+        )
+
+    async def request(self, endpoint, method, path, **kwargs):
+        """Async version of ORSClient.request; raises ORSRequestError"""
+        return await self.flights.do(
+            request_key(method, path, kwargs),
+            lambda: self._send(endpoint, method, path, **kwargs)
+        )
+
+    async def _send(self, endpoint, method, path, **kwargs):
+        timeout = httpx.Timeout(self.timeouts[endpoint], connect=self.timeouts['connect'])
+
+        breaker = self.breakers[endpoint]
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            breaker.before_call()
+            await self.limiter.aacquire(endpoint, self.max_wait)
+            started = time.monotonic()
+            try:
+                response = await self.client.request(method, path, timeout=timeout, **kwargs)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                if last_attempt:
+                    raise ORSRequestError(str(e) or type(e).__name__) from e
+                await asyncio.sleep(backoff_delay(attempt, self.backoff))
+                continue
+
+            elapsed = time.monotonic() - started
+            if response.status_code >= 400:
+                self._record_status(breaker, response.status_code, elapsed)
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                delay = backoff_delay(attempt, self.backoff, retry_after=response.headers.get('Retry-After'))
+                if response.status_code == 429:
+                    await self.limiter.apause(endpoint, delay)
+                else:
+                    await asyncio.sleep(delay)
+                continue
+
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                raise ORSRequestError(str(e), response=e.response) from e
+            return self._decode(breaker, response, elapsed)
+
+    async def geocode(self, text, size=1):
+        endpoint, method, path, kwargs = self._geocode_request(text, size)
+        return await self.request(endpoint, method, path, **kwargs)
+
+    async def directions(self, coordinates, profile='driving-car', **options):
+        endpoint, method, path, kwargs = self._directions_request(coordinates, profile, options)
+        return await self.request(endpoint, method, path, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_ors_client(api_key, base_url):
+    """Process-wide pooled client per (api_key, base_url)"""
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = ORSClient(api_key, base_url)
+        return client
+
+
+def get_async_ors_client(api_key, base_url):
+    """
+    Pooled async client for the running event loop. httpx connections
+    are bound to a loop, so each loop gets its own client.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    key = (api_key, base_url)
+    client = clients.get(key)
+    if client is None:
+        client = clients[key] = AsyncORSClient(api_key, base_url)
+    return client
@@ -0,0 +1,223 @@
+import logging
+import queue
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .models import FuelStop, Route
+from .polyline import encode_polyline, simplify_line
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_MODES = ('sync', 'background', 'off')
+
+
+def route_totals(route_data, fuel_stops, fuel_efficiency_mpg):
+    """(distance, gallons, cost) for a calculated route"""
+    total_distance = route_data['distance_miles']
+    total_gallons = total_distance / fuel_efficiency_mpg
+    total_cost = sum(stop['cost'] for stop in fuel_stops)
+    return total_distance, total_gallons, total_cost
+
+
+def encode_route_line(geometry):
+    """Route.route_polyline / route_polyline_simplified values for a GeoJSON line"""
+    coords = geometry.get('coordinates', [])
+    return {
+        'route_polyline': encode_polyline(
+            simplify_line(coords, settings.ROUTE_POLYLINE_TOLERANCE_METERS)
+        ),
+        'route_polyline_simplified': encode_polyline(
+            simplify_line(coords, settings.ROUTE_POLYLINE_SIMPLIFIED_TOLERANCE_METERS)
+        ),
+    }
+
+
+def build_route_rows(route_data, fuel_stops, fuel_efficiency_mpg, tank_range_miles):
+    """
+    Unsaved Route and FuelStop instances for a calculated route.
+
+    Values are rounded to each column's decimal places and handed to the
+    DecimalFields as floats; the database adapter quantizes them directly.
+    """
+    total_distance, total_gallons, total_cost = route_totals(route_data, fuel_stops, fuel_efficiency_mpg)
+    route = Route(
+        start_location=route_data['start']['display_name'],
+        end_location=route_data['end']['display_name'],
+        waypoints=[waypoint.get('display_name', '') for waypoint in route_data.get('waypoints', [])],
+        total_distance_miles=round(total_distance, 2),
+        total_fuel_cost=round(total_cost, 2),
+        total_gallons_needed=round(total_gallons, 2),
+        fuel_efficiency_mpg=round(fuel_efficiency_mpg, 2),
+        tank_range_miles=round(tank_range_miles, 2),
+        **encode_route_line(route_data['geometry'])
+    )
+    stops = [
+        FuelStop(
+            route=route,
+            fuel_station_id=stop['station'].id,
+            stop_order=stop['stop_order'],
+            distance_from_start_miles=round(stop['distance_from_start'], 2),
+            gallons_to_fill=round(stop['gallons_to_fill'], 2),
+            cost_at_stop=round(stop['cost'], 2),
+            latitude=round(stop['latitude'], 7),
+            longitude=round(stop['longitude'], 7)
+        )
+        for stop in fuel_stops
+    ]
+    return route, stops
+
+
+def save_routes(rows):
+    """
+    Insert (route, stops) pairs in one transaction: one bulk insert for
+    the routes and one for all of their stops
+    """
+    routes = [route for route, _ in rows]
+    with transaction.atomic():
+        if len(routes) > 1 and connection.features.can_return_rows_from_bulk_insert:
+            Route.objects.bulk_create(routes)
+        else:
+            for route in routes:
+                route.save(force_insert=True)
+
+        stops = []
+        for route, route_stops in rows:
+            for stop in route_stops:
+                # Re-assign so route_id picks up the new primary key
+                stop.route = route
+                stops.append(stop)
+        FuelStop.objects.bulk_create(stops)
+    return routes
+
+
+def save_route(route_data, fuel_stops, fuel_efficiency_mpg, tank_range_miles):
+    """Store one calculated route with its stops; returns the Route"""
+    rows = build_route_rows(route_data, fuel_stops, fuel_efficiency_mpg, tank_range_miles)
+    return save_routes([rows])[0]
+
+
+class RouteWriter:
+    """
+    Write-behind queue for calculated routes.
+
+    Requests enqueue their rows and return; a single writer thread drains
+    the queue and stores up to batch_size routes per transaction, so
+    concurrent requests never wait on each other for the SQLite write
+    lock. When the queue is full callers fall back to writing themselves.
+    """
+
+    def __init__(self, max_size=None, batch_size=None):
+        self.queue = queue.Queue(maxsize=max_size or settings.ROUTE_PERSISTENCE_QUEUE_SIZE)
+        self.batch_size = batch_size or settings.ROUTE_PERSISTENCE_BATCH_SIZE
+        self.written = 0
+        self.failed = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, rows):
+        """Queue (route, stops) rows; returns False if the queue is full"""
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            return False
+        return True
+
+    def flush(self):
+        """Block until everything submitted so far is written"""
+        self.queue.join()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='route-writer', daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                close_old_connections()
+                save_routes(batch)
+                self.written += len(batch)
+            except Exception:
+                self.failed += len(batch)
+                logger.exception("Failed to store %d calculated routes", len(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+
+_route_writer = None
+_route_writer_lock = threading.Lock()
+
+
+def get_route_writer():
+    """Process-wide RouteWriter"""
+    global _route_writer
+    if _route_writer is None:
+        with _route_writer_lock:
+            if _route_writer is None:
+                _route_writer = RouteWriter()
+    return _route_writer
+
+
+def persist_route(route_data, fuel_stops, fuel_efficiency_mpg, tank_range_miles, mode=None):
+    """
+    Store a calculated route according to ROUTE_PERSISTENCE_MODE.
+
+    Returns the saved Route in 'sync' mode and None otherwise.
+    """
+    routes = persist_routes([(route_data, fuel_stops, fuel_efficiency_mpg, tank_range_miles)], mode)
+    return routes[0] if routes else None
+
+
+def persist_routes(calculated, mode=None):
+    """
+    Store several calculated routes, given as (route_data, fuel_stops,
+    fuel_efficiency_mpg, tank_range_miles) tuples. In 'sync' mode they
+    share one transaction and one bulk insert per table.
+
+    Degraded routes (served while ORS was unavailable) are not stored.
+
+    Returns the Routes written by the caller (none unless 'sync', or the
+    background queue was full).
+    """
+    mode = mode or settings.ROUTE_PERSISTENCE_MODE
+    if mode not in PERSISTENCE_MODES:
+        raise ValueError(f"Unknown ROUTE_PERSISTENCE_MODE '{mode}'")
+    if mode == 'off':
+        return []
+
+    rows = [build_route_rows(*route) for route in calculated if not route[0].get('degraded')]
+    if mode == 'background':
+        writer = get_route_writer()
+        rows = [route_rows for route_rows in rows if not writer.submit(route_rows)]
+    return save_routes(rows) if rows else []
+
+
+async def apersist_route(route_data, fuel_stops, fuel_efficiency_mpg, tank_range_miles, mode=None):
+    """persist_route() for async views; the database is only touched off the event loop"""
+    mode = mode or settings.ROUTE_PERSISTENCE_MODE
+    if mode not in PERSISTENCE_MODES:
+        raise ValueError(f"Unknown ROUTE_PERSISTENCE_MODE '{mode}'")
+    if mode == 'off' or route_data.get('degraded'):
+        return None
+
+    rows = build_route_rows(route_data, fuel_stops, fuel_efficiency_mpg, tank_range_miles)
+    if mode == 'background' and get_route_writer().submit(rows):
+        return None
+    routes = await sync_to_async(save_routes)([rows])
+    return routes[0]
@@ -0,0 +1,83 @@
+import numpy as np
+
+# Encoded polylines carry 5 decimal places (~1 m), the common default
+POLYLINE_PRECISION = 5
+METERS_PER_DEGREE = 111320.0
+
+
+def encode_polyline(coords, precision=POLYLINE_PRECISION):
+    """
+    Encoded polyline string for GeoJSON-ordered [[lon, lat], ...]
+    coordinates. The output uses the usual (lat, lng) order, so any
+    standard polyline decoder reads it.
+    """
+    if not len(coords):
+        return ''
+    points = np.round(np.asarray(coords, dtype=float)[:, 1::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chars = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
+
+
+def decode_polyline(text, precision=POLYLINE_PRECISION):
+    """GeoJSON-ordered [[lon, lat], ...] coordinates from an encoded polyline"""
+    values = []
+    result = shift = 0
+    for byte in text.encode('ascii'):
+        chunk = byte - 63
+        result |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+            result = shift = 0
+
+    if not values:
+        return []
+    points = np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0)
+    return (points[:, ::-1] / 10 ** precision).tolist()
+
+
+def simplify_line(coords, tolerance_meters):
+    """
+    Douglas-Peucker simplification of [[lon, lat], ...] coordinates.
+
+    Points are dropped while the line stays within tolerance_meters of
+    the original. Distances use an equirectangular projection around the
+    line's mean latitude, which is accurate enough at these tolerances.
+    """
+    points = np.asarray(coords, dtype=float)
+    if len(points) < 3 or tolerance_meters <= 0:
+        return points.tolist()
+
+    xy = points[:, :2] * [np.cos(np.radians(points[:, 1].mean())), 1.0]
+    tolerance = tolerance_meters / METERS_PER_DEGREE
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = xy[start], xy[end]
+        inner = xy[start + 1:end]
+        direction = b - a
+        length_sq = direction @ direction
+        t = np.clip((inner - a) @ direction / length_sq, 0.0, 1.0) if length_sq else np.zeros(len(inner))
+        distances = np.hypot(*(inner - (a + t[:, None] * direction)).T)
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return points[keep].tolist()
@@ -0,0 +1,56 @@
+from django.db.models import OuterRef, Subquery
+
+from .models import FuelPriceSnapshot, FuelStation
+
+# Station ids per "as of" query, keeps the IN (...) list under SQLite's limits
+PRICE_QUERY_CHUNK = 900
+
+
+def price_as_of_subquery(when, station_ref='pk'):
+    """
+    Subquery for a station's price at `when`: its latest snapshot with
+    effective_at <= when, served by the (station, effective_at) index
+    """
+    return Subquery(
+        FuelPriceSnapshot.objects.filter(
+            station=OuterRef(station_ref),
+            effective_at__lte=when
+        ).order_by('-effective_at').values('retail_price')[:1]
+    )
+
+
+def annotate_price_as_of(queryset, when, name='price_as_of'):
+    """FuelStation queryset annotated with each station's price at `when`"""
+    return queryset.annotate(**{name: price_as_of_subquery(when)})
+
+
+def prices_as_of(station_ids, when):
+    """
+    {station_id: Decimal price} at `when`. Stations with no snapshot at or
+    before `when` (not yet imported) are left out.
+    """
+    station_ids = list(station_ids)
+    prices = {}
+    for start in range(0, len(station_ids), PRICE_QUERY_CHUNK):
+        rows = annotate_price_as_of(
+            FuelStation.objects.filter(id__in=station_ids[start:start + PRICE_QUERY_CHUNK]),
+            when
+        ).values_list('id', 'price_as_of')
+        prices.update((station_id, price) for station_id, price in rows if price is not None)
+    return prices
+
+
+def record_price_snapshots(price_import, prices):
+    """Store {station_id: price} as the snapshots of one import"""
+    FuelPriceSnapshot.objects.bulk_create(
+        [
+            FuelPriceSnapshot(
+                station_id=station_id,
+                price_import=price_import,
+                retail_price=price,
+                effective_at=price_import.imported_at
+            )
+            for station_id, price in prices.items()
+        ],
+        batch_size=1000
+    )
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+class RateLimitTimeout(requests.exceptions.RequestException):
+    """
+    No token became available within the allowed wait. Raised as a
+    requests exception so callers handle it like any other ORS failure.
+    """
+
+
+class TokenBucket:
+    """
+    Token buckets shared by every process that opens the same SQLite file.
+
+    Each named bucket refills at `rates[name]` tokens per second up to
+    `burst` tokens. A take runs in a BEGIN IMMEDIATE transaction, so
+    concurrent processes and threads serialize on the file lock and never
+    spend the same token twice. Buckets without a rate are unlimited.
+    """
+
+    def __init__(self, path, rates, burst=1):
+        self.path = str(path)
+        self.rates = {name: rate for name, rate in rates.items() if rate > 0}
+        self.burst = max(1.0, float(burst))
+        self._local = threading.local()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly below
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _update(self, name, change):
+        """
+        Refill bucket `name`, apply change(tokens) -> (tokens, result) and
+        store the new level, all in one write transaction
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE name = ?', (name,)).fetchone()
+            tokens = self.burst if row is None else row[0] + max(0.0, now - row[1]) * self.rates[name]
+            tokens, result = change(min(tokens, self.burst))
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                (name, tokens, now)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def try_acquire(self, name):
+        """Take one token; returns 0.0, or the seconds until one is due"""
+        if name not in self.rates:
+            return 0.0
+        rate = self.rates[name]
+        return self._update(
+            name,
+            lambda tokens: (tokens - 1, 0.0) if tokens >= 1 else (tokens, (1 - tokens) / rate)
+        )
+
+    def acquire(self, name, max_wait=None):
+        """Block until a token is taken; RateLimitTimeout after max_wait seconds"""
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire(name)
+            if not wait:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"ORS {name} rate limit: no capacity within {max_wait:g}s")
+            time.sleep(wait)
+
+    async def aacquire(self, name, max_wait=None):
+        """
+        acquire() for async callers. The SQLite transaction (which may wait
+        on the file lock) runs on a worker thread, so the loop never blocks.
+        """
+        if name not in self.rates:
+            return
+        try_acquire = sync_to_async(self.try_acquire, thread_sensitive=False)
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        while True:
+            wait = await try_acquire(name)
+            if not wait:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"ORS {name} rate limit: no capacity within {max_wait:g}s")
+            await asyncio.sleep(wait)
+
+    def pause(self, name, seconds):
+        """
+        Hold back every process for `seconds` (after a 429): the bucket is
+        drained into debt that takes that long to refill
+        """
+        if name not in self.rates:
+            return
+        debt = -seconds * self.rates[name]
+        self._update(name, lambda tokens: (min(tokens, debt), None))
+
+    async def apause(self, name, seconds):
+        """pause() for async callers, off the event loop"""
+        if name in self.rates:
+            await sync_to_async(self.pause, thread_sensitive=False)(name, seconds)
+
+    def reset(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM buckets')
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls: while a call for a key is in
+    flight, other threads asking for the same key wait for it and get its
+    result (or exception) instead of making their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop"""
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, coroutine_fn):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(coroutine_fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # One waiter being cancelled must not cancel the shared call
+        return await asyncio.shield(task)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Process-wide TokenBucket for ORS endpoints, from settings"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = TokenBucket(
+                    settings.ORS_RATE_LIMIT_PATH,
+                    {
+                        'geocode': settings.ORS_GEOCODE_RATE_PER_MINUTE / 60,
+                        'directions': settings.ORS_DIRECTIONS_RATE_PER_MINUTE / 60,
+                    },
+                    burst=settings.ORS_RATE_LIMIT_BURST
+                )
+    return _limiter
@@ -0,0 +1,46 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON. Views that support it stream their results
+    with stream_ndjson(); anything else (errors) renders as one line.
+    """
+    media_type = NDJSON_CONTENT_TYPE
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return ndjson_line(data).encode(self.charset)
+
+
+# Default renderers plus NDJSON, for views that can stream
+STREAMING_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+
+def ndjson_line(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+
+
+def wants_ndjson(request):
+    """True when the client negotiated NDJSON (Accept header or ?format=ndjson)"""
+    return getattr(request, 'accepted_renderer', None) is not None and \
+        request.accepted_renderer.format == NDJSONRenderer.format
+
+
+def stream_ndjson(objects, status=200):
+    """StreamingHttpResponse writing each object as one line as it is produced"""
+    return StreamingHttpResponse(
+        (ndjson_line(obj) for obj in objects),
+        content_type=NDJSON_CONTENT_TYPE,
+        status=status
+    )
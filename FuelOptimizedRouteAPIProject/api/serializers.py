@@ -1,6 +1,8 @@
 from .models import *
 from rest_framework import serializers
 from decimal import Decimal
+from django.conf import settings
+from .history import decode_cursor
 class FuelStationSerializer(serializers.ModelSerializer):
     # """Serializer for fuel station data"""
     class Meta:
@@ -53,9 +55,16 @@ class FuelStopSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+ROUTE_GEOMETRY_CHOICES = ('full', 'simplified', 'none')
+
+
 class RouteSerializer(serializers.ModelSerializer):
     # """Serializer for route with fuel stops"""
+    # route_polyline is an encoded polyline. context['geometry'] picks the
+    # 'full' line (default), the 'simplified' one or 'none' at all;
+    # context['fields'] limits the output to those fields
     fuel_stops = FuelStopSerializer(many=True, read_only=True)
+    route_polyline = serializers.SerializerMethodField()
     
     class Meta:
         model = Route
@@ -63,6 +72,7 @@ class RouteSerializer(serializers.ModelSerializer):
             'id',
             'start_location',
             'end_location',
+            'waypoints',
             'total_distance_miles',
             'total_fuel_cost',
             'total_gallons_needed',
@@ -73,6 +83,55 @@ class RouteSerializer(serializers.ModelSerializer):
             'created_at',
         ]
         read_only_fields = ['id', 'created_at']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.context.get('fields')
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+        if self.context.get('geometry', 'full') == 'none':
+            self.fields.pop('route_polyline', None)
+
+    def get_route_polyline(self, instance):
+        # Only touch the column that is returned: history listings defer
+        # the full line in 'simplified' mode
+        if self.context.get('geometry', 'full') == 'simplified' and instance.route_polyline_simplified:
+            return instance.route_polyline_simplified
+        return instance.route_polyline
+
+
+class RouteHistoryQuerySerializer(serializers.Serializer):
+    # """Query parameters of the route history listing"""
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.ROUTE_HISTORY_MAX_PAGE_SIZE,
+        default=settings.ROUTE_HISTORY_PAGE_SIZE
+    )
+    fields = serializers.CharField(
+        required=False,
+        help_text="Comma-separated route fields to return (e.g., 'id,total_fuel_cost')"
+    )
+    geometry = serializers.ChoiceField(choices=ROUTE_GEOMETRY_CHOICES, default='simplified')
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    start_location = serializers.CharField(max_length=255, required=False)
+    end_location = serializers.CharField(max_length=255, required=False)
+
+    def validate_cursor(self, value):
+        try:
+            decode_cursor(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+    def validate_fields(self, value):
+        selected = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = sorted(set(selected) - set(RouteSerializer.Meta.fields))
+        if unknown:
+            raise serializers.ValidationError(f"Unknown fields: {', '.join(unknown)}")
+        return selected
  
 
 class RouteRequestSerializer(serializers.Serializer):
@@ -101,6 +160,31 @@ class RouteRequestSerializer(serializers.Serializer):
         max_value=Decimal('1000'),
         help_text="Maximum driving range on full tank (default: 500)"
     )
+    start_fuel_fraction = serializers.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        default=1.0,
+        min_value=Decimal('0'),
+        max_value=Decimal('1'),
+        help_text="Tank level at departure, from 0 (empty) to 1 (full) (default: 1)"
+    )
+    reserve_miles = serializers.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        default=0.0,
+        min_value=Decimal('0'),
+        help_text="Range to keep in the tank at every stop and at arrival (default: 0)"
+    )
+    waypoints = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+        max_length=10,
+        help_text="Stops to visit in order between start and end (e.g., ['Denver, CO'])"
+    )
+    price_as_of = serializers.DateTimeField(
+        required=False,
+        help_text="Plan with the fuel prices in effect at this time instead of the current ones"
+    )
     
     def validate(self, data):
         # """Validate that locations are different"""
@@ -108,9 +192,59 @@ class RouteRequestSerializer(serializers.Serializer):
             raise serializers.ValidationError(
                 "Start and end locations must be different"
             )
+        tank_range_miles = data.get('tank_range_miles', Decimal('500.0'))
+        reserve_miles = data.get('reserve_miles', 0)
+        if reserve_miles >= tank_range_miles:
+            raise serializers.ValidationError(
+                "Reserve margin must be smaller than the tank range"
+            )
+        # Field defaults are floats, submitted values Decimals
+        if float(tank_range_miles) * float(data.get('start_fuel_fraction', 1.0)) < float(reserve_miles):
+            raise serializers.ValidationError(
+                "Starting fuel is below the reserve margin"
+            )
         return data
 
 
+def planning_options(data):
+    """find_optimal_fuel_stops() arguments from validated RouteRequestSerializer data"""
+    return {
+        'fuel_efficiency_mpg': float(data.get('fuel_efficiency_mpg', Decimal('10.0'))),
+        'tank_range_miles': float(data.get('tank_range_miles', Decimal('500.0'))),
+        'start_fuel_fraction': float(data.get('start_fuel_fraction', Decimal('1.0'))),
+        'reserve_miles': float(data.get('reserve_miles', Decimal('0.0'))),
+        'price_as_of': data.get('price_as_of'),
+    }
+
+
+class RouteBatchRequestSerializer(serializers.Serializer):
+    # """Serializer for a batch of route calculation requests"""
+    routes = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1,
+        max_length=settings.ROUTE_BATCH_MAX_ITEMS,
+        help_text="Route requests, each shaped like a calculate_route request body"
+    )
+
+
+class FleetVehicleSerializer(RouteRequestSerializer):
+    # """Serializer for one vehicle of a fleet plan: its route and vehicle assumptions"""
+    vehicle_id = serializers.CharField(
+        max_length=100,
+        help_text="Caller's identifier for the vehicle, echoed in its result"
+    )
+
+
+class FleetPlanRequestSerializer(serializers.Serializer):
+    # """Serializer for a fleet planning request"""
+    vehicles = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1,
+        max_length=settings.FLEET_MAX_VEHICLES,
+        help_text="Vehicles, each shaped like a calculate_route request body plus a vehicle_id"
+    )
+
+
 class RouteResponseSerializer(serializers.Serializer):
     # """Serializer for route calculation response with map data"""
     route = RouteSerializer()
@@ -1,10 +1,48 @@
+import asyncio
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+import numpy as np
 from django.conf import settings
-from math import radians, sin, cos, sqrt, atan2
-from decimal import Decimal
-from .models import FuelStation
+from .cache import get_geocode_cache, get_route_cache, route_cache_key
+from .centroids import lookup_centroid
+from .spatial import get_station_index
+from .states import get_state_grid, load_state_boundaries, states_along_route
+from .optimizer import Candidate, plan_refuelling
+from .geometry import RouteGeometry, haversine_miles
+from .ors_client import get_async_ors_client, get_ors_client, is_upstream_failure
+from .prices import prices_as_of
 # from management.commands.openrouteservice import get_route
 
+# Spacing of the route points offered to the solver when planning against
+# stations that aren't geocoded yet
+STATE_FALLBACK_SPACING_MILES = 10.0
+
+_geocode_pool = None
+_geocode_pool_lock = threading.Lock()
+
+
+def get_geocode_pool():
+    """Shared thread pool for concurrent geocoding"""
+    global _geocode_pool
+    if _geocode_pool is None:
+        with _geocode_pool_lock:
+            if _geocode_pool is None:
+                _geocode_pool = ThreadPoolExecutor(
+                    max_workers=settings.GEOCODE_CONCURRENCY,
+                    thread_name_prefix='geocode'
+                )
+    return _geocode_pool
+
+
+class UpstreamUnavailable(ValueError):
+    """
+    ORS is unavailable and the request has no fallback (a location that
+    can't be resolved offline). Views answer 503 rather than 400.
+    """
+
+
 class RouteService:
     def __init__(self):
         api_key = settings.OPENROUTESERVICE_API_KEY
@@ -14,7 +52,10 @@ class RouteService:
                 "Please add it to your .env file"
             )
         self.api_key = api_key
-        self.base_url = "https://api.openrouteservice.org"
+        self.base_url = settings.OPENROUTESERVICE_BASE_URL
+        self.client = get_ors_client(self.api_key, self.base_url)
+        self.geocode_cache = get_geocode_cache()
+        self.route_cache = get_route_cache()
     
     def _is_location_in_usa(self, geocoded_location):
         """Check if a geocoded location is within the USA"""
@@ -65,22 +106,85 @@ class RouteService:
         Returns:
             dict: {'lat': float, 'lon': float, 'display_name': str}
         """
-        url = f"{self.base_url}/geocode/search"
-        headers = {
-            'Authorization': self.api_key,
-            'Content-Type': 'application/json'
-        }
-        params = {
-            'text': location,
-            'size': 1,
-            # 'boundary.country': 'US'
-        }
+        cached = self.geocode_cache.get(location)
+        if cached is not None:
+            return cached
+        
+        result = self._fetch_geocode(location)
+        if not result.get('degraded'):
+            self.geocode_cache.set(location, result)
+        return result
+    
+    def geocode_locations(self, locations):
+        """
+        Geocode several locations at once
         
+        Cache lookups happen in the calling thread; the remaining network
+        lookups run concurrently on a shared thread pool. If any of them
+        fails, the ones not yet started are cancelled.
+        
+        Returns:
+            list of geocode dicts in the same order as `locations`
+        """
+        results = {}
+        pending = []
+        for location in dict.fromkeys(locations):
+            cached = self.geocode_cache.get(location)
+            if cached is not None:
+                results[location] = cached
+            else:
+                pending.append(location)
+        
+        if len(pending) == 1:
+            results[pending[0]] = self._fetch_geocode(pending[0])
+        elif pending:
+            pool = get_geocode_pool()
+            futures = [(location, pool.submit(self._fetch_geocode, location)) for location in pending]
+            try:
+                for location, future in futures:
+                    results[location] = future.result()
+            except Exception:
+                for _, future in futures:
+                    future.cancel()
+                raise
+        
+        for location in pending:
+            if not results[location].get('degraded'):
+                self.geocode_cache.set(location, results[location])
+        
+        return [results[location] for location in locations]
+    
+    def _fetch_geocode(self, location):
+        """Network geocode without the cache (safe to run off-thread)"""
+        try:
+            data = self.client.geocode(location, size=1)
+        except requests.exceptions.RequestException as e:
+            if is_upstream_failure(e):
+                return self._fallback_geocode(location, e)
+            raise ValueError(f"Geocoding failed for '{location}': {str(e)}")
+        
+        return self._parse_geocode(location, data)
+    
+    def _fallback_geocode(self, location, error):
+        """
+        Offline geocode for "City, ST" while ORS is unavailable, from the
+        bundled centroid tables; marked 'degraded' so it is never cached
+        """
+        city, _, state = location.rpartition(',')
+        state = state.strip().upper()
+        result = None
+        if city.strip() and state in set(load_state_boundaries()) | {'AK', 'HI'}:
+            result = lookup_centroid(city, state)
+        if result is None:
+            raise UpstreamUnavailable(f"Geocoding unavailable for '{location}': {str(error)}")
+        
+        result['properties']['country_a'] = 'USA'
+        result['degraded'] = True
+        return result
+    
+    def _parse_geocode(self, location, data):
+        """Turn an ORS /geocode/search response into a geocode dict"""
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
             if not data.get('features'):
                 raise ValueError(f"Location not found: {location}")
             
@@ -93,77 +197,143 @@ class RouteService:
                 'display_name': feature['properties'].get('label', location),
                 'properties': feature['properties']
             }
-            
-            # Validate location is in USA
-            if not self._is_location_in_usa(result):
-                raise ValueError(
-                    f"Location '{location}' is not within the USA. "
-                    "This API only supports routes within the United States."
-                )
-            
-            return result
-            
-        except requests.exceptions.RequestException as e:
-            raise ValueError(f"Geocoding failed for '{location}': {str(e)}")
         except (KeyError, IndexError) as e:
             raise ValueError(f"Invalid geocoding response for '{location}': {str(e)}")
+        
+        # Validate location is in USA
+        if not self._is_location_in_usa(result):
+            raise ValueError(
+                f"Location '{location}' is not within the USA. "
+                "This API only supports routes within the United States."
+            )
+        
+        return result
     
-    def calculate_route(self, start_location, end_location):
+    def calculate_route(self, start_location, end_location, waypoints=None):
         """
         Calculate route between two USA locations
         
         Args:
             start_location: String or dict with lat/lon
             end_location: String or dict with lat/lon
+            waypoints: Optional list of intermediate stops (strings or
+                dicts), visited in order within the same directions call
             
         Returns:
-            dict with route information
+            dict with route information, including one entry in 'legs'
+            per stretch between consecutive points
         """
-        # Geocode if strings provided
-        if isinstance(start_location, str):
-            start = self.geocode_location(start_location)
-        else:
-            start = start_location
+        locations = [start_location, *(waypoints or []), end_location]
         
-        if isinstance(end_location, str):
-            end = self.geocode_location(end_location)
-        else:
-            end = end_location
+        # Geocode if strings provided (all at once when not cached)
+        to_geocode = [loc for loc in locations if isinstance(loc, str)]
+        geocoded = dict(zip(to_geocode, self.geocode_locations(to_geocode)))
+        start, *stops, end = self._resolve_points(locations, geocoded)
+        
+        self._validate_endpoints(start, end, stops)
+        
+        # Serve repeated corridors from the directions cache
+        cache_key = route_cache_key(start, end, waypoints=stops)
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            return {'start': start, 'end': end, 'waypoints': stops, **cached}
+        
+        # Calculate route using OpenRouteService
+        try:
+            route = self.client.directions(self._route_coordinates(start, end, stops))
+        except requests.exceptions.RequestException as e:
+            if not is_upstream_failure(e):
+                raise ValueError(f"Route calculation error: {str(e)}")
+            return self._degraded_route(start, end, stops, self.route_cache.get_stale(cache_key))
         
-        # Validate both locations are in USA
+        result = self._parse_route(start, end, route, stops)
+        return self._finish_route(cache_key, result)
+    
+    def _finish_route(self, cache_key, result):
+        """Cache a fresh ORS route, unless one of its points was degraded"""
+        if not self._mark_degraded(result):
+            self.route_cache.set(cache_key, result)
+        return result
+    
+    def _mark_degraded(self, result):
+        """
+        Flag a route whose points came from the offline geocoder; such
+        routes are not cached. Returns whether the route is degraded.
+        """
+        points = (result['start'], *result['waypoints'], result['end'])
+        if result.get('degraded') or any(point.get('degraded') for point in points):
+            result['degraded'] = True
+            result.setdefault('source', 'ors')
+        return bool(result.get('degraded'))
+    
+    def _degraded_route(self, start, end, waypoints, stale):
+        """
+        Route data while ORS directions are unavailable: the expired
+        cached route for the same points if there is one, otherwise a
+        straight-line estimate (haversine distance times
+        DEGRADED_ROUTE_DISTANCE_FACTOR at DEGRADED_ROUTE_SPEED_MPH).
+        Flagged 'degraded' with 'source' 'stale_cache' or 'estimate'.
+        """
+        if stale is not None:
+            return {'start': start, 'end': end, 'waypoints': waypoints, **stale,
+                    'degraded': True, 'source': 'stale_cache'}
+        
+        points = (start, *waypoints, end)
+        factor = settings.DEGRADED_ROUTE_DISTANCE_FACTOR
+        legs = []
+        for a, b in zip(points, points[1:]):
+            distance_miles = self.calculate_distance(a['lat'], a['lon'], b['lat'], b['lon']) * factor
+            legs.append({
+                'distance_miles': distance_miles,
+                'duration_seconds': distance_miles / settings.DEGRADED_ROUTE_SPEED_MPH * 3600
+            })
+        coordinates = self._route_coordinates(start, end, waypoints)
+        lons = [lon for lon, _ in coordinates]
+        lats = [lat for _, lat in coordinates]
+        return {
+            'start': start,
+            'end': end,
+            'waypoints': list(waypoints),
+            'distance_miles': sum(leg['distance_miles'] for leg in legs),
+            'duration_seconds': sum(leg['duration_seconds'] for leg in legs),
+            'geometry': {'type': 'LineString', 'coordinates': coordinates},
+            'bbox': [min(lons), min(lats), max(lons), max(lats)],
+            'legs': legs,
+            'degraded': True,
+            'source': 'estimate'
+        }
+    
+    def _resolve_points(self, locations, geocoded):
+        return [geocoded[loc] if isinstance(loc, str) else loc for loc in locations]
+    
+    def _validate_endpoints(self, start, end, waypoints=()):
+        """Validate all locations are in USA"""
         if not self._is_location_in_usa(start):
             raise ValueError(
-                f"Start location is not within the USA. "
+                "Start location is not within the USA. "
                 "This API only supports routes within the United States."
             )
         
         if not self._is_location_in_usa(end):
             raise ValueError(
-                f"End location is not within the USA. "
+                "End location is not within the USA. "
                 "This API only supports routes within the United States."
             )
         
-        # Calculate route using OpenRouteService
-        coords = [
-            [start['lon'], start['lat']],
-            [end['lon'], end['lat']]
-        ]
-        
-        url = f"{self.base_url}/v2/directions/driving-car/geojson"
-        headers = {
-            'Authorization': self.api_key,
-            'Content-Type': 'application/json'
-        }
-        payload = {
-            'coordinates': coords,
-            'instructions': False
-        }
-        
+        for number, waypoint in enumerate(waypoints, start=1):
+            if not self._is_location_in_usa(waypoint):
+                raise ValueError(
+                    f"Waypoint {number} is not within the USA. "
+                    "This API only supports routes within the United States."
+                )
+    
+    def _route_coordinates(self, start, end, waypoints=()):
+        """ORS expects [lon, lat] pairs"""
+        return [[point['lon'], point['lat']] for point in (start, *waypoints, end)]
+    
+    def _parse_route(self, start, end, route, waypoints=()):
+        """Turn an ORS directions GeoJSON response into route data"""
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            route = response.json()
-            
             feature = route['features'][0]
             properties = feature['properties']
             geometry = feature['geometry']
@@ -175,167 +345,324 @@ class RouteService:
             # Convert meters to miles
             distance_miles = distance_meters * 0.000621371
             
+            # One segment per leg between consecutive coordinates
+            legs = [
+                {
+                    'distance_miles': segment.get('distance', 0) * 0.000621371,
+                    'duration_seconds': segment.get('duration', 0)
+                }
+                for segment in properties.get('segments', [])
+            ]
+            
             return {
                 'start': start,
                 'end': end,
+                'waypoints': list(waypoints),
                 'distance_miles': distance_miles,
                 'duration_seconds': duration_seconds,
                 'geometry': geometry,
-                'bbox': route['bbox']
+                'bbox': route['bbox'],
+                'legs': legs
             }
-        except requests.exceptions.RequestException as e:
-            raise ValueError(f"Route calculation error: {str(e)}")
         except (KeyError, IndexError) as e:
             raise ValueError(f"Invalid route response: {str(e)}")
     
     def calculate_distance(self, lat1, lon1, lat2, lon2):
         """Calculate distance between two points (Haversine formula)"""
-        R = 3959  # Earth's radius in miles
-        
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        distance = R * c
-        
-        return distance
+        return float(haversine_miles(lat1, lon1, lat2, lon2))
     
-    def find_optimal_fuel_stops(self, route_data, fuel_efficiency_mpg=10.0, tank_range_miles=500.0):
+    def find_optimal_fuel_stops(self, route_data, fuel_efficiency_mpg=10.0, tank_range_miles=500.0,
+                                start_fuel_fraction=1.0, reserve_miles=0.0, price_as_of=None,
+                                station_index=None):
         """
-        Find optimal fuel stops along the route
-        Simple approach: Use start state + neighboring states
-        Only 3 API calls total!
-        """
-        total_distance = route_data['distance_miles']
-        route_coords = route_data['geometry']['coordinates']
+        Find the cheapest set of fuel stops along the route
         
-        num_stops = int(total_distance / tank_range_miles)
+        Stations within STATION_CORRIDOR_RADIUS_MILES of the route are fed
+        to the refuelling solver. Raises ValueError with the solver's
+        reason when no plan is feasible (no stations along the route, a
+        gap longer than the usable range, too little fuel at the start).
         
-        if num_stops == 0:
-            return []
-        
-        # Get start and end states (already have from geocoding!)
-        start_state = route_data['start']['properties'].get('region_a', '').upper()
-        end_state = route_data['end']['properties'].get('region_a', '').upper()
+        Stations without coordinates (not yet run through geocode_stations)
+        can't be placed on the route. If the corridor gives no plan, they
+        are planned by state instead: see _state_fuel_stops.
         
-        # Get neighboring states
-        nearby_states = self._get_nearby_states(start_state, end_state)
+        Current prices are used unless price_as_of (a datetime) is given,
+        in which case each station is priced from its snapshot history and
+        stations not imported by then are ignored.
         
-        # Find cheapest stations in nearby states
-        stations_nearby = FuelStation.objects.filter(
-            state__in=nearby_states
-        ).order_by('retail_price')
-        
-        if not stations_nearby.exists():
-            # Fallback: use all stations
-            stations_nearby = FuelStation.objects.all().order_by('retail_price')
+        station_index pins the StationIndex (and its snapshot) to use, so a
+        batch of routes is planned against the same station data.
+        """
+        total_distance = route_data['distance_miles']
+        route = RouteGeometry.from_geojson(route_data['geometry'])
         
-        if not stations_nearby.exists():
-            raise ValueError("No fuel stations found in database")
+        start_range = tank_range_miles * start_fuel_fraction - reserve_miles
+        if total_distance <= start_range:
+            return []
         
+        # Stations along the route: the cheapest few per grid cell first,
+        # every corridor station if that leaves gaps
+        index = get_station_index() if station_index is None else station_index
+        error = ValueError("No fuel stations found along the route")
+        for per_cell in self._corridor_limits(price_as_of):
+            corridor = index.stations_near_polyline(
+                route,
+                settings.STATION_CORRIDOR_RADIUS_MILES,
+                per_cell
+            )
+            if not corridor:
+                continue
+            try:
+                return self._solve_fuel_stops(
+                    corridor,
+                    total_distance,
+                    fuel_efficiency_mpg,
+                    tank_range_miles,
+                    start_fuel_fraction,
+                    reserve_miles,
+                    price_as_of
+                )
+            except ValueError as e:
+                error = e
+        
+        # Stations that aren't geocoded yet, by the states the route crosses
+        fuel_stops = self._state_fuel_stops(
+            route_data,
+            route,
+            index.snapshot,
+            fuel_efficiency_mpg,
+            tank_range_miles,
+            start_fuel_fraction,
+            reserve_miles,
+            price_as_of
+        )
+        if fuel_stops is not None:
+            return fuel_stops
+        
+        # No feasible plan: report the solver's reason
+        raise error
+
+    def _corridor_limits(self, price_as_of=None):
+        """
+        per_cell limits to try in turn. Cells are ranked by current prices,
+        so plans at historical prices always use the whole corridor.
+        """
+        if settings.STATION_CELL_TOP_K and price_as_of is None:
+            return [settings.STATION_CELL_TOP_K, None]
+        return [None]
+    
+    def _solve_fuel_stops(self, corridor, total_distance, fuel_efficiency_mpg, tank_range_miles,
+                          start_fuel_fraction, reserve_miles, price_as_of=None):
+        """Run the refuelling solver over corridor stations"""
+        if price_as_of is None:
+            candidates = [Candidate(c.route_mile, c.station.retail_price, c) for c in corridor]
+        else:
+            prices = prices_as_of((c.station.id for c in corridor), price_as_of)
+            candidates = [
+                Candidate(c.route_mile, prices[c.station.id], c)
+                for c in corridor
+                if c.station.id in prices
+            ]
+        
+        purchases = plan_refuelling(
+            candidates,
+            total_distance,
+            fuel_efficiency_mpg,
+            tank_range_miles,
+            start_fuel_fraction=start_fuel_fraction,
+            reserve_miles=reserve_miles
+        )
+        
+        return self._build_fuel_stops(purchases, [purchase.payload.station for purchase in purchases])
+    
+    def _build_fuel_stops(self, purchases, stations):
+        """Fuel stop dicts for solver purchases made at `stations` (StationRecords)"""
         fuel_stops = []
-        gallons_to_fill = tank_range_miles / fuel_efficiency_mpg
-        
-        # Assign cheapest stations to each stop
-        for stop_num in range(1, num_stops + 1):
-            target_distance = stop_num * tank_range_miles
-            progress = target_distance / total_distance
-            coord_index = min(int(progress * len(route_coords)), len(route_coords) - 1)
-            target_point = route_coords[coord_index]
-            target_lon, target_lat = target_point
-            
-            # Rotate through cheapest stations
-            station_index = (stop_num - 1) % stations_nearby.count()
-            best_station = stations_nearby[station_index]
-            
-            cost = float(best_station.retail_price) * gallons_to_fill
-            
+        for stop_num, (purchase, station) in enumerate(zip(purchases, stations), start=1):
             fuel_stops.append({
-                'station': best_station,
+                'station': station,
                 'stop_order': stop_num,
-                'distance_from_start': target_distance,
-                'gallons_to_fill': gallons_to_fill,
-                'cost': cost,
-                'latitude': target_lat,
-                'longitude': target_lon
+                'distance_from_start': purchase.route_mile,
+                'gallons_to_fill': purchase.gallons,
+                'price_per_gallon': float(purchase.price),
+                'cost': float(purchase.price) * purchase.gallons,
+                'latitude': station.lat,
+                'longitude': station.lon
             })
         
         return fuel_stops
+    
+    def _state_fuel_stops(self, route_data, route, snapshot, fuel_efficiency_mpg, tank_range_miles,
+                          start_fuel_fraction, reserve_miles, price_as_of=None):
+        """
+        Plan against stations without coordinates, which are only known
+        by state. Every STATE_FALLBACK_SPACING_MILES along the route the
+        solver is offered the cheapest such station in the state under
+        that point, and stops are reported at the route point. Returns
+        None if none of these stations is in a state the route crosses.
+        """
+        states = self._get_route_states(route_data, route)
+        rows = np.setdiff1d(snapshot.rows_in_states(states), snapshot.geocoded)
+        rows, prices = self._snapshot_prices(snapshot, rows, price_as_of)
+        if not len(rows):
+            return None
+        
+        cheapest = {}
+        for row, price in zip(rows.tolist(), prices.tolist()):
+            state = snapshot.state_names[snapshot.state_codes[row]]
+            if state not in cheapest or price < cheapest[state][1]:
+                cheapest[state] = (row, price)
+        
+        # Route points outside the boundary grid (AK, HI) fall to the
+        # cheapest station in an endpoint state the grid doesn't cover
+        grid_states = load_state_boundaries()
+        off_grid = min(
+            (cheapest[state] for state in states if state in cheapest and state not in grid_states),
+            key=lambda pick: pick[1],
+            default=None
+        )
+        
+        # Sample points in ORS miles, located on the polyline's own mileage
+        total_distance = route_data['distance_miles']
+        miles = np.arange(0.0, total_distance, STATE_FALLBACK_SPACING_MILES)
+        scale = route.total_miles / total_distance if total_distance else 0.0
+        lats, lons = route.point_at_mile(miles * scale)
+        grid = get_state_grid()
+        
+        candidates = []
+        for mile, lat, lon, code in zip(miles.tolist(), lats.tolist(), lons.tolist(),
+                                        grid.codes_at(lats, lons).tolist()):
+            pick = cheapest.get(grid.states[code]) if code else off_grid
+            if pick is not None:
+                candidates.append(Candidate(mile, pick[1], (pick[0], lat, lon)))
+        
+        purchases = plan_refuelling(
+            candidates,
+            total_distance,
+            fuel_efficiency_mpg,
+            tank_range_miles,
+            start_fuel_fraction=start_fuel_fraction,
+            reserve_miles=reserve_miles
+        )
+        
+        fuel_stops = self._build_fuel_stops(
+            purchases, [snapshot.record(purchase.payload[0]) for purchase in purchases]
+        )
+        for stop, purchase in zip(fuel_stops, purchases):
+            stop['latitude'], stop['longitude'] = purchase.payload[1:]
+        return fuel_stops
+    
+    def _snapshot_prices(self, snapshot, rows, price_as_of):
+        """
+        (rows, prices) for snapshot rows at current prices, or as of a past
+        time, dropping stations that had no price yet
+        """
+        if price_as_of is None:
+            return rows, snapshot.prices[rows]
+        
+        history = prices_as_of(snapshot.ids[rows].tolist(), price_as_of)
+        rows = np.array([row for row in rows.tolist() if int(snapshot.ids[row]) in history], dtype=np.int64)
+        prices = np.array([float(history[int(snapshot.ids[row])]) for row in rows.tolist()])
+        return rows, prices
+    
+    def _get_route_states(self, route_data, route):
+        """
+        States the route geometry passes through, in order, from the
+        bundled boundary grid (no API calls). The geocoded start and end
+        states are added for places the grid doesn't cover (AK, HI).
+        """
+        states = states_along_route(route)
+        for point in (route_data['start'], route_data['end']):
+            state = point.get('properties', {}).get('region_a', '').upper()
+            if state and state not in states:
+                states.append(state)
+        return states
 
 
-    def _get_nearby_states(self, start_state, end_state):
+class AsyncRouteService(RouteService):
+    """
+    asyncio version of RouteService for ASGI views.
+    
+    Outbound ORS calls go through the per-loop httpx client, so a request
+    waiting on ORS holds no thread. Database work (cache tier, station
+    index, solver) still runs in Django's sync executor.
+    """
+    
+    @property
+    def async_client(self):
+        return get_async_ors_client(self.api_key, self.base_url)
+    
+    async def geocode_location(self, location):
+        cached = await self.geocode_cache.aget(location)
+        if cached is not None:
+            return cached
+        
+        result = await self._afetch_geocode(location)
+        if not result.get('degraded'):
+            await self.geocode_cache.aset(location, result)
+        return result
+    
+    async def geocode_locations(self, locations):
         """
-        Get start state, end state, and their neighboring states
-        Simple US geography - no API calls needed!
+        Geocode several locations concurrently; if one fails the others
+        are cancelled and the error is re-raised
         """
-        # US state neighbors map (simplified)
-        state_neighbors = {
-            'AL': ['FL', 'GA', 'TN', 'MS'],
-            'AK': [],  # No land neighbors
-            'AZ': ['CA', 'NV', 'UT', 'NM'],
-            'AR': ['MO', 'TN', 'MS', 'LA', 'TX', 'OK'],
-            'CA': ['OR', 'NV', 'AZ'],
-            'CO': ['WY', 'NE', 'KS', 'OK', 'NM', 'UT'],
-            'CT': ['MA', 'RI', 'NY'],
-            'DE': ['PA', 'NJ', 'MD'],
-            'FL': ['GA', 'AL'],
-            'GA': ['FL', 'AL', 'TN', 'NC', 'SC'],
-            'HI': [],  # No land neighbors
-            'ID': ['MT', 'WY', 'UT', 'NV', 'OR', 'WA'],
-            'IL': ['WI', 'IN', 'KY', 'MO', 'IA'],
-            'IN': ['MI', 'OH', 'KY', 'IL'],
-            'IA': ['MN', 'WI', 'IL', 'MO', 'NE', 'SD'],
-            'KS': ['NE', 'MO', 'OK', 'CO'],
-            'KY': ['IN', 'OH', 'WV', 'VA', 'TN', 'MO', 'IL'],
-            'LA': ['TX', 'AR', 'MS'],
-            'ME': ['NH'],
-            'MD': ['PA', 'DE', 'VA', 'WV'],
-            'MA': ['NH', 'RI', 'CT', 'VT', 'NY'],
-            'MI': ['WI', 'IN', 'OH'],
-            'MN': ['WI', 'IA', 'SD', 'ND'],
-            'MS': ['LA', 'AR', 'TN', 'AL'],
-            'MO': ['IA', 'IL', 'KY', 'TN', 'AR', 'OK', 'KS', 'NE'],
-            'MT': ['ND', 'SD', 'WY', 'ID'],
-            'NE': ['SD', 'IA', 'MO', 'KS', 'CO', 'WY'],
-            'NV': ['ID', 'UT', 'AZ', 'CA', 'OR'],
-            'NH': ['ME', 'MA', 'VT'],
-            'NJ': ['NY', 'DE', 'PA'],
-            'NM': ['CO', 'OK', 'TX', 'AZ'],
-            'NY': ['VT', 'MA', 'CT', 'NJ', 'PA'],
-            'NC': ['VA', 'TN', 'GA', 'SC'],
-            'ND': ['MN', 'SD', 'MT'],
-            'OH': ['PA', 'WV', 'KY', 'IN', 'MI'],
-            'OK': ['KS', 'MO', 'AR', 'TX', 'NM', 'CO'],
-            'OR': ['WA', 'ID', 'NV', 'CA'],
-            'PA': ['NY', 'NJ', 'DE', 'MD', 'WV', 'OH'],
-            'RI': ['MA', 'CT'],
-            'SC': ['NC', 'GA'],
-            'SD': ['ND', 'MN', 'IA', 'NE', 'WY', 'MT'],
-            'TN': ['KY', 'VA', 'NC', 'GA', 'AL', 'MS', 'AR', 'MO'],
-            'TX': ['OK', 'AR', 'LA', 'NM'],
-            'UT': ['ID', 'WY', 'CO', 'NM', 'AZ', 'NV'],
-            'VT': ['NY', 'NH', 'MA'],
-            'VA': ['MD', 'WV', 'KY', 'TN', 'NC'],
-            'WA': ['ID', 'OR'],
-            'WV': ['OH', 'PA', 'MD', 'VA', 'KY'],
-            'WI': ['MI', 'IL', 'IA', 'MN'],
-            'WY': ['MT', 'SD', 'NE', 'CO', 'UT', 'ID'],
-        }
+        unique = list(dict.fromkeys(locations))
+        tasks = [asyncio.ensure_future(self.geocode_location(location)) for location in unique]
+        try:
+            results = dict(zip(unique, await asyncio.gather(*tasks)))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
         
-        # Start with start and end states
-        nearby = set([start_state, end_state])
+        return [results[location] for location in locations]
+    
+    async def _afetch_geocode(self, location):
+        try:
+            data = await self.async_client.geocode(location, size=1)
+        except requests.exceptions.RequestException as e:
+            if is_upstream_failure(e):
+                return self._fallback_geocode(location, e)
+            raise ValueError(f"Geocoding failed for '{location}': {str(e)}")
         
-        # Add neighbors of start state
-        if start_state in state_neighbors:
-            nearby.update(state_neighbors[start_state])
+        return self._parse_geocode(location, data)
+    
+    async def calculate_route(self, start_location, end_location, waypoints=None):
+        locations = [start_location, *(waypoints or []), end_location]
+        to_geocode = [loc for loc in locations if isinstance(loc, str)]
+        geocoded = dict(zip(to_geocode, await self.geocode_locations(to_geocode)))
+        start, *stops, end = self._resolve_points(locations, geocoded)
         
-        # Add neighbors of end state
-        if end_state in state_neighbors:
-            nearby.update(state_neighbors[end_state])
+        self._validate_endpoints(start, end, stops)
         
-        # Remove any empty strings
-        nearby.discard('')
+        cache_key = route_cache_key(start, end, waypoints=stops)
+        cached = await self.route_cache.aget(cache_key)
+        if cached is not None:
+            return {'start': start, 'end': end, 'waypoints': stops, **cached}
         
-        return list(nearby)
\ No newline at end of file
+        try:
+            route = await self.async_client.directions(self._route_coordinates(start, end, stops))
+        except requests.exceptions.RequestException as e:
+            if not is_upstream_failure(e):
+                raise ValueError(f"Route calculation error: {str(e)}")
+            return self._degraded_route(start, end, stops, await self.route_cache.aget_stale(cache_key))
+        
+        result = self._parse_route(start, end, route, stops)
+        if self._mark_degraded(result):
+            return result
+        await self.route_cache.aset(cache_key, result)
+        return result
+    
+    async def find_optimal_fuel_stops(self, route_data, fuel_efficiency_mpg=10.0, tank_range_miles=500.0,
+                                      start_fuel_fraction=1.0, reserve_miles=0.0, price_as_of=None,
+                                      station_index=None):
+        return await sync_to_async(super().find_optimal_fuel_stops)(
+            route_data,
+            fuel_efficiency_mpg,
+            tank_range_miles,
+            start_fuel_fraction,
+            reserve_miles,
+            price_as_of,
+            station_index
+        )
@@ -0,0 +1,157 @@
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import FuelStation, PriceImport
+
+# One station materialized from a snapshot row
+StationRecord = namedtuple(
+    'StationRecord',
+    ['id', 'opis_id', 'name', 'address', 'city', 'state', 'retail_price', 'lat', 'lon']
+)
+
+
+def snapshot_version():
+    """
+    Cheap fingerprint of the station table: latest price import plus the
+    newest updated_at and row count (which also catch geocoding runs)
+    """
+    stats = FuelStation.objects.aggregate(latest=Max('updated_at'), rows=Count('id'))
+    latest_import = PriceImport.objects.order_by('-id').values_list('id', flat=True).first()
+    return (latest_import, stats['latest'], stats['rows'])
+
+
+class StationSnapshot:
+    """
+    Read-only, column-oriented copy of every FuelStation.
+
+    Stations are rows across parallel NumPy arrays sorted by id; text
+    columns are lists of interned strings and states are small integer
+    codes. Nothing here is mutated after load(), so a snapshot can be
+    shared freely between threads and replaced by swapping a reference.
+    """
+
+    fields = ['id', 'opis_id', 'name', 'address', 'city', 'state', 'retail_price', 'latitude', 'longitude']
+
+    def __init__(self, ids, opis_ids, names, addresses, cities, states, prices, lats, lons, version=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.opis_ids = np.asarray(opis_ids, dtype=np.int64)
+        self.names = [sys.intern(name) for name in names]
+        self.addresses = [sys.intern(address) for address in addresses]
+        self.cities = [sys.intern(city) for city in cities]
+        state_names, codes = np.unique(np.asarray(states, dtype=str), return_inverse=True)
+        self.state_names = tuple(sys.intern(str(state)) for state in state_names)
+        self.state_codes = codes.astype(np.int16)
+        self.prices = np.asarray(prices, dtype=float)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.version = version
+
+    @classmethod
+    def load(cls, version=None):
+        """Read every station in one pass ordered by id"""
+        if version is None:
+            version = snapshot_version()
+
+        columns = [[] for _ in cls.fields]
+        rows = FuelStation.objects.order_by('id').values_list(*cls.fields)
+        for row in rows.iterator(chunk_size=2000):
+            for column, value in zip(columns, row):
+                column.append(value)
+
+        ids, opis_ids, names, addresses, cities, states, prices, lats, lons = columns
+        return cls(
+            ids,
+            opis_ids,
+            names,
+            addresses,
+            cities,
+            states,
+            [float(price) for price in prices],
+            [np.nan if lat is None else float(lat) for lat in lats],
+            [np.nan if lon is None else float(lon) for lon in lons],
+            version=version
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def geocoded(self):
+        """Row numbers of stations with coordinates"""
+        return np.flatnonzero(~(np.isnan(self.lats) | np.isnan(self.lons)))
+
+    def record(self, row):
+        row = int(row)
+        return StationRecord(
+            id=int(self.ids[row]),
+            opis_id=int(self.opis_ids[row]),
+            name=self.names[row],
+            address=self.addresses[row],
+            city=self.cities[row],
+            state=self.state_names[self.state_codes[row]],
+            retail_price=float(self.prices[row]),
+            lat=float(self.lats[row]),
+            lon=float(self.lons[row])
+        )
+
+    def same_stations(self, other):
+        """True if `other` has the same stations at the same places (prices may differ)"""
+        return (
+            np.array_equal(self.ids, other.ids)
+            and np.array_equal(self.lats, other.lats, equal_nan=True)
+            and np.array_equal(self.lons, other.lons, equal_nan=True)
+        )
+
+    def rows_for_ids(self, station_ids):
+        """Snapshot row of each station id, -1 where the id isn't loaded"""
+        station_ids = np.asarray(station_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(station_ids.shape, -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, station_ids), len(self.ids) - 1)
+        return np.where(self.ids[rows] == station_ids, rows, -1)
+
+    def rows_in_states(self, states):
+        """Row numbers of stations in any of the given states"""
+        states = set(states)
+        codes = [code for code, state in enumerate(self.state_names) if state in states]
+        return np.flatnonzero(np.isin(self.state_codes, codes))
+
+
+_snapshot = None
+_snapshot_checked = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_station_snapshot():
+    """
+    Process-wide StationSnapshot. Server processes load it at startup
+    (see ApiConfig.ready); anywhere else it is loaded on first use.
+
+    At most every STATION_INDEX_REFRESH_SECONDS one caller compares the
+    table fingerprint and, if it moved (new import, geocoding), loads a
+    fresh snapshot and swaps it in. Other callers keep using the current
+    snapshot meanwhile instead of waiting.
+    """
+    global _snapshot, _snapshot_checked
+
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - _snapshot_checked < settings.STATION_INDEX_REFRESH_SECONDS:
+        return snapshot
+
+    if not _snapshot_lock.acquire(blocking=snapshot is None):
+        return snapshot
+    try:
+        if _snapshot is None or time.monotonic() - _snapshot_checked >= settings.STATION_INDEX_REFRESH_SECONDS:
+            version = snapshot_version()
+            if _snapshot is None or _snapshot.version != version:
+                _snapshot = StationSnapshot.load(version)
+            _snapshot_checked = time.monotonic()
+        return _snapshot
+    finally:
+        _snapshot_lock.release()
@@ -0,0 +1,171 @@
+from collections import namedtuple
+from math import ceil, cos, radians
+
+import numpy as np
+from django.conf import settings
+
+from .geometry import MILES_PER_DEGREE_LAT, RouteGeometry
+from .snapshot import StationSnapshot, get_station_snapshot
+
+# A station near the route: where it projects onto the polyline and how far off it is
+CorridorStation = namedtuple('CorridorStation', ['station', 'route_mile', 'offset_miles'])
+
+# Grid cells are packed into one integer: (row + CELL_BIAS) * CELL_SPAN + (col + CELL_BIAS)
+CELL_BIAS = 1 << 15
+CELL_SPAN = 1 << 16
+
+
+class StationIndex:
+    """
+    Uniform lat/lon grid over the geocoded rows of a StationSnapshot.
+
+    Rows are sorted by packed cell key, so each occupied cell is a
+    contiguous slice of `rows` found by binary search. Within a cell rows
+    are ordered cheapest first, which makes the first K of a slice that
+    cell's K cheapest stations. The index is as immutable as its snapshot
+    and is rebuilt when the snapshot is swapped.
+
+    Given the `previous` index, a snapshot that only changed prices reuses
+    its cell layout and re-sorts just the cells holding repriced stations.
+    """
+
+    def __init__(self, snapshot=None, cell_degrees=None, previous=None):
+        if cell_degrees is None:
+            cell_degrees = settings.STATION_INDEX_CELL_DEGREES
+        self.cell_degrees = cell_degrees
+        self.snapshot = snapshot if snapshot is not None else StationSnapshot.load()
+
+        if (previous is not None and previous.cell_degrees == cell_degrees
+                and previous.snapshot.same_stations(self.snapshot)):
+            self._reprice(previous)
+            return
+
+        rows = self.snapshot.geocoded
+        keys = self.cell_keys(self.snapshot.lats[rows], self.snapshot.lons[rows])
+        order = np.lexsort((rows, self.snapshot.prices[rows], keys))
+        self.rows = rows[order]
+        self.cells, starts = np.unique(keys[order], return_index=True)
+        self.cell_starts = starts
+        self.cell_ends = np.append(starts[1:], len(self.rows))
+
+    def _reprice(self, previous):
+        """Take over previous's cells, re-sorting those with new prices"""
+        self.cells = previous.cells
+        self.cell_starts = previous.cell_starts
+        self.cell_ends = previous.cell_ends
+        self.rows = previous.rows
+
+        snapshot = self.snapshot
+        changed = np.flatnonzero(previous.snapshot.prices != snapshot.prices)
+        changed = changed[~(np.isnan(snapshot.lats[changed]) | np.isnan(snapshot.lons[changed]))]
+        if not len(changed):
+            return
+
+        self.rows = previous.rows.copy()
+        keys = self.cell_keys(snapshot.lats[changed], snapshot.lons[changed])
+        for position in np.unique(np.searchsorted(self.cells, keys)).tolist():
+            start, end = self.cell_starts[position], self.cell_ends[position]
+            cell_rows = self.rows[start:end]
+            self.rows[start:end] = cell_rows[np.lexsort((cell_rows, snapshot.prices[cell_rows]))]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def cell_keys(self, lats, lons):
+        """Packed cell keys for scalars or arrays of coordinates"""
+        rows = np.floor(np.asarray(lats) / self.cell_degrees).astype(np.int64)
+        cols = np.floor(np.asarray(lons) / self.cell_degrees).astype(np.int64)
+        keys = (rows + CELL_BIAS) * CELL_SPAN + (cols + CELL_BIAS)
+        return int(keys) if keys.ndim == 0 else keys
+
+    def corridor_cells(self, route, radius_miles):
+        """Sorted keys of occupied cells within radius_miles of the route"""
+        lats, lons = route.lats, route.lons
+
+        # Densify long segments so consecutive samples are <= half a cell apart
+        step = self.cell_degrees / 2
+        spans = np.maximum(np.abs(np.diff(lats)), np.abs(np.diff(lons)))
+        counts = np.maximum(1, np.ceil(spans / step).astype(np.int64))
+        seg = np.repeat(np.arange(len(counts)), counts)
+        frac = (np.arange(len(seg)) - np.repeat(np.cumsum(counts) - counts, counts)) / counts[seg]
+        sample_lats = np.append(lats[seg] + (lats[seg + 1] - lats[seg]) * frac, lats[-1])
+        sample_lons = np.append(lons[seg] + (lons[seg + 1] - lons[seg]) * frac, lons[-1])
+
+        route_cells = np.unique(self.cell_keys(sample_lats, sample_lons))
+
+        # Grow by the radius; longitude cells shrink towards the poles
+        max_lat = min(float(np.max(np.abs(lats))) + self.cell_degrees, 89.0)
+        reach_lat = ceil(radius_miles / (MILES_PER_DEGREE_LAT * self.cell_degrees))
+        reach_lon = ceil(radius_miles / (MILES_PER_DEGREE_LAT * cos(radians(max_lat)) * self.cell_degrees))
+        dy, dx = np.mgrid[-reach_lat:reach_lat + 1, -reach_lon:reach_lon + 1]
+        offsets = (dy * CELL_SPAN + dx).ravel()
+
+        keys = np.unique(route_cells[:, None] + offsets[None, :])
+        return keys[np.isin(keys, self.cells, assume_unique=True)]
+
+    def corridor_rows(self, route, radius_miles, per_cell=None):
+        """
+        Snapshot rows in the cells within radius_miles of the route; with
+        per_cell, only the per_cell cheapest stations of each cell
+        """
+        positions = np.searchsorted(self.cells, self.corridor_cells(route, radius_miles))
+        starts = self.cell_starts[positions]
+        counts = self.cell_ends[positions] - starts
+        if per_cell is not None:
+            counts = np.minimum(counts, per_cell)
+        if not counts.sum():
+            return np.zeros(0, dtype=np.int64)
+
+        # Concatenate the cell slices without a Python loop
+        shift = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return self.rows[shift + np.arange(counts.sum())]
+
+    def corridor(self, route, radius_miles, per_cell=None):
+        """
+        (rows, route_miles, offsets) arrays for the indexed stations within
+        radius_miles of a RouteGeometry, sorted by route mile. per_cell
+        limits the candidates to the cheapest few of each cell crossed.
+        """
+        if len(route) < 2 or not len(self.rows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+
+        candidates = self.corridor_rows(route, radius_miles, per_cell)
+        if not len(candidates):
+            return candidates, np.zeros(0), np.zeros(0)
+
+        route_miles, offsets = route.project(self.snapshot.lats[candidates], self.snapshot.lons[candidates])
+
+        inside = np.flatnonzero(offsets <= radius_miles)
+        inside = inside[np.argsort(route_miles[inside], kind='stable')]
+        return candidates[inside], route_miles[inside], offsets[inside]
+
+    def stations_near_polyline(self, route, radius_miles, per_cell=None):
+        """
+        All indexed stations within radius_miles of a route, sorted by
+        route mile, as CorridorStation tuples of StationRecord. `route` is
+        a RouteGeometry or GeoJSON-ordered ([lon, lat]) coordinates.
+        """
+        if not isinstance(route, RouteGeometry):
+            route = RouteGeometry.from_geojson(route)
+
+        rows, route_miles, offsets = self.corridor(route, radius_miles, per_cell)
+        return [
+            CorridorStation(self.snapshot.record(row), mile, offset)
+            for row, mile, offset in zip(rows.tolist(), route_miles.tolist(), offsets.tolist())
+        ]
+
+_station_index = None
+
+
+def get_station_index():
+    """
+    StationIndex over the current process-wide snapshot, rebuilt whenever
+    get_station_snapshot() swaps in a new one
+    """
+    global _station_index
+
+    snapshot = get_station_snapshot()
+    index = _station_index
+    if index is None or index.snapshot is not snapshot:
+        index = _station_index = StationIndex(snapshot, previous=index)
+    return index
@@ -0,0 +1,129 @@
+import json
+from functools import lru_cache
+
+import numpy as np
+
+from .centroids import DATA_DIR
+from .geometry import MILES_PER_DEGREE_LAT, RouteGeometry
+
+# Extent and resolution of the rasterized lower-48 state grid
+STATE_GRID_BOUNDS = (-125.0, 24.0, -66.5, 49.5)  # west, south, east, north
+STATE_GRID_DEGREES = 0.025
+
+
+@lru_cache(maxsize=None)
+def load_state_boundaries():
+    """
+    {'TX': [ring, ...], ...} from the bundled, simplified lower-48 (plus DC)
+    boundary polygons. Rings are [[lon, lat], ...]; neighbouring states
+    share their border vertices.
+    """
+    with open(DATA_DIR / 'state_boundaries.json', encoding='utf-8') as f:
+        return {state: [np.asarray(ring, dtype=float) for ring in rings] for state, rings in json.load(f).items()}
+
+
+def polygon_area(rings):
+    """Shoelace area of a state's rings in square degrees"""
+    return sum(
+        abs(np.dot(ring[:, 0], np.roll(ring[:, 1], -1)) - np.dot(ring[:, 1], np.roll(ring[:, 0], -1))) / 2
+        for ring in rings
+    )
+
+
+class StateGrid:
+    """
+    Point-in-polygon lookup for US states, compiled into a raster.
+
+    Every cell of a regular lon/lat grid holds a state code (0 = no
+    state), filled once by scanline-rasterizing the boundary polygons.
+    Lookups are then a vectorized array index, cheap enough to classify
+    every sample point of a cross-country route in well under a
+    millisecond. Route planning uses it to place stations that are only
+    known by state until they are geocoded.
+    """
+
+    def __init__(self, boundaries, bounds=STATE_GRID_BOUNDS, cell_degrees=STATE_GRID_DEGREES):
+        self.west, self.south, self.east, self.north = bounds
+        self.cell_degrees = cell_degrees
+        self.states = ('',) + tuple(sorted(boundaries))
+        columns = int(round((self.east - self.west) / cell_degrees))
+        rows = int(round((self.north - self.south) / cell_degrees))
+        self.grid = np.zeros((rows, columns), dtype=np.uint8)
+
+        centers_x = self.west + (np.arange(columns) + 0.5) * cell_degrees
+        centers_y = self.south + (np.arange(rows) + 0.5) * cell_degrees
+        # Largest states first, so enclaves drawn later (DC) keep their cells
+        by_area = sorted(range(1, len(self.states)), key=lambda code: -polygon_area(boundaries[self.states[code]]))
+        for code in by_area:
+            self._fill(boundaries[self.states[code]], code, centers_x, centers_y)
+        self._close_seams()
+
+    def _fill(self, rings, code, centers_x, centers_y):
+        """Even-odd scanline fill of one state's rings at cell centers"""
+        edges = np.concatenate([np.stack([ring, np.roll(ring, -1, axis=0)], axis=1) for ring in rings])
+        (x1, y1), (x2, y2) = edges[:, 0].T, edges[:, 1].T
+        low, high = np.minimum(y1, y2), np.maximum(y1, y2)
+
+        for row in np.flatnonzero((centers_y >= low.min()) & (centers_y < high.max())):
+            y = centers_y[row]
+            crossing = (low <= y) & (y < high)
+            xs = np.sort(x1[crossing] + (y - y1[crossing]) * (x2[crossing] - x1[crossing]) / (y2[crossing] - y1[crossing]))
+            for start, end in zip(xs[::2], xs[1::2]):
+                self.grid[row, (centers_x >= start) & (centers_x < end)] = code
+
+    def _close_seams(self):
+        """Give empty cells on a shared border the state of a filled neighbour"""
+        for shift, axis in [(1, 0), (-1, 0), (1, 1), (-1, 1)]:
+            neighbour = np.roll(self.grid, shift, axis=axis)
+            empty = (self.grid == 0) & (neighbour != 0)
+            # Only seams: the cell on the other side must be filled as well
+            empty &= np.roll(self.grid, -shift, axis=axis) != 0
+            self.grid[empty] = neighbour[empty]
+
+    def codes_at(self, lats, lons):
+        """State code per point (0 outside every state or the grid)"""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        rows = np.floor((lats - self.south) / self.cell_degrees).astype(np.int64)
+        columns = np.floor((lons - self.west) / self.cell_degrees).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.grid.shape[0]) & (columns >= 0) & (columns < self.grid.shape[1])
+
+        codes = np.zeros(lats.shape, dtype=np.uint8)
+        codes[inside] = self.grid[rows[inside], columns[inside]]
+        return codes
+
+    def state_at(self, lat, lon):
+        """Two-letter state at a point, or None"""
+        return self.states[int(self.codes_at([lat], [lon])[0])] or None
+
+    def states_along(self, route):
+        """
+        States a RouteGeometry passes through, in the order it enters
+        them. The route is sampled at half the cell size so no cell it
+        crosses is skipped.
+        """
+        if not len(route):
+            return []
+        sample_miles = self.cell_degrees * MILES_PER_DEGREE_LAT / 2
+        samples = route.densified(sample_miles) if len(route) > 1 else route
+        codes = self.codes_at(samples.lats, samples.lons)
+        codes = codes[codes != 0]
+
+        first_seen = np.unique(codes, return_index=True)[1]
+        return [self.states[int(codes[i])] for i in sorted(first_seen)]
+
+
+@lru_cache(maxsize=None)
+def get_state_grid():
+    """Process-wide StateGrid, compiled on first use"""
+    return StateGrid(load_state_boundaries())
+
+
+def states_along_route(route):
+    """
+    Ordered states a route passes through. `route` is a RouteGeometry or
+    GeoJSON-ordered ([lon, lat]) coordinates / LineString.
+    """
+    if not isinstance(route, RouteGeometry):
+        route = RouteGeometry.from_geojson(route)
+    return get_state_grid().states_along(route)
@@ -1,3 +1,1342 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import httpx
+import numpy as np
+import requests
+
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from .apps import is_serving, warm_station_index
+from .batch import BatchItem, RouteBatch
+from .breaker import CircuitBreaker, CircuitOpenError, get_circuit_breaker
+from .cache import (
+    GeocodeCache, RouteCache, get_geocode_cache, get_route_cache, normalize_location, route_cache_key
+)
+from .centroids import lookup_centroid
+from .corridors import (
+    corridor_fuel_stops, corridor_route_data, find_corridor, precompute_corridor, refresh_corridors
+)
+from .fake_ors import FakeORSServer, fake_directions
+from .fleet import FleetPlanner
+from .fleet_worker import read_prices
+from .geometry import RouteGeometry, haversine_miles
+from .history import route_history
+from .models import FuelPriceSnapshot, FuelStation, FuelStop, PriceImport, Route
+from .optimizer import Candidate, plan_refuelling
+from .ors_client import AsyncORSClient, ORSClient, ORSRequestError, get_ors_client, is_upstream_failure
+from .persistence import RouteWriter, build_route_rows, save_route
+from .polyline import decode_polyline, encode_polyline, simplify_line
+from .prices import prices_as_of, record_price_snapshots
+from .ratelimit import RateLimitTimeout, SingleFlight, TokenBucket
+from .services import RouteService
+from .snapshot import StationSnapshot
+from .spatial import StationIndex, get_station_index
+from .states import get_state_grid, states_along_route
+
+
+DALLAS = {
+    'lat': 32.7767,
+    'lon': -96.797,
+    'display_name': 'Dallas, TX, USA',
+    'properties': {'region_a': 'TX', 'country_a': 'USA'},
+}
+
+
+class GeocodeCacheTests(TestCase):
+    def test_normalize_location(self):
+        self.assertEqual(normalize_location('  Dallas ,TX '), 'dallas, tx')
+        self.assertEqual(normalize_location('DALLAS,  TX.'), 'dallas, tx')
+
+    def test_memory_and_database_tiers(self):
+        cache = GeocodeCache(memory_size=10, memory_ttl=60, db_ttl=60)
+        self.assertIsNone(cache.get('Dallas, TX'))
+
+        cache.set('Dallas, TX', DALLAS)
+        self.assertEqual(cache.get('dallas,tx'), DALLAS)
+
+        # A fresh process only has the database tier
+        restarted = GeocodeCache(memory_size=10, memory_ttl=60, db_ttl=60)
+        self.assertEqual(restarted.get('Dallas, TX')['properties']['region_a'], 'TX')
+        self.assertEqual(restarted.get('Dallas, TX')['lat'], DALLAS['lat'])
+
+        stats = restarted.stats()
+        self.assertEqual(stats['db_hits'], 1)
+        self.assertEqual(stats['memory_hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+
+class RouteCacheTests(TestCase):
+    route = {
+        'distance_miles': 12.5,
+        'duration_seconds': 900.0,
+        'bbox': [-96.8, 32.7, -96.6, 32.9],
+        'geometry': {
+            'type': 'LineString',
+            'coordinates': [[-96.79701, 32.77671], [-96.7, 32.8], [-96.61234, 32.89876]],
+        },
+    }
+
+    def test_key_ignores_sub_precision_noise(self):
+        a = {'lat': 32.77671, 'lon': -96.79701}
+        b = {'lat': 32.77689, 'lon': -96.79712}
+        c = {'lat': 29.76, 'lon': -95.37}
+        self.assertEqual(route_cache_key(a, c, precision=3), route_cache_key(b, c, precision=3))
+        self.assertNotEqual(route_cache_key(a, c), route_cache_key(c, a))
+
+    def test_round_trip_through_disk_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'routes.sqlite3')
+            cache = RouteCache(max_entries=10, max_bytes=10000, ttl_seconds=60, disk_path=path)
+            cache.set('k', self.route)
+            self.assertEqual(cache.get('k'), self.route)
+
+            restarted = RouteCache(max_entries=10, max_bytes=10000, ttl_seconds=60, disk_path=path)
+            self.assertEqual(restarted.get('k'), self.route)
+            self.assertEqual(restarted.stats()['disk_hits'], 1)
+            self.assertIsNone(restarted.get('missing'))
+
+
+class CentroidLookupTests(TestCase):
+    def test_city_then_state_fallback(self):
+        dallas = lookup_centroid(' Dallas ', 'tx')
+        self.assertEqual(dallas['properties']['precision'], 'city')
+        self.assertAlmostEqual(dallas['lat'], 32.7767)
+
+        small_town = lookup_centroid('Big Cabin', 'OK')
+        self.assertEqual(small_town['properties']['precision'], 'state')
+        self.assertIsNone(lookup_centroid('Nowhere', 'ZZ'))
+
+
+class GeometryTests(SimpleTestCase):
+    def test_batched_haversine(self):
+        distances = haversine_miles(35.0, [-100.0, -99.0], 35.0, [-99.0, -97.0])
+        self.assertAlmostEqual(distances[0], 56.6, delta=0.2)
+        self.assertAlmostEqual(distances[1], 2 * distances[0], delta=0.01)
+
+    def test_projection_matches_dense_sampling(self):
+        rng = random.Random(3)
+        coords = [[-100 + i * 0.01, 35 + 0.3 * ((i // 50) % 2) * (i % 50) / 50] for i in range(2500)]
+        route = RouteGeometry.from_geojson({'type': 'LineString', 'coordinates': coords})
+        lats = [rng.uniform(34.8, 35.5) for _ in range(50)]
+        lons = [rng.uniform(-99.9, -75.1) for _ in range(50)]
+
+        route_miles, offsets = route.project(lats, lons)
+
+        dense = [i * route.total_miles / 20000 for i in range(20001)]
+        dense_lats, dense_lons = route.point_at_mile(dense)
+        for i in range(50):
+            distances = haversine_miles(lats[i], lons[i], dense_lats, dense_lons)
+            nearest = int(distances.argmin())
+            self.assertAlmostEqual(offsets[i], distances[nearest], delta=0.05)
+            self.assertAlmostEqual(route_miles[i], dense[nearest], delta=1.0)
+
+
+def make_station(opis_id, lat, lon, price, state='OK', city='Test'):
+    return FuelStation.objects.create(
+        opis_id=opis_id,
+        name=f'STATION {opis_id}',
+        address='I-40',
+        city=city,
+        state=state,
+        rack_id=1,
+        retail_price=price,
+        latitude=lat,
+        longitude=lon,
+    )
+
+
+class GeocodeStationsTests(TestCase):
+    def setUp(self):
+        make_station(1, None, None, '3.0', state='TX', city='El Paso')
+        make_station(2, None, None, '3.1', state='KS', city='Smallville')
+        make_station(3, None, None, '3.2', state='KS', city='Smallville')
+
+    def run_command(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('geocode_stations', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_offline_warns_about_state_centroids(self):
+        out, err = self.run_command('--offline')
+        self.assertIn('0 via ORS, 0 via centroids while ORS was unavailable, 2 via centroids', out)
+        self.assertIn('1 places (2 stations)', err)
+        self.assertFalse(FuelStation.objects.filter(latitude__isnull=True).exists())
+
+    def test_results_from_an_unavailable_ors_are_counted_apart(self):
+        client = mock.Mock()
+        client.geocode.side_effect = CircuitOpenError('ORS geocode unavailable')
+        with mock.patch('api.services.get_ors_client', return_value=client):
+            out, _ = self.run_command('--workers', '1')
+        self.assertIn('0 via ORS, 2 via centroids while ORS was unavailable', out)
+
+        FuelStation.objects.update(latitude=None, longitude=None)
+        with mock.patch('api.services.get_ors_client', return_value=client):
+            out, _ = self.run_command('--no-fallback')
+        self.assertIn('2 failed', out)
+
+
+
+class GeocodeStationsRefineTests(TransactionTestCase):
+    # Worker threads write accepted answers to the geocode cache on their
+    # own connections
+    run_command = GeocodeStationsTests.run_command
+
+    def test_refine_retries_only_state_centroid_stations(self):
+        make_station(1, None, None, '3.0', state='TX', city='El Paso')
+        make_station(2, None, None, '3.1', state='KS', city='Smallville')
+        make_station(4, None, None, '3.3', state='KS', city='Atlantis')
+        make_station(5, None, None, '3.4', state='KS', city='Metropolis')
+        make_station(6, None, None, '3.5', state='KS', city='Gotham')
+        self.run_command('--offline')
+        on_centroid = FuelStation.objects.get(opis_id=5).latitude
+
+        answers = {
+            'Atlantis, KS': ('locality', 'KS', 38.9, -97.6),
+            'Metropolis, KS': ('locality', 'IL', 37.15, -88.73),    # another state
+            'Gotham, KS': ('region', 'KS', 38.5, -98.0),            # no finer than the state
+        }
+
+        def geocode(text, size=1):
+            if text not in answers:
+                raise requests.exceptions.HTTPError(response=ors_response(404))
+            layer, state, lat, lon = answers[text]
+            return {'features': [{
+                'geometry': {'coordinates': [lon, lat]},
+                'properties': {'label': text, 'layer': layer, 'region_a': state, 'country_a': 'USA'},
+            }]}
+
+        client = mock.Mock()
+        client.geocode.side_effect = geocode
+        with mock.patch('api.services.get_ors_client', return_value=client):
+            out, err = self.run_command('--refine', '--workers', '1')
+
+        # El Paso is on its city centroid and isn't retried
+        self.assertEqual(
+            sorted(call.args[0] for call in client.geocode.call_args_list),
+            ['Atlantis, KS', 'Gotham, KS', 'Metropolis, KS', 'Smallville, KS']
+        )
+        self.assertIn('1 via ORS, 0 via centroids while ORS was unavailable, 3 via centroids', out)
+        self.assertIn('Re-run with --refine', err)
+        self.assertEqual(FuelStation.objects.get(opis_id=4).latitude, Decimal('38.9'))
+        self.assertEqual(FuelStation.objects.get(opis_id=5).latitude, on_centroid)
+        self.assertEqual(FuelStation.objects.get(opis_id=6).latitude, on_centroid)
+
+
+class StateLookupTests(SimpleTestCase):
+    def test_point_lookup(self):
+        grid = get_state_grid()
+        self.assertEqual(grid.state_at(39.74, -104.99), 'CO')
+        self.assertEqual(grid.state_at(38.9, -77.03), 'DC')
+        self.assertEqual(grid.state_at(40.71, -74.0), 'NY')
+        self.assertIsNone(grid.state_at(43.65, -79.38))     # Toronto
+        self.assertIsNone(grid.state_at(61.2, -149.9))      # Anchorage, off the grid
+
+    def test_states_along_route_in_order(self):
+        new_york_to_los_angeles = [
+            [-74.0, 40.71], [-75.16, 39.95], [-80.0, 40.44], [-82.99, 39.96], [-86.16, 39.77],
+            [-90.2, 38.63], [-94.58, 39.1], [-104.99, 39.74], [-111.89, 40.76], [-115.14, 36.17],
+            [-118.24, 34.05],
+        ]
+        self.assertEqual(
+            states_along_route(new_york_to_los_angeles),
+            ['NY', 'NJ', 'PA', 'WV', 'OH', 'IN', 'IL', 'MO', 'KS', 'CO', 'UT', 'NV', 'CA']
+        )
+
+
+class RouteStatesFallbackTests(TestCase):
+    def test_stops_follow_the_states_the_route_crosses(self):
+        # Dallas to Wichita runs through TX, OK and KS; NM is off the route
+        wichita = dict(DALLAS, lat=37.6872, lon=-97.3301, display_name='Wichita, KS, USA',
+                       properties={'region_a': 'KS', 'country_a': 'USA'})
+        route_data = {
+            'start': DALLAS,
+            'end': wichita,
+            'distance_miles': 360.0,
+            'geometry': {'type': 'LineString', 'coordinates': [[-96.797, 32.7767], [-97.3301, 37.6872]]},
+        }
+        for opis_id, state, price in [(1, 'TX', '3.50'), (2, 'OK', '3.00'), (3, 'KS', '3.20'), (4, 'NM', '1.00')]:
+            make_station(opis_id, None, None, price, state=state)
+        
+        stops = RouteService().find_optimal_fuel_stops(
+            route_data, tank_range_miles=250, station_index=StationIndex(StationSnapshot.load())
+        )
+        self.assertEqual([stop['station'].opis_id for stop in stops], [2])
+        self.assertEqual(get_state_grid().state_at(stops[0]['latitude'], stops[0]['longitude']), 'OK')
+
+
+class StartupWarmupTests(SimpleTestCase):
+    def test_only_server_processes_warm_the_station_index(self):
+        cases = [
+            (['gunicorn', 'FuelOptimizedRouteAPIProject.wsgi'], {}, True),
+            (['manage.py', 'runserver', '--noreload'], {}, True),
+            (['manage.py', 'runserver'], {'RUN_MAIN': 'true'}, True),
+            (['manage.py', 'runserver'], {}, False),
+            (['manage.py', 'migrate'], {}, False),
+            (['manage.py', 'test'], {}, False),
+        ]
+        base = {name: value for name, value in os.environ.items() if name != 'RUN_MAIN'}
+        for argv, environ, serving in cases:
+            with mock.patch.object(sys, 'argv', argv), mock.patch.dict(os.environ, {**base, **environ}, clear=True):
+                self.assertEqual(is_serving(), serving, argv)
+
+    def test_ready_starts_the_warmup_in_the_background(self):
+        config = apps.get_app_config('api')
+        with mock.patch('api.apps.is_serving', return_value=True), \
+                mock.patch('api.apps.threading.Thread') as thread:
+            config.ready()
+        self.assertIs(thread.call_args.kwargs['target'], warm_station_index)
+        thread.return_value.start.assert_called_once_with()
+
+
+class StationIndexTests(TestCase):
+    # Straight east-west line along 35N, roughly 113 miles long
+    route = [[-100.0, 35.0], [-99.0, 35.0], [-98.0, 35.0]]
+
+    def test_corridor_lookup(self):
+        make_station(1, 35.0, -99.5, '3.10')
+        make_station(2, 35.07, -98.5, '3.00')     # ~5 miles north
+        make_station(3, 36.5, -99.0, '2.50')      # ~100 miles north
+        make_station(4, None, None, '2.00')       # not geocoded yet
+
+        index = StationIndex(StationSnapshot.load(), cell_degrees=0.25)
+        self.assertEqual(len(index.snapshot), 4)
+        self.assertEqual(len(index), 3)
+
+        corridor = index.stations_near_polyline(self.route, 10)
+        self.assertEqual([c.station.opis_id for c in corridor], [1, 2])
+        self.assertEqual(corridor[0].station.retail_price, 3.1)
+        self.assertAlmostEqual(corridor[0].route_mile, 28.3, delta=0.5)
+        self.assertAlmostEqual(corridor[1].offset_miles, 4.8, delta=0.2)
+
+    @override_settings(STATION_INDEX_REFRESH_SECONDS=0)
+    def test_snapshot_swapped_when_stations_change(self):
+        on_route = make_station(1, 35.0, -99.5, '3.10')
+        far = make_station(3, 36.5, -99.0, '2.50')
+
+        index = get_station_index()
+        self.assertIs(get_station_index(), index)
+        self.assertEqual([c.station.opis_id for c in index.stations_near_polyline(self.route, 10)], [1])
+
+        far.latitude = '35.01'
+        far.save()
+        on_route.delete()
+        swapped = get_station_index()
+        self.assertIsNot(swapped.snapshot, index.snapshot)
+        self.assertEqual([c.station.opis_id for c in swapped.stations_near_polyline(self.route, 10)], [3])
+        # The old snapshot is untouched for requests still holding it
+        self.assertEqual([c.station.opis_id for c in index.stations_near_polyline(self.route, 10)], [1])
+
+    def test_cheapest_per_cell_and_incremental_reprice(self):
+        # Four stations in one 0.25 degree cell, one in the next
+        for opis_id, lon, price in [(1, -99.9, '3.40'), (2, -99.85, '3.10'), (3, -99.8, '3.30'),
+                                    (4, -99.95, '3.20'), (5, -99.6, '3.50')]:
+            make_station(opis_id, 35.0, lon, price)
+        index = StationIndex(StationSnapshot.load(), cell_degrees=0.25)
+
+        def cheapest(index):
+            return [c.station.opis_id for c in index.stations_near_polyline(self.route, 10, per_cell=2)]
+
+        self.assertEqual(cheapest(index), [4, 2, 5])
+        self.assertEqual(len(index.stations_near_polyline(self.route, 10)), 5)
+
+        FuelStation.objects.filter(opis_id=1).update(retail_price='2.90')
+        repriced = StationIndex(StationSnapshot.load(), cell_degrees=0.25, previous=index)
+        self.assertIs(repriced.cells, index.cells)
+        self.assertEqual(cheapest(repriced), [1, 2, 5])
+        rebuilt = StationIndex(repriced.snapshot, cell_degrees=0.25)
+        self.assertTrue(np.array_equal(repriced.rows, rebuilt.rows))
+        # The previous index keeps its own order
+        self.assertEqual(cheapest(index), [4, 2, 5])
+
+
+def brute_force_cost(candidates, total, tank, start, reserve):
+    """Exact DP over integer fuel levels (1 mpg) used to check the solver"""
+    capacity = tank - reserve
+    states = {start - reserve: 0.0}
+    position = 0
+    for mile, price in sorted(candidates) + [(total, 0)]:
+        arrived = {}
+        for fuel, cost in states.items():
+            left = fuel - (mile - position)
+            if left >= 0:
+                arrived[left] = min(arrived.get(left, float('inf')), cost)
+        if mile == total:
+            return min(arrived.values()) if arrived else None
+
+        states = {}
+        for fuel, cost in arrived.items():
+            for level in range(fuel, capacity + 1):
+                states[level] = min(states.get(level, float('inf')), cost + (level - fuel) * price)
+        position = mile
+
+
+class RefuellingSolverTests(SimpleTestCase):
+    def test_buys_just_enough_to_reach_cheaper_station(self):
+        stops = plan_refuelling(
+            [Candidate(100, 4.0, 'a'), Candidate(300, 3.0, 'b'), Candidate(450, 3.5, 'c')],
+            total_distance=700, fuel_efficiency_mpg=10, tank_range_miles=400,
+            start_fuel_fraction=0.5
+        )
+        # 200 miles of fuel to start: top up at the dear station only as far
+        # as the cheap one, then buy the rest of the trip there
+        self.assertEqual([s.payload for s in stops], ['a', 'b'])
+        self.assertAlmostEqual(stops[0].gallons, 10.0)
+        self.assertAlmostEqual(stops[1].gallons, 40.0)
+
+    def test_reserve_margin(self):
+        stops = plan_refuelling(
+            [Candidate(250, 3.0, 'a')],
+            total_distance=450, fuel_efficiency_mpg=10, tank_range_miles=300,
+            reserve_miles=50
+        )
+        # Arrive at mile 250 with the 50-mile reserve, leave with enough
+        # for 200 miles plus reserve
+        self.assertAlmostEqual(stops[0].gallons, 20.0)
+
+    def test_unreachable_gap(self):
+        with self.assertRaises(ValueError):
+            plan_refuelling([Candidate(100, 3.0, 'a')], 800, 10, 500)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            total, tank = rng.randint(5, 60), rng.randint(4, 15)
+            reserve = rng.randint(0, 2)
+            start = rng.randint(reserve, tank)
+            candidates = [(rng.randint(0, total - 1), rng.randint(1, 9)) for _ in range(rng.randint(0, 10))]
+
+            expected = brute_force_cost(candidates, total, tank, start, reserve)
+            try:
+                plan = plan_refuelling(
+                    [Candidate(m, p, None) for m, p in candidates],
+                    total, 1.0, tank, start / tank, reserve
+                )
+            except ValueError:
+                self.assertIsNone(expected)
+                continue
+            self.assertAlmostEqual(sum(s.gallons * s.price for s in plan), expected)
+
+
+@override_settings(OPENROUTESERVICE_API_KEY='test-key')
+class AsyncRouteViewTests(TestCase):
+    url = '/api/calculate_route/async/'
+
+    async def test_rejects_invalid_payload(self):
+        response = await self.async_client.post(self.url, {'start_location': 'Dallas, TX'},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('end_location', response.json())
+
+    async def test_cached_route_end_to_end(self):
+        fort_worth = dict(DALLAS, lat=32.7555, lon=-97.3308, display_name='Fort Worth, TX, USA')
+        geocode_cache = get_geocode_cache()
+        await geocode_cache.aset('Dallas, TX', DALLAS)
+        await geocode_cache.aset('Fort Worth, TX', fort_worth)
+        get_route_cache().set(route_cache_key(DALLAS, fort_worth), RouteCacheTests.route)
+
+        response = await self.async_client.post(
+            self.url,
+            {'start_location': 'Dallas, TX', 'end_location': 'Fort Worth, TX'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body['route']['end_location'], 'Fort Worth, TX, USA')
+        self.assertEqual(body['summary']['num_stops'], 0)
+        self.assertEqual(await Route.objects.acount(), 1)
+
+
+class WaypointRouteTests(TestCase):
+    def test_single_directions_call_across_legs(self):
+        waco = dict(DALLAS, lat=31.5493, lon=-97.1467, display_name='Waco, TX, USA')
+        austin = dict(DALLAS, lat=30.2672, lon=-97.7431, display_name='Austin, TX, USA')
+        for name, place in [('Dallas, TX', DALLAS), ('Waco, TX', waco), ('Austin, TX', austin)]:
+            get_geocode_cache().set(name, place)
+
+        client = mock.Mock()
+        client.directions.return_value = {
+            'bbox': [-97.8, 30.2, -96.7, 32.8],
+            'features': [{
+                'geometry': {
+                    'type': 'LineString',
+                    'coordinates': [[-96.797, 32.7767], [-97.1467, 31.5493], [-97.7431, 30.2672]],
+                },
+                'properties': {
+                    'summary': {'distance': 310000.0, 'duration': 11000.0},
+                    'segments': [
+                        {'distance': 150000.0, 'duration': 5400.0},
+                        {'distance': 160000.0, 'duration': 5600.0},
+                    ],
+                },
+            }],
+        }
+        with mock.patch('api.services.get_ors_client', return_value=client):
+            response = self.client.post(
+                '/api/calculate_route/',
+                {'start_location': 'Dallas, TX', 'end_location': 'Austin, TX', 'waypoints': ['Waco, TX']},
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(client.directions.call_count, 1)
+        self.assertEqual(len(client.directions.call_args.args[0]), 3)
+
+        body = response.json()
+        self.assertEqual(body['route']['waypoints'], ['Waco, TX, USA'])
+        self.assertEqual([leg['to'] for leg in body['legs']], ['Waco, TX, USA', 'Austin, TX, USA'])
+        # A full 50 gallon tank carries over from the first leg into the second
+        self.assertEqual(body['legs'][0]['fuel_on_arrival_gallons'], 40.7)
+        self.assertEqual(body['legs'][1]['fuel_on_arrival_gallons'], 30.7)
+        self.assertEqual(Route.objects.get().waypoints, ['Waco, TX, USA'])
+
+
+class ConcurrentGeocodeTests(TestCase):
+    places = {
+        'Abilene, TX': (-99.7331, 32.4487, 0.15),
+        'Odessa, TX': (-102.3676, 31.8457, 0.1),
+        'Midland, TX': (-102.0779, 31.9973, 0.05),
+        'Tyler, TX': (-95.3011, 32.3513, 0.0),
+    }
+
+    def make_service(self, geocode):
+        client = mock.Mock()
+        client.geocode.side_effect = geocode
+        with mock.patch('api.services.get_ors_client', return_value=client):
+            service = RouteService()
+        service.geocode_cache = GeocodeCache(memory_size=16)
+        return service
+
+    def ors_geocode(self, text, size=1):
+        if text not in self.places:
+            return {'features': []}
+        lon, lat, delay = self.places[text]
+        time.sleep(delay)
+        return {'features': [{
+            'geometry': {'coordinates': [lon, lat]},
+            'properties': {'label': f"{text}, USA", 'country_a': 'USA', 'region_a': 'TX'},
+        }]}
+
+    def test_results_keep_input_order(self):
+        service = self.make_service(self.ors_geocode)
+        locations = list(self.places) + ['Abilene, TX']
+        started = time.monotonic()
+        results = service.geocode_locations(locations)
+        # Lookups overlap (later ones finish first) instead of running in turn
+        self.assertLess(time.monotonic() - started, 0.28)
+        self.assertEqual([result['display_name'] for result in results], [f"{name}, USA" for name in locations])
+        self.assertEqual(service.client.geocode.call_count, 4)
+
+    def test_failure_cancels_pending_lookups_and_is_raised(self):
+        release = threading.Event()
+        called = []
+
+        def geocode(text, size=1):
+            called.append(text)
+            if text == 'Tyler, TX':
+                release.wait(5)
+            return self.ors_geocode(text, size)
+
+        service = self.make_service(geocode)
+        # One worker: while it is busy the remaining lookups wait in the queue
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with mock.patch('api.services.get_geocode_pool', return_value=pool):
+                with self.assertRaisesMessage(ValueError, 'Location not found: Nowhere, TX'):
+                    service.geocode_locations(['Nowhere, TX', 'Tyler, TX', 'Odessa, TX', 'Midland, TX'])
+                release.set()
+
+        self.assertNotIn('Odessa, TX', called)
+        self.assertNotIn('Midland, TX', called)
+        self.assertIsNone(service.geocode_cache.get('Tyler, TX'))
+
+
+class InfeasiblePlanTests(TestCase):
+    def setUp(self):
+        self.houston = dict(DALLAS, lat=29.7604, lon=-95.3698, display_name='Houston, TX, USA')
+        get_geocode_cache().set('Dallas, TX', DALLAS)
+        get_geocode_cache().set('Houston, TX', self.houston)
+        get_route_cache().set(route_cache_key(DALLAS, self.houston), {
+            'distance_miles': 283.0,
+            'duration_seconds': 15000.0,
+            'bbox': [-96.8, 29.76, -95.37, 32.78],
+            'geometry': {'type': 'LineString', 'coordinates': [[-96.797, 32.7767], [-95.3698, 29.7604]]},
+        })
+
+    def post(self, **options):
+        return self.client.post(
+            '/api/calculate_route/',
+            {'start_location': 'Dallas, TX', 'end_location': 'Houston, TX', **options},
+            content_type='application/json'
+        )
+
+    def test_start_fuel_below_reserve_is_rejected(self):
+        response = self.post(start_fuel_fraction=0.1, reserve_miles=100)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Starting fuel is below the reserve margin', str(response.json()))
+
+    def test_no_stations_along_the_route_is_a_400(self):
+        # An empty tank needs a station at the start; there is none
+        response = self.post(start_fuel_fraction=0)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'No fuel stations found along the route')
+        self.assertEqual(self.post().status_code, 201)
+
+    @override_settings(STATION_INDEX_REFRESH_SECONDS=0)
+    def test_ungeocoded_stations_are_planned_by_state(self):
+        # Imported but not geocoded: only the state is known
+        make_station(1, None, None, '3.50', state='TX')
+        make_station(2, None, None, '3.10', state='TX')
+        make_station(3, None, None, '2.00', state='OK')
+        response = self.post(tank_range_miles=200)
+        self.assertEqual(response.status_code, 201)
+        
+        # Cheapest station in the state the route crosses, never past the end
+        stops = response.json()['fuel_stops']
+        self.assertEqual([stop['location'] for stop in stops], ['STATION 2, Test, TX'])
+        self.assertLessEqual(stops[0]['mile_marker'], 200)
+        self.assertEqual(self.post(tank_range_miles=100).json()['summary']['num_stops'], 2)
+        
+        # A geocoded corridor is preferred
+        make_station(4, 31.0, -95.95, '3.90', state='TX')
+        stops = self.post(tank_range_miles=200).json()['fuel_stops']
+        self.assertEqual([stop['location'] for stop in stops], ['STATION 4, Test, TX'])
+
+
+def make_route_data(stations):
+    """Calculated route data with one stop per station, as the service returns it"""
+    route_data = dict(RouteCacheTests.route, start=DALLAS, end=DALLAS)
+    stops = [
+        {
+            'station': station,
+            'stop_order': order,
+            'distance_from_start': 100.0 * order + 0.123456,
+            'gallons_to_fill': 12.3456,
+            'cost': 40.0 / 3,
+            'latitude': 32.123456789,
+            'longitude': -97.987654321,
+        }
+        for order, station in enumerate(stations, start=1)
+    ]
+    return route_data, stops
+
+
+class RoutePersistenceTests(TestCase):
+    def test_single_bulk_insert_per_table(self):
+        stations = [make_station(i, 32.0, -97.0, '3.1') for i in range(3)]
+        route_data, stops = make_route_data(stations)
+
+        # savepoint, route insert, stop insert, release
+        with self.assertNumQueries(4):
+            route = save_route(route_data, stops, 10.0, 500.0)
+
+        saved = list(route.fuel_stops.order_by('stop_order'))
+        self.assertEqual(len(saved), 3)
+        self.assertEqual(str(saved[0].distance_from_start_miles), '100.12')
+        self.assertEqual(str(saved[0].latitude), '32.1234568')
+        self.assertEqual(str(Route.objects.get().total_fuel_cost), '40.00')
+
+
+class RouteWriterTests(TransactionTestCase):
+    def test_background_writer_batches_routes(self):
+        station = make_station(1, 32.0, -97.0, '3.1')
+        writer = RouteWriter(max_size=10, batch_size=5)
+        for _ in range(4):
+            route_data, stops = make_route_data([station])
+            self.assertTrue(writer.submit(build_route_rows(route_data, stops, 10.0, 500.0)))
+        writer.flush()
+
+        self.assertEqual(writer.written, 4)
+        self.assertEqual(Route.objects.count(), 4)
+        self.assertEqual(FuelStop.objects.filter(route__isnull=False).count(), 4)
+
+
+class ImportFuelPricesTests(TestCase):
+    header = 'OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price\n'
+
+    def run_import(self, rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.header + rows)
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_fuel_prices', f.name, '--chunk-size', '2', stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_upsert_is_idempotent_and_dedupes(self):
+        rows = (
+            '7,WOODSHED,"I-44, EXIT 283",Big Cabin   ,OK,307,3.00733333\n'
+            '9,KWIK TRIP,I-94,Tomah,WI,420,3.287\n'
+            '7,WOODSHED,"I-44, EXIT 283",Big Cabin,OK,307,2.95\n'
+            '11,PILOT,I-8,Gila Bend,AZ,930,3.899\n'
+        )
+        self.assertIn('3 created', self.run_import(rows))
+        self.assertEqual(FuelStation.objects.count(), 3)
+        station = FuelStation.objects.get(opis_id=7)
+        self.assertEqual(str(station.retail_price), '2.95000')
+        self.assertEqual(station.city, 'Big Cabin')
+
+        # Re-running writes nothing; a price change updates one row in place
+        self.assertIn('0 created, 0 updated, 3 unchanged', self.run_import(rows))
+        output = self.run_import(rows.replace('3.287', '3.199'))
+        self.assertIn('0 created, 1 updated, 2 unchanged', output)
+        self.assertEqual(FuelStation.objects.count(), 3)
+        self.assertEqual(str(FuelStation.objects.get(opis_id=9).retail_price), '3.19900')
+        self.assertEqual(FuelStation.objects.get(opis_id=7).pk, station.pk)
+
+        # Runs that change something are recorded, with snapshots only for
+        # new or changed prices
+        self.assertEqual(
+            list(PriceImport.objects.order_by('imported_at').values_list('changed_count', flat=True)),
+            [3, 1]
+        )
+        self.assertEqual(station.price_snapshots.count(), 1)
+
+    def test_address_change_clears_coordinates(self):
+        rows = '7,WOODSHED,"I-44, EXIT 283",Big Cabin,OK,307,3.00\n9,KWIK TRIP,I-94,Tomah,WI,420,3.28\n'
+        self.run_import(rows)
+        FuelStation.objects.update(latitude='36.5', longitude='-95.2')
+
+        # A new price keeps the coordinates, a new address drops them
+        self.run_import(rows.replace('3.28', '3.19').replace('EXIT 283', 'EXIT 289'))
+        self.assertEqual(
+            dict(FuelStation.objects.values_list('opis_id', 'latitude')),
+            {7: None, 9: Decimal('36.5')}
+        )
+
+    def test_missing_columns_leave_no_import(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('OPIS Truckstop ID,Truckstop Name\n7,WOODSHED\n')
+        self.addCleanup(os.remove, f.name)
+        with self.assertRaisesMessage(CommandError, 'CSV is missing columns'):
+            call_command('import_fuel_prices', f.name, stdout=StringIO())
+        self.assertFalse(PriceImport.objects.exists())
+
+
+class PriceHistoryTests(TestCase):
+    def test_price_as_of(self):
+        cheap = make_station(1, 35.0, -97.0, '3.0')
+        late = make_station(2, 35.0, -97.5, '2.5')
+
+        january = PriceImport.objects.create(imported_at=datetime(2025, 1, 1, tzinfo=timezone.utc))
+        march = PriceImport.objects.create(imported_at=datetime(2025, 3, 1, tzinfo=timezone.utc))
+        record_price_snapshots(january, {cheap.id: Decimal('3.10000')})
+        record_price_snapshots(march, {cheap.id: Decimal('3.00000'), late.id: Decimal('2.50000')})
+
+        february = datetime(2025, 2, 1, tzinfo=timezone.utc)
+        self.assertEqual(prices_as_of([cheap.id, late.id], february), {cheap.id: Decimal('3.10000')})
+        self.assertEqual(
+            prices_as_of([cheap.id, late.id], march.imported_at),
+            {cheap.id: Decimal('3.00000'), late.id: Decimal('2.50000')}
+        )
+        self.assertEqual(FuelPriceSnapshot.objects.filter(station=cheap).first().price_import, march)
+
+
+
+class RateLimitTests(SimpleTestCase):
+    def test_bucket_is_shared_through_the_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ratelimit.sqlite3')
+            # Two instances stand in for two worker processes
+            first = TokenBucket(path, {'geocode': 1.0, 'directions': 0}, burst=2)
+            second = TokenBucket(path, {'geocode': 1.0, 'directions': 0}, burst=2)
+
+            self.assertEqual(first.try_acquire('geocode'), 0.0)
+            self.assertEqual(second.try_acquire('geocode'), 0.0)
+            self.assertGreater(first.try_acquire('geocode'), 0.5)
+            self.assertEqual(second.try_acquire('directions'), 0.0)
+
+            second.pause('geocode', 30)
+            self.assertGreater(first.try_acquire('geocode'), 29)
+            with self.assertRaises(RateLimitTimeout):
+                first.acquire('geocode', max_wait=0.1)
+
+    async def test_async_acquire_waits_off_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ratelimit.sqlite3')
+            bucket = TokenBucket(path, {'geocode': 1.0}, burst=1)
+            # Another process holding the write lock
+            holder = sqlite3.connect(path, isolation_level=None)
+            holder.execute('BEGIN IMMEDIATE')
+            acquire = asyncio.ensure_future(bucket.aacquire('geocode', max_wait=5))
+
+            ticks = 0
+            for _ in range(10):
+                await asyncio.sleep(0.02)
+                ticks += 1
+            self.assertFalse(acquire.done())
+            holder.execute('COMMIT')
+            await asyncio.wait_for(acquire, 5)
+            holder.close()
+            self.assertEqual(ticks, 10)
+            await bucket.apause('geocode', 30)
+            self.assertGreater(bucket.try_acquire('geocode'), 29)
+
+    def test_identical_concurrent_calls_share_one_request(self):
+        flights = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return {'features': []}
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(flights.do, ('GET', '/geocode/search', 'dallas'), fetch) for _ in range(8)]
+            time.sleep(0.1)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+        # Errors reach every waiter, and the next call starts afresh
+        with self.assertRaises(ValueError):
+            flights.do('k', mock.Mock(side_effect=ValueError('boom')))
+        self.assertEqual(flights.do('k', lambda: 2), 2)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_fails_fast_and_recovers_through_a_trial(self):
+        breaker = CircuitBreaker('directions', failure_threshold=2, reset_seconds=0.05, slow_seconds=1.0)
+        breaker.record_failure()
+        breaker.before_call()
+        # A call slower than slow_seconds counts as a failure
+        breaker.record_success(elapsed=2.0)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()
+        # Only one trial goes through while half-open
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_success(elapsed=0.1)
+        self.assertEqual(breaker.state, 'closed')
+        breaker.before_call()
+
+    def test_open_breaker_skips_the_network(self):
+        breaker = CircuitBreaker('geocode', failure_threshold=1, reset_seconds=60)
+        breaker.record_failure()
+        client = ORSClient('key', 'http://ors.invalid', limiter=mock.Mock(),
+                           breakers={'geocode': breaker, 'directions': breaker})
+        client.session = mock.Mock()
+        with self.assertRaises(CircuitOpenError):
+            client.geocode('Dallas, TX')
+        client.session.request.assert_not_called()
+
+    def test_both_clients_count_bad_bodies_but_not_429s(self):
+        breaker = CircuitBreaker('geocode', failure_threshold=5)
+        breakers = {'geocode': breaker, 'directions': breaker}
+        throttled = ors_response(429)
+        garbled = ors_response(200)
+        garbled._content = b'<html>Bad Gateway</html>'
+
+        client = ORSClient('key', 'http://ors.invalid', max_retries=0, limiter=mock.Mock(), breakers=breakers)
+        client.session.request = mock.Mock(side_effect=[throttled, garbled])
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.geocode('Dallas, TX')
+        self.assertEqual(breaker.failures, 0)
+        with self.assertRaises(ORSRequestError) as raised:
+            client.geocode('Dallas, TX')
+        self.assertTrue(is_upstream_failure(raised.exception))
+        self.assertEqual(breaker.failures, 1)
+
+        async def send(request):
+            return httpx.Response(429 if request.url.params['text'] == 'Throttled' else 200,
+                                  content=b'<html>Bad Gateway</html>')
+
+        async def geocode(text):
+            client = AsyncORSClient('key', 'http://ors.invalid', max_retries=0, limiter=mock.AsyncMock(),
+                                    breakers=breakers)
+            client.client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(send))
+            try:
+                return await client.geocode(text)
+            finally:
+                await client.aclose()
+
+        with self.assertRaises(ORSRequestError) as raised:
+            asyncio.run(geocode('Throttled'))
+        self.assertEqual(raised.exception.response.status_code, 429)
+        self.assertEqual(breaker.failures, 0)
+        with self.assertRaises(ORSRequestError) as raised:
+            asyncio.run(geocode('Dallas, TX'))
+        self.assertTrue(is_upstream_failure(raised.exception))
+        self.assertEqual(breaker.failures, 1)
+
+
+def ors_response(status_code, body=None, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = 'http://ors.invalid/geocode/search'
+    response._content = json.dumps(body or {}).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+class ORSClientTests(SimpleTestCase):
+    def make_client(self, *responses, max_retries=2):
+        breaker = CircuitBreaker('geocode', failure_threshold=100)
+        client = ORSClient('key', 'http://ors.invalid', max_retries=max_retries, backoff=0.5,
+                           limiter=mock.Mock(), breakers={'geocode': breaker, 'directions': breaker})
+        client.session.request = mock.Mock(side_effect=list(responses))
+        return client
+
+    @mock.patch('api.ors_client.time.sleep')
+    def test_retries_5xx_and_429_honouring_retry_after(self, sleep):
+        client = self.make_client(
+            ors_response(503, headers={'Retry-After': '2'}),
+            ors_response(429, headers={'Retry-After': '7'}),
+            ors_response(200, {'features': []})
+        )
+        self.assertEqual(client.geocode('Dallas, TX'), {'features': []})
+        self.assertEqual(client.session.request.call_count, 3)
+        sleep.assert_called_once_with(2.0)
+        # A 429 holds back the shared bucket instead of sleeping here
+        client.limiter.pause.assert_called_once_with('geocode', 7.0)
+
+    @mock.patch('api.ors_client.time.sleep')
+    def test_gives_up_after_max_attempts(self, sleep):
+        client = self.make_client(*[ors_response(502) for _ in range(3)])
+        with self.assertRaises(requests.exceptions.HTTPError) as raised:
+            client.geocode('Dallas, TX')
+        self.assertEqual(raised.exception.response.status_code, 502)
+        self.assertEqual(client.session.request.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        # Backoff without Retry-After: full jitter under base * 2 ** attempt
+        self.assertLessEqual(sleep.call_args_list[1].args[0], 1.0)
+
+    @mock.patch('api.ors_client.time.sleep')
+    def test_client_errors_are_not_retried(self, sleep):
+        client = self.make_client(ors_response(404), ors_response(200))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.geocode('Nowhere')
+        self.assertEqual(client.session.request.call_count, 1)
+        sleep.assert_not_called()
+
+    @mock.patch('api.ors_client.time.sleep')
+    def test_connection_errors_are_retried_with_timeouts(self, sleep):
+        client = self.make_client(requests.exceptions.ConnectTimeout(), ors_response(200, {'features': []}))
+        client.geocode('Dallas, TX')
+        self.assertEqual(client.session.request.call_count, 2)
+        self.assertEqual(client.session.request.call_args.kwargs['timeout'],
+                         (client.timeouts['connect'], client.timeouts['geocode']))
+
+    def test_one_pooled_session_per_client(self):
+        client = get_ors_client('pool-key', 'http://ors.invalid')
+        self.assertIs(get_ors_client('pool-key', 'http://ors.invalid'), client)
+        self.assertIsNot(get_ors_client('other-key', 'http://ors.invalid'), client)
+
+        session = client.session
+        with mock.patch.object(session, 'request', return_value=ors_response(200, {'features': []})) as request:
+            client.geocode('Dallas, TX')
+            client.directions([[-96.797, 32.7767], [-97.7431, 30.2672]])
+        self.assertIs(client.session, session)
+        self.assertEqual(request.call_count, 2)
+        adapter = session.get_adapter('http://ors.invalid')
+        self.assertEqual(adapter._pool_maxsize, client.pool_size)
+
+
+class DegradedRouteTests(TestCase):
+    def setUp(self):
+        self.client_mock = mock.Mock()
+        self.client_mock.geocode.side_effect = CircuitOpenError('ORS geocode unavailable')
+        self.client_mock.directions.side_effect = CircuitOpenError('ORS directions unavailable')
+        patcher = mock.patch('api.services.get_ors_client', return_value=self.client_mock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_estimate_from_centroids_when_ors_is_down(self):
+        response = self.client.post(
+            '/api/calculate_route/',
+            {'start_location': 'Amarillo, TX', 'end_location': 'Lubbock, TX'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertTrue(body['degraded'])
+        self.assertEqual(body['route']['source'], 'estimate')
+        self.assertEqual(body['route']['approximate_locations'], ['Amarillo, TX', 'Lubbock, TX'])
+        straight = haversine_miles(35.2220, -101.8313, 33.5779, -101.8552)
+        self.assertAlmostEqual(body['route']['distance_miles'], round(straight * 1.2), delta=1)
+
+        # Nothing from the outage is cached or stored
+        self.assertIsNone(get_geocode_cache().get('Amarillo, TX'))
+        self.assertEqual(Route.objects.count(), 0)
+
+    def test_expired_cached_route_is_served_while_directions_are_down(self):
+        fort_worth = dict(DALLAS, lat=32.7555, lon=-97.3308, display_name='Fort Worth, TX, USA')
+        service = RouteService()
+        service.route_cache = RouteCache(ttl_seconds=0.01, disk_path='')
+        service.route_cache.set(route_cache_key(DALLAS, fort_worth), RouteCacheTests.route)
+        time.sleep(0.02)
+
+        route_data = service.calculate_route(DALLAS, fort_worth)
+        self.assertTrue(route_data['degraded'])
+        self.assertEqual(route_data['source'], 'stale_cache')
+        self.assertEqual(route_data['distance_miles'], RouteCacheTests.route['distance_miles'])
+
+    def test_unresolvable_location_is_503(self):
+        response = self.client.post(
+            '/api/calculate_route/',
+            {'start_location': '1600 Main Street', 'end_location': 'Lubbock, TX'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 503)
+
+
+class StubRouteService:
+    """Stands in for RouteService in batch tests, recording upstream calls"""
+    places = {
+        'Dallas, TX': DALLAS,
+        'Austin, TX': dict(DALLAS, lat=30.2672, lon=-97.7431, display_name='Austin, TX, USA'),
+        'Tulsa, OK': dict(DALLAS, lat=36.154, lon=-95.9928, display_name='Tulsa, OK, USA'),
+    }
+
+    def __init__(self):
+        self.geocoded = []
+        self.routed = []
+
+    def geocode_location(self, location):
+        self.geocoded.append(location)
+        if location not in self.places:
+            raise ValueError(f"Location not found: {location}")
+        return self.places[location]
+
+    def calculate_route(self, start, end, waypoints=None):
+        self.routed.append((start['display_name'], end['display_name']))
+        return dict(RouteCacheTests.route, start=start, end=end)
+
+    def find_optimal_fuel_stops(self, route_data, station_index=None, **options):
+        return []
+
+
+class RouteBatchTests(TestCase):
+    def test_dedupes_upstream_calls_and_isolates_errors(self):
+        service = StubRouteService()
+        items = [
+            BatchItem('Dallas, TX', 'Austin, TX', {}),
+            BatchItem('Dallas, TX', 'Austin, TX', {}),
+            BatchItem('Austin, TX', 'Tulsa, OK', {}),
+            BatchItem('Dallas, TX', 'Nowhere', {}),
+        ]
+        batch = RouteBatch(service, concurrency=4)
+        results = batch.run(items)
+
+        self.assertEqual(sorted(service.geocoded), ['Austin, TX', 'Dallas, TX', 'Nowhere', 'Tulsa, OK'])
+        self.assertEqual(len(service.routed), 2)
+        self.assertEqual((batch.unique_locations, batch.unique_routes), (4, 2))
+        self.assertIs(results[0].route_data, results[1].route_data)
+        self.assertEqual(results[2].route_data['end']['display_name'], 'Tulsa, OK, USA')
+        self.assertIsInstance(results[3].error, ValueError)
+
+    @override_settings(ROUTE_PERSISTENCE_MODE='sync')
+    def test_endpoint_returns_per_item_results(self):
+        with mock.patch('api.views.RouteService', StubRouteService):
+            response = self.client.post('/api/calculate_route/batch/', {'routes': [
+                {'start_location': 'Dallas, TX', 'end_location': 'Austin, TX'},
+                {'start_location': 'Dallas, TX'},
+                {'start_location': 'Tulsa, OK', 'end_location': 'Nowhere'},
+            ]}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['ok', 'invalid', 'error'])
+        self.assertEqual(results[0]['route']['end_location'], 'Austin, TX, USA')
+        self.assertIn('end_location', results[1]['errors'])
+        self.assertEqual(response.json()['summary']['succeeded'], 1)
+        self.assertEqual(Route.objects.count(), 1)
+
+    def test_endpoint_streams_ndjson(self):
+        with mock.patch('api.views.RouteService', StubRouteService):
+            response = self.client.post('/api/calculate_route/batch/?format=ndjson', {'routes': [
+                {'start_location': 'Dallas, TX', 'end_location': 'Austin, TX'},
+                {'start_location': 'Dallas, TX'},
+            ]}, content_type='application/json')
+
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual([line.get('status') for line in lines[:2]], ['invalid', 'ok'])
+        self.assertEqual(lines[-1]['summary']['succeeded'], 1)
+
+
+@override_settings(STATION_INDEX_REFRESH_SECONDS=0)
+class FleetPlannerTests(TestCase):
+    def setUp(self):
+        for opis_id, lon, price in [(1, -99.6, '3.20'), (2, -99.2, '2.80'), (3, -98.8, '3.40'), (4, -98.4, '3.00')]:
+            make_station(opis_id, 35.0, lon, price)
+
+        self.service = RouteService()
+        self.service.geocode_location = lambda location: dict(DALLAS, display_name=location)
+        self.service.calculate_route = lambda start, end, waypoints=None: dict(
+            RouteCacheTests.route,
+            start=start,
+            end=end,
+            distance_miles=113.0,
+            geometry={'type': 'LineString', 'coordinates': StationIndexTests.route}
+        )
+        self.vehicles = [
+            BatchItem('Dallas, TX', 'Austin, TX', {'fuel_efficiency_mpg': mpg, 'tank_range_miles': tank})
+            for mpg in (6.0, 8.0, 10.0)
+            for tank in (50.0, 60.0, 80.0, 200.0)
+        ]
+
+    def test_parallel_plans_match_single_route_planning(self):
+        expected = [
+            self.service.find_optimal_fuel_stops(self.service.calculate_route(DALLAS, DALLAS), **vehicle.options)
+            for vehicle in self.vehicles
+        ]
+
+        inline = FleetPlanner(self.service, workers=1).plan(self.vehicles)
+        parallel = FleetPlanner(self.service, workers=2)
+        parallel.parallel_threshold = 0
+        pooled = parallel.plan(self.vehicles)
+
+        self.assertEqual(parallel.unique_routes, 1)
+        for want, got_inline, got_pooled in zip(expected, inline, pooled):
+            self.assertIsNone(got_pooled.error)
+            self.assertEqual(got_inline.fuel_stops, want)
+            self.assertEqual(got_pooled.fuel_stops, want)
+        self.assertTrue(any(result.fuel_stops for result in pooled))
+
+    def test_workers_copy_prices_out_and_close_the_block(self):
+        block = shared_memory.SharedMemory(create=True, size=4 * 8)
+        self.addCleanup(block.unlink)
+        self.addCleanup(block.close)
+        np.ndarray((4,), dtype=np.float64, buffer=block.buf)[:] = [3.2, 2.8, 3.4, 3.0]
+
+        attached = []
+        real_shared_memory = shared_memory.SharedMemory
+
+        def attach(name):
+            attached.append(real_shared_memory(name=name))
+            return attached[-1]
+
+        with mock.patch('api.fleet_worker.shared_memory.SharedMemory', side_effect=attach):
+            prices = read_prices(block.name, 4, np.array([3, 1]))
+        self.assertEqual(prices.tolist(), [3.0, 2.8])
+        self.assertIsNone(attached[0].buf)
+
+
+
+@override_settings(
+    OPENROUTESERVICE_API_KEY='test-key',
+    STATION_INDEX_REFRESH_SECONDS=0,
+    PRECOMPUTED_VEHICLE_PROFILES=[(8.0, 60.0)],
+    POPULAR_ROUTE_PAIRS=[('Dallas, TX', 'Austin, TX')]
+)
+class PrecomputedCorridorTests(TestCase):
+    options = {
+        'fuel_efficiency_mpg': 8.0,
+        'tank_range_miles': 60.0,
+        'start_fuel_fraction': 1.0,
+        'reserve_miles': 0.0,
+        'price_as_of': None,
+    }
+
+    header = ImportFuelPricesTests.header
+    run_import = ImportFuelPricesTests.run_import
+
+    def setUp(self):
+        for opis_id, lon, price in [(1, -99.6, '3.20'), (2, -99.2, '2.80'), (3, -98.8, '3.40'), (4, -98.4, '3.00')]:
+            make_station(opis_id, 35.0, lon, price)
+        self.service = self.make_service()
+
+    def make_service(self):
+        service = RouteService()
+        service.calculate_route = lambda start, end, waypoints=None: dict(
+            RouteCacheTests.route,
+            start=dict(DALLAS, display_name=start),
+            end=dict(DALLAS, display_name=end),
+            waypoints=[],
+            distance_miles=113.0,
+            geometry={'type': 'LineString', 'coordinates': StationIndexTests.route}
+        )
+        return service
+
+    def test_pairs_served_from_table_until_prices_change(self):
+        corridor = precompute_corridor(self.service, 'Dallas, TX', 'Austin, TX')
+        route_data = corridor_route_data(corridor)
+        for options in [self.options, dict(self.options, fuel_efficiency_mpg=6.0, tank_range_miles=50.0)]:
+            expected = self.service.find_optimal_fuel_stops(self.service.calculate_route('a', 'b'), **options)
+            self.assertTrue(expected)
+            self.assertEqual(corridor_fuel_stops(self.service, corridor, route_data, options), expected)
+
+        # Neither geocoding nor directions are needed for the pair
+        self.service.calculate_route = mock.Mock(side_effect=AssertionError('routed'))
+        with mock.patch('api.views.RouteService', return_value=self.service):
+            response = self.client.post('/api/calculate_route/', {
+                'start_location': ' dallas ,TX', 'end_location': 'Austin, TX',
+                'fuel_efficiency_mpg': 8, 'tank_range_miles': 60
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['summary']['num_stops'], len(corridor.plans['8:60']))
+
+        self.run_import('2,STATION 2,I-40,Test,OK,1,2.10\n')
+        corridor.refresh_from_db()
+        self.assertTrue(corridor.stale)
+
+        self.assertEqual(refresh_corridors(self.make_service(), [('Dallas, TX', 'Austin, TX')]), (1, []))
+        corridor.refresh_from_db()
+        self.assertFalse(corridor.stale)
+        self.assertIn(2.1, [stop[3] for stop in corridor.plans['8:60']])
+
+    def test_only_configured_pairs_are_looked_up(self):
+        precompute_corridor(self.service, 'Dallas, TX', 'Austin, TX')
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(find_corridor('Dallas, TX', 'Austin, TX'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(find_corridor('Austin, TX', 'Dallas, TX'))
+        with override_settings(POPULAR_ROUTE_PAIRS=[]), self.assertNumQueries(0):
+            self.assertIsNone(find_corridor('Dallas, TX', 'Austin, TX'))
+
+class RouteListingTests(TestCase):
+    def test_json_and_ndjson_listing(self):
+        station = make_station(1, 32.0, -97.0, '3.1')
+        for _ in range(3):
+            save_route(*make_route_data([station]), 10.0, 500.0)
+
+        response = self.client.get('/api/routes/')
+        self.assertEqual(response.json()['count'], 3)
+
+        response = self.client.get('/api/routes/', HTTP_ACCEPT='application/x-ndjson')
+        self.assertTrue(response.streaming)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0]['fuel_stops'][0]['fuel_station']['name'], 'STATION 1')
+
+    def test_geometry_parameter(self):
+        station = make_station(1, 32.0, -97.0, '3.1')
+        route = save_route(*make_route_data([station]), 10.0, 500.0)
+
+        full = self.client.get('/api/routes/?geometry=full').json()['results'][0]
+        simplified = self.client.get('/api/routes/').json()['results'][0]
+        self.assertEqual(full['route_polyline'], route.route_polyline)
+        self.assertEqual(simplified['route_polyline'], route.route_polyline_simplified)
+        self.assertNotIn('route_polyline', self.client.get('/api/routes/?geometry=none').json()['results'][0])
+        self.assertEqual(self.client.get('/api/routes/?geometry=svg').status_code, 400)
+
+        # Only the returned line is loaded
+        self.assertEqual(route_history(geometry='simplified')[0].get_deferred_fields(), {'route_polyline'})
+        for geometry in ('simplified', 'none'):
+            with self.assertNumQueries(2):
+                self.client.get('/api/routes/', {'geometry': geometry})
+
+    def test_cursor_pages_in_constant_queries(self):
+        stations = [make_station(i, 32.0, -97.0, '3.1') for i in range(2)]
+        routes = [save_route(*make_route_data(stations), 10.0, 500.0) for _ in range(5)]
+        Route.objects.filter(pk=routes[0].pk).update(start_location='Austin, TX')
+
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            # The routes page, then its stops joined with their stations
+            with self.assertNumQueries(2):
+                page = self.client.get('/api/routes/', {'limit': 2, 'cursor': cursor}).json()
+            seen += [route['id'] for route in page['results']]
+            self.assertTrue(all(len(route['fuel_stops']) == 2 for route in page['results']))
+            cursor = page['next_cursor']
+        self.assertEqual(seen, [route.pk for route in reversed(routes)])
+
+        page = self.client.get('/api/routes/', {'start_location': 'Austin, TX', 'fields': 'id,total_fuel_cost'}).json()
+        self.assertEqual(page['results'], [{'id': routes[0].pk, 'total_fuel_cost': str(routes[0].total_fuel_cost)}])
+        future = self.client.get('/api/routes/', {'created_after': '2999-01-01T00:00:00Z'}).json()
+        self.assertEqual(future['results'], [])
+
+        for query in [{'cursor': 'nope'}, {'fields': 'id,secret'}, {'limit': 0}]:
+            self.assertEqual(self.client.get('/api/routes/', query).status_code, 400)
+
+
+class PolylineTests(SimpleTestCase):
+    def test_round_trip(self):
+        # Example from the polyline algorithm documentation
+        coords = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+        encoded = encode_polyline(coords)
+        self.assertEqual(encoded, '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(decode_polyline(encoded), coords)
+
+    def test_simplify_keeps_shape_within_tolerance(self):
+        lons = np.linspace(-100.0, -90.0, 10001)
+        coords = np.column_stack([lons, 35.0 + np.where(lons > -95.0, 1.0, 0.0)]).tolist()
+
+        simplified = simplify_line(coords, 100.0)
+        self.assertLess(len(simplified), 10)
+        self.assertEqual(simplified[0], coords[0])
+        self.assertEqual(simplified[-1], coords[-1])
+        self.assertEqual(simplify_line(coords[:2], 100.0), coords[:2])
+
+
+class FakeORSTests(TestCase):
+    """The whole pipeline against the local ORS stand-in"""
+
+    def serve(self, **options):
+        server = FakeORSServer(seed=1, **options).start()
+        self.addCleanup(server.stop)
+        override = override_settings(OPENROUTESERVICE_BASE_URL=server.url)
+        override.enable()
+        self.addCleanup(override.disable)
+        for name in ('geocode', 'directions'):
+            self.addCleanup(get_circuit_breaker(name).reset)
+        return server
+
+    def test_route_end_to_end(self):
+        server = self.serve()
+        payload = {'start_location': 'Oklahoma City, OK', 'end_location': 'Wichita, KS'}
+        response = self.client.post('/api/calculate_route/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertNotIn('degraded', body)
+        self.assertEqual(body['route']['end_location'], 'Wichita, KS, USA')
+        straight = haversine_miles(35.4676, -97.5164, 37.6872, -97.3301)
+        self.assertTrue(straight < body['route']['distance_miles'] < straight * 1.35)
+        self.assertEqual(server.counts, {'geocode': 2, 'directions': 1})
+
+        # Served from the caches the second time
+        self.client.post('/api/calculate_route/', payload, content_type='application/json')
+        self.assertEqual(server.counts, {'geocode': 2, 'directions': 1})
+        self.assertEqual(Route.objects.count(), 2)
+
+        response = self.client.post(
+            '/api/calculate_route/', {'start_location': 'Toronto, ON', 'end_location': 'Wichita, KS'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not within the USA', response.json()['error'])
+
+        # Geometry depends only on the coordinates
+        coordinates = [[-97.5164, 35.4676], [-96.797, 32.7767], [-97.3301, 37.6872]]
+        self.assertEqual(fake_directions(coordinates), fake_directions(coordinates))
+        self.assertEqual(len(fake_directions(coordinates)['features'][0]['properties']['segments']), 2)
+
+    @override_settings(ORS_MAX_RETRIES=0)
+    def test_upstream_errors_degrade_the_route(self):
+        server = self.serve(error_rate=1.0)
+        response = self.client.post(
+            '/api/calculate_route/', {'start_location': 'Tulsa, OK', 'end_location': 'Omaha, NE'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['route']['source'], 'estimate')
+        self.assertEqual(server.counts, {'geocode': 2, 'directions': 1})
 
-# Create your tests here.
@@ -4,4 +4,8 @@ from . import views
 
 urlpatterns = [
     path('calculate_route/', views.calculate_route, name='calculate_route'),
+    path('calculate_route/batch/', views.calculate_routes_batch, name='calculate_routes_batch'),
+    path('calculate_route/async/', views.calculate_route_async, name='calculate_route_async'),
+    path('fleet/plan/', views.plan_fleet, name='plan_fleet'),
+    path('routes/', views.list_routes, name='list_routes'),
 ]
\ No newline at end of file
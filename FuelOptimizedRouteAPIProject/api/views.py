@@ -1,14 +1,101 @@
 import json
-from django.shortcuts import render
-from rest_framework.decorators import api_view
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.conf import settings
+from rest_framework.decorators import api_view, renderer_classes
 from .models import *
 from .serializers import *
-from .services import RouteService
+from .services import AsyncRouteService, RouteService, UpstreamUnavailable
+from .batch import BatchItem, RouteBatch
+from .corridors import corridor_fuel_stops, corridor_route_data, find_corridor, is_popular_pair
+from .fleet import FleetPlanner
+from .history import encode_cursor, route_history
+from .persistence import apersist_route, persist_route, persist_routes, route_totals
+from .renderers import STREAMING_RENDERERS, stream_ndjson, wants_ndjson
+from .optimizer import fuel_on_arrival
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Q
-from django.db import transaction
-from decimal import Decimal
+from itertools import accumulate
+
+
+def _leg_summaries(route_data, fuel_stops_data, options):
+    """Distance, duration and fuel left on arrival for each leg of the route"""
+    points = [route_data['start'], *route_data.get('waypoints', []), route_data['end']]
+    legs = route_data.get('legs') or []
+    fuel_left = fuel_on_arrival(
+        [(stop['distance_from_start'], stop['gallons_to_fill']) for stop in fuel_stops_data],
+        list(accumulate(leg['distance_miles'] for leg in legs)),
+        options['fuel_efficiency_mpg'],
+        options['tank_range_miles'],
+        options['start_fuel_fraction']
+    )
+    return [
+        {
+            'from': points[number].get('display_name', ''),
+            'to': points[number + 1].get('display_name', ''),
+            'distance_miles': round(leg['distance_miles'], 0),
+            'duration_hours': round(leg['duration_seconds'] / 3600, 1),
+            'fuel_on_arrival_gallons': round(gallons, 1)
+        }
+        for number, (leg, gallons) in enumerate(zip(legs, fuel_left))
+    ]
+
+
+def _build_response(route_data, fuel_stops_data, options):
+    """Response body for a calculated route"""
+    total_distance, total_gallons, total_cost = route_totals(
+        route_data, fuel_stops_data, options['fuel_efficiency_mpg']
+    )
+    
+    # Prepare response
+    avg_price = (
+        total_cost / total_gallons 
+        if total_gallons > 0 
+        else 0
+    )
+    
+    fuel_stops_response = []
+    for stop in fuel_stops_data:
+        fuel_stops_response.append({
+            'location': f"{stop['station'].name}, {stop['station'].city}, {stop['station'].state}",
+            'mile_marker': round(stop['distance_from_start'], 0),
+            'price_per_gallon': stop['price_per_gallon']
+        })
+    
+    # Custom response
+    response = {
+        'route': {
+            'distance_miles': round(total_distance, 0),
+            'start_location': route_data['start']['display_name'],
+            'end_location': route_data['end']['display_name'],
+            'duration_hours': round(route_data['duration_seconds'] / 3600, 1)
+        },
+        'fuel_stops': fuel_stops_response,
+        'summary': {
+            'total_fuel_cost': round(total_cost, 2),
+            'total_gallons_needed': round(total_gallons, 1),
+            'num_stops': len(fuel_stops_data),
+            'avg_price_per_gallon': round(avg_price, 2)
+        }
+    }
+    
+    # Multi-stop trips also report each leg
+    if route_data.get('waypoints'):
+        response['route']['waypoints'] = [
+            waypoint.get('display_name', '') for waypoint in route_data['waypoints']
+        ]
+        response['legs'] = _leg_summaries(route_data, fuel_stops_data, options)
+    
+    # Served while ORS was unavailable: say how the route was obtained
+    if route_data.get('degraded'):
+        response['degraded'] = True
+        response['route']['source'] = route_data.get('source', 'ors')
+        response['route']['approximate_locations'] = [
+            point['display_name']
+            for point in (route_data['start'], *route_data.get('waypoints', []), route_data['end'])
+            if point.get('degraded')
+        ]
+    return response
 
 
 @api_view(['POST'])
@@ -23,93 +110,207 @@ def calculate_route(request):
         )
     
     data = serializer.validated_data
-    start_location = data['start_location']
-    end_location = data['end_location']
-    fuel_efficiency_mpg = float(data.get('fuel_efficiency_mpg', Decimal('10.0')))
-    tank_range_miles = float(data.get('tank_range_miles', Decimal('500.0')))
+    options = planning_options(data)
     
     try:
         # Initialize route service
         route_service = RouteService()
         
-        # Step 1: Calculate route
-        route_data = route_service.calculate_route(start_location, end_location)
+        # Popular pairs are answered from the precomputed corridor table
+        corridor = None if data.get('waypoints') else find_corridor(data['start_location'], data['end_location'])
+        if corridor is not None:
+            route_data = corridor_route_data(corridor)
+            fuel_stops_data = corridor_fuel_stops(route_service, corridor, route_data, options)
+        else:
+            # Step 1: Calculate route
+            route_data = route_service.calculate_route(
+                data['start_location'], data['end_location'], data.get('waypoints')
+            )
+            
+            # Step 2: Find optimal fuel stops
+            fuel_stops_data = route_service.find_optimal_fuel_stops(route_data, **options)
         
-        # Step 2: Find optimal fuel stops
-        fuel_stops_data = route_service.find_optimal_fuel_stops(
+        # Step 3: Save (bulk insert, background queue or skipped per
+        # ROUTE_PERSISTENCE_MODE)
+        persist_route(
             route_data,
-            fuel_efficiency_mpg,
-            tank_range_miles
+            fuel_stops_data,
+            options['fuel_efficiency_mpg'],
+            options['tank_range_miles']
         )
         
-        # Step 3: Calculate totals
-        total_distance = Decimal(str(route_data['distance_miles']))
-        total_gallons = total_distance / Decimal(str(fuel_efficiency_mpg))
-        total_cost = sum(stop['cost'] for stop in fuel_stops_data)
+        # Step 4: Prepare response
+        response_data = _build_response(route_data, fuel_stops_data, options)
         
-        # Step 4: Save to database
-        with transaction.atomic():
-            route = Route.objects.create(
-                start_location=route_data['start']['display_name'],
-                end_location=route_data['end']['display_name'],
-                total_distance_miles=total_distance,
-                total_fuel_cost=Decimal(str(total_cost)),
-                total_gallons_needed=total_gallons,
-                fuel_efficiency_mpg=Decimal(str(fuel_efficiency_mpg)),
-                tank_range_miles=Decimal(str(tank_range_miles)),
-                route_polyline=json.dumps(route_data['geometry'])
-            )
-            
-            # Create fuel stops
-            for stop_data in fuel_stops_data:
-                FuelStop.objects.create(
-                    route=route,
-                    fuel_station=stop_data['station'],
-                    stop_order=stop_data['stop_order'],
-                    distance_from_start_miles=Decimal(str(stop_data['distance_from_start'])),
-                    gallons_to_fill=Decimal(str(stop_data['gallons_to_fill'])),
-                    cost_at_stop=Decimal(str(stop_data['cost'])),
-                    latitude=Decimal(str(stop_data['latitude'])),
-                    longitude=Decimal(str(stop_data['longitude']))
-                )
+        return Response(response_data, status=status.HTTP_201_CREATED)
         
-        # Step 5: Prepare response
-        route_serializer = RouteSerializer(route)
         
-        avg_price = (
-            total_cost / float(total_gallons) 
-            if total_gallons > 0 
-            else 0
+    except UpstreamUnavailable as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
         )
-        
-        fuel_stops_response = []
-        for stop in fuel_stops_data:
-            fuel_stops_response.append({
-                'location': f"{stop['station'].name}, {stop['station'].city}, {stop['station'].state}",
-                'mile_marker': round(stop['distance_from_start'], 0),
-                'price_per_gallon': float(stop['station'].retail_price)
-            })
-        
-        # Custom response
-        response_data = {
-            'route': {
-                'distance_miles': round(float(total_distance), 0),
-                'start_location': route_data['start']['display_name'],
-                'end_location': route_data['end']['display_name'],
-                'duration_hours': round(route_data['duration_seconds'] / 3600, 1)
-            },
-            'fuel_stops': fuel_stops_response,
-            'summary': {
-                'total_fuel_cost': round(float(total_cost), 2),
-                'total_gallons_needed': round(float(total_gallons), 1),
-                'num_stops': len(fuel_stops_data),
-                'avg_price_per_gallon': round(avg_price, 2)
-            }
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Internal server error: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@renderer_classes(STREAMING_RENDERERS)
+def list_routes(request):
+    """
+    Route history, newest first, one page at a time
+    
+    GET /api/routes/?limit=20&cursor=...
+    
+    Pages are keyset-paginated: pass the response's next_cursor to get
+    the following page (it is null on the last one). Optional filters:
+    created_after, created_before (ISO datetimes), start_location and
+    end_location (exact match). fields=id,total_fuel_cost,... returns only
+    those fields.
+    
+    route_polyline is an encoded polyline; ?geometry=simplified (default),
+    full or none picks the stored line to return.
+    
+    With ?format=ndjson (or Accept: application/x-ndjson) every matching
+    route from the cursor on is streamed instead, one JSON object per line.
+    """
+    query = RouteHistoryQuerySerializer(data=request.query_params)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    params = query.validated_data
+    fields = params.get('fields')
+    context = {'geometry': params['geometry'], 'fields': fields}
+    routes = route_history(params, params.get('cursor'), fields, params['geometry'])
+    
+    if wants_ndjson(request):
+        return stream_ndjson(
+            RouteSerializer(route, context=context).data for route in routes.iterator(chunk_size=200)
+        )
+    
+    # One extra row tells whether another page follows
+    page = list(routes[:params['limit'] + 1])
+    next_cursor = encode_cursor(page[params['limit'] - 1]) if len(page) > params['limit'] else None
+    serializer = RouteSerializer(page[:params['limit']], many=True, context=context)
+    return Response({
+        'count': len(serializer.data),
+        'next_cursor': next_cursor,
+        'results': serializer.data
+    })
+
+
+def _batch_item_result(position, item, outcome):
+    """Response entry for one planned batch item"""
+    if outcome.error is None:
+        return {
+            'index': position,
+            'status': 'ok',
+            **_build_response(outcome.route_data, outcome.fuel_stops, item.options)
         }
+    if isinstance(outcome.error, ValueError):
+        return {'index': position, 'status': 'error', 'error': str(outcome.error)}
+    return {
+        'index': position,
+        'status': 'error',
+        'error': f'Internal server error: {str(outcome.error)}'
+    }
+
+
+def _batch_summary(total, succeeded, batch):
+    return {
+        'total': total,
+        'succeeded': succeeded,
+        'failed': total - succeeded,
+        'unique_locations': batch.unique_locations,
+        'unique_routes': batch.unique_routes
+    }
+
+
+def _stream_batch(batch, items, item_positions, invalid):
+    """
+    NDJSON body for a batch: each result line as soon as the item is
+    done, then a summary line. Routes are stored in groups on the way.
+    """
+    yield from invalid
+    
+    succeeded = 0
+    pending = []
+    for index, outcome in batch.iter_results(items):
+        item = items[index]
+        yield _batch_item_result(item_positions[index], item, outcome)
         
-        return Response(response_data, status=status.HTTP_201_CREATED)
+        if outcome.error is None:
+            succeeded += 1
+            pending.append((outcome.route_data, outcome.fuel_stops,
+                            item.options['fuel_efficiency_mpg'], item.options['tank_range_miles']))
+        if len(pending) >= settings.ROUTE_PERSISTENCE_BATCH_SIZE:
+            persist_routes(pending)
+            pending = []
+    
+    if pending:
+        persist_routes(pending)
+    yield {'summary': _batch_summary(len(invalid) + len(items), succeeded, batch)}
+
+
+@api_view(['POST'])
+@renderer_classes(STREAMING_RENDERERS)
+def calculate_routes_batch(request):
+    """
+    Calculate many routes in one request
+    
+    POST /api/calculate_route/batch/
+    {"routes": [{"start_location": ..., "end_location": ...}, ...]}
+    
+    Locations and endpoint pairs repeated across the batch are geocoded
+    and routed once. Each item gets its own result or error, in order.
+    With ?format=ndjson (or Accept: application/x-ndjson) results are
+    streamed one per line as they finish, followed by a summary line.
+    """
+    serializer = RouteBatchRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    invalid = []
+    item_positions = []
+    items = []
+    for position, payload in enumerate(serializer.validated_data['routes']):
+        item_serializer = RouteRequestSerializer(data=payload)
+        if not item_serializer.is_valid():
+            invalid.append({'index': position, 'status': 'invalid', 'errors': item_serializer.errors})
+            continue
+        data = item_serializer.validated_data
+        item_positions.append(position)
+        items.append(BatchItem(
+            data['start_location'],
+            data['end_location'],
+            planning_options(data),
+            tuple(data.get('waypoints', ()))
+        ))
+    
+    try:
+        batch = RouteBatch(RouteService())
+        if wants_ndjson(request):
+            return stream_ndjson(_stream_batch(batch, items, item_positions, invalid))
         
+        outcomes = batch.run(items) if items else []
         
+        # Store every successful route together
+        persist_routes([
+            (outcome.route_data, outcome.fuel_stops,
+             item.options['fuel_efficiency_mpg'], item.options['tank_range_miles'])
+            for item, outcome in zip(items, outcomes)
+            if outcome.error is None
+        ])
     except ValueError as e:
         return Response(
             {'error': str(e)},
@@ -120,15 +321,176 @@ def calculate_route(request):
             {'error': f'Internal server error: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+    
+    results = invalid + [
+        _batch_item_result(position, item, outcome)
+        for position, item, outcome in zip(item_positions, items, outcomes)
+    ]
+    results.sort(key=lambda result: result['index'])
+    
+    return Response({
+        'results': results,
+        'summary': _batch_summary(
+            len(results),
+            sum(1 for result in results if result['status'] == 'ok'),
+            batch
+        )
+    })
 
+
+@api_view(['POST'])
+def plan_fleet(request):
     """
-    List all calculated routes
+    Plan fuel stops for a fleet of vehicles
     
-    GET /api/routes/
+    POST /api/fleet/plan/
+    {"vehicles": [{"vehicle_id": ..., "start_location": ..., "end_location": ...,
+                   "fuel_efficiency_mpg": ..., "tank_range_miles": ...}, ...]}
+    
+    Vehicles sharing locations or routes share the geocoding, ORS and
+    corridor work; the per-vehicle solves run on a process pool.
     """
-    routes = Route.objects.all()[:20]  # Limit to 20 most recent
-    serializer = RouteSerializer(routes, many=True)
+    serializer = FleetPlanRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    invalid = []
+    item_positions = []
+    vehicle_ids = []
+    items = []
+    for position, payload in enumerate(serializer.validated_data['vehicles']):
+        vehicle_serializer = FleetVehicleSerializer(data=payload)
+        if not vehicle_serializer.is_valid():
+            invalid.append({
+                'index': position,
+                'vehicle_id': payload.get('vehicle_id'),
+                'status': 'invalid',
+                'errors': vehicle_serializer.errors
+            })
+            continue
+        data = vehicle_serializer.validated_data
+        item_positions.append(position)
+        vehicle_ids.append(data['vehicle_id'])
+        items.append(BatchItem(
+            data['start_location'],
+            data['end_location'],
+            planning_options(data),
+            tuple(data.get('waypoints', ()))
+        ))
+    
+    try:
+        planner = FleetPlanner(RouteService())
+        outcomes = planner.plan(items) if items else []
+        
+        persist_routes([
+            (outcome.route_data, outcome.fuel_stops,
+             item.options['fuel_efficiency_mpg'], item.options['tank_range_miles'])
+            for item, outcome in zip(items, outcomes)
+            if outcome.error is None
+        ])
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Internal server error: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    
+    results = invalid + [
+        {'vehicle_id': vehicle_id, **_batch_item_result(position, item, outcome)}
+        for position, vehicle_id, item, outcome in zip(item_positions, vehicle_ids, items, outcomes)
+    ]
+    results.sort(key=lambda result: result['index'])
+    
+    planned = [result for result in results if result['status'] == 'ok']
     return Response({
-        'count': len(serializer.data),
-        'results': serializer.data
-    })
\ No newline at end of file
+        'results': results,
+        'summary': {
+            **_batch_summary(len(results), len(planned), planner),
+            'total_fuel_cost': round(sum(result['summary']['total_fuel_cost'] for result in planned), 2)
+        }
+    })
+
+
+async def calculate_route_async(request):
+    """
+    Async version of calculate_route for ASGI deployments
+    
+    POST /api/calculate_route/async/
+    
+    Waiting on OpenRouteService does not hold a worker thread; ORM work
+    runs in Django's sync executor.
+    """
+    if request.method != 'POST':
+        return JsonResponse(
+            {'detail': f'Method "{request.method}" not allowed.'},
+            status=status.HTTP_405_METHOD_NOT_ALLOWED
+        )
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse(
+            {'detail': 'JSON parse error'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    serializer = RouteRequestSerializer(data=payload)
+    if not serializer.is_valid():
+        return JsonResponse(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    data = serializer.validated_data
+    options = planning_options(data)
+    
+    try:
+        route_service = AsyncRouteService()
+        corridor = None
+        if not data.get('waypoints') and is_popular_pair(data['start_location'], data['end_location']):
+            corridor = await sync_to_async(find_corridor)(data['start_location'], data['end_location'])
+        if corridor is not None:
+            route_data = corridor_route_data(corridor)
+            fuel_stops_data = await sync_to_async(corridor_fuel_stops)(
+                RouteService(), corridor, route_data, options
+            )
+        else:
+            route_data = await route_service.calculate_route(
+                data['start_location'], data['end_location'], data.get('waypoints')
+            )
+            fuel_stops_data = await route_service.find_optimal_fuel_stops(route_data, **options)
+        await apersist_route(
+            route_data,
+            fuel_stops_data,
+            options['fuel_efficiency_mpg'],
+            options['tank_range_miles']
+        )
+        response_data = _build_response(route_data, fuel_stops_data, options)
+        return JsonResponse(response_data, status=status.HTTP_201_CREATED)
+    
+    except UpstreamUnavailable as e:
+        return JsonResponse(
+            {'error': str(e)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    except ValueError as e:
+        return JsonResponse(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Internal server error: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+# Django 4.2's csrf_exempt is not coroutine-aware, so mark it directly
+calculate_route_async.csrf_exempt = True